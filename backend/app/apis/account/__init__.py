@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Dict, Optional
+from app.auth import AuthorizedUser
+from app.libs import deletion
+from datetime import datetime
+
+router = APIRouter()
+
+class DeletionJob(BaseModel):
+    id: int
+    kind: str
+    status: str
+    # Rows deleted so far, per table
+    progress: Dict[str, int]
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+@router.delete("/account", response_model=DeletionJob, status_code=202)
+async def delete_account(user: AuthorizedUser):
+    """Schedule deletion of all of the user's data
+
+    The data is removed in the background; poll GET /account/deletion for
+    progress. Repeating the request while a deletion is under way returns
+    the same job.
+    """
+    return DeletionJob(**await deletion.enqueue_account(user.sub))
+
+@router.get("/account/deletion", response_model=DeletionJob)
+async def get_account_deletion(user: AuthorizedUser):
+    """Get the status and progress of the user's latest account deletion"""
+    job = await deletion.latest_job(user.sub, "account")
+    if job is None:
+        raise HTTPException(status_code=404, detail="No account deletion requested")
+    return DeletionJob(**job)
@@ -1,10 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from app.auth import AuthorizedUser
-import databutton as db
-import asyncpg
-from datetime import datetime, timedelta
+from datetime import datetime
+import hashlib
+from app.libs.achievements import ACHIEVEMENT_DEFINITIONS, UserAchievementState, get_user_state
+from app.libs import cache
+from app.libs.http_cache import cached_response
 
 router = APIRouter()
 
@@ -15,7 +17,7 @@ class Achievement(BaseModel):
     icon: str
     category: str
     tier: str  # bronze, silver, gold, master
-    requirement_type: str  # completions, streak, favorites, journal_entries
+    requirement_type: str  # completions, activities_tried, weekly_streak, streak, favorites, journal_entries
     requirement_value: int
     is_unlocked: bool
     unlocked_at: Optional[datetime] = None
@@ -27,278 +29,16 @@ class AchievementsResponse(BaseModel):
     total_unlocked: int
     completion_percentage: float
 
-# Define all available achievements
-ACHIEVEMENT_DEFINITIONS = [
-    # Activity Completion Achievements
-    {
-        "id": "first_steps",
-        "title": "First Steps",
-        "description": "Complete your first self-care activity",
-        "icon": "🌱",
-        "category": "Activity",
-        "tier": "bronze",
-        "requirement_type": "completions",
-        "requirement_value": 1
-    },
-    {
-        "id": "getting_started",
-        "title": "Getting Started",
-        "description": "Complete 5 self-care activities",
-        "icon": "🌿",
-        "category": "Activity",
-        "tier": "bronze",
-        "requirement_type": "completions",
-        "requirement_value": 5
-    },
-    {
-        "id": "self_care_explorer",
-        "title": "Self-Care Explorer",
-        "description": "Complete 15 self-care activities",
-        "icon": "🧭",
-        "category": "Activity",
-        "tier": "silver",
-        "requirement_type": "completions",
-        "requirement_value": 15
-    },
-    {
-        "id": "wellness_warrior",
-        "title": "Wellness Warrior",
-        "description": "Complete 30 self-care activities",
-        "icon": "⚔️",
-        "category": "Activity",
-        "tier": "gold",
-        "requirement_type": "completions",
-        "requirement_value": 30
-    },
-    {
-        "id": "mindfulness_master",
-        "title": "Mindfulness Master",
-        "description": "Complete 50 self-care activities",
-        "icon": "🏆",
-        "category": "Activity",
-        "tier": "master",
-        "requirement_type": "completions",
-        "requirement_value": 50
-    },
-    
-    # Activity Variety Achievements
-    {
-        "id": "curious_mind",
-        "title": "Curious Mind",
-        "description": "Try 3 different self-care activities",
-        "icon": "🤔",
-        "category": "Variety",
-        "tier": "bronze",
-        "requirement_type": "activities_tried",
-        "requirement_value": 3
-    },
-    {
-        "id": "variety_seeker",
-        "title": "Variety Seeker",
-        "description": "Try 7 different self-care activities",
-        "icon": "🎯",
-        "category": "Variety",
-        "tier": "silver",
-        "requirement_type": "activities_tried",
-        "requirement_value": 7
-    },
-    {
-        "id": "well_rounded",
-        "title": "Well-Rounded",
-        "description": "Try 12 different self-care activities",
-        "icon": "🌟",
-        "category": "Variety",
-        "tier": "gold",
-        "requirement_type": "activities_tried",
-        "requirement_value": 12
-    },
-    
-    # Streak Achievements
-    {
-        "id": "consistent_carer",
-        "title": "Consistent Carer",
-        "description": "Complete activities 3 days this week",
-        "icon": "📅",
-        "category": "Consistency",
-        "tier": "bronze",
-        "requirement_type": "weekly_streak",
-        "requirement_value": 3
-    },
-    {
-        "id": "weekly_champion",
-        "title": "Weekly Champion",
-        "description": "Complete activities 5 days this week",
-        "icon": "🗓️",
-        "category": "Consistency",
-        "tier": "silver",
-        "requirement_type": "weekly_streak",
-        "requirement_value": 5
-    },
-    {
-        "id": "dedication_master",
-        "title": "Dedication Master",
-        "description": "Complete activities 7 days this week",
-        "icon": "🎖️",
-        "category": "Consistency",
-        "tier": "gold",
-        "requirement_type": "weekly_streak",
-        "requirement_value": 7
-    },
-    
-    # Journal Achievements
-    {
-        "id": "thought_recorder",
-        "title": "Thought Recorder",
-        "description": "Write your first journal entry",
-        "icon": "📝",
-        "category": "Journal",
-        "tier": "bronze",
-        "requirement_type": "journal_entries",
-        "requirement_value": 1
-    },
-    {
-        "id": "reflective_writer",
-        "title": "Reflective Writer",
-        "description": "Write 5 journal entries",
-        "icon": "📖",
-        "category": "Journal",
-        "tier": "silver",
-        "requirement_type": "journal_entries",
-        "requirement_value": 5
-    },
-    {
-        "id": "journaling_guru",
-        "title": "Journaling Guru",
-        "description": "Write 15 journal entries",
-        "icon": "📚",
-        "category": "Journal",
-        "tier": "gold",
-        "requirement_type": "journal_entries",
-        "requirement_value": 15
-    },
-    
-    # Favorite Achievements
-    {
-        "id": "favorite_finder",
-        "title": "Favorite Finder",
-        "description": "Mark 3 activities as favorites",
-        "icon": "❤️",
-        "category": "Engagement",
-        "tier": "bronze",
-        "requirement_type": "favorites",
-        "requirement_value": 3
-    },
-    {
-        "id": "preference_pro",
-        "title": "Preference Pro",
-        "description": "Mark 7 activities as favorites",
-        "icon": "💖",
-        "category": "Engagement",
-        "tier": "silver",
-        "requirement_type": "favorites",
-        "requirement_value": 7
-    }
-]
-
-async def get_user_stats(user_id: str):
-    """Get comprehensive user statistics for achievement calculation"""
-    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-    try:
-        # Get activity completions from user_activity_completions
-        completions_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM user_activity_completions WHERE user_id = $1",
-            user_id
-        )
-        
-        # Get activities tried (unique activities) from user_activity_completions
-        activities_tried = await conn.fetchval(
-            "SELECT COUNT(DISTINCT activity_id) FROM user_activity_completions WHERE user_id = $1",
-            user_id
-        )
-        
-        # Get weekly activity days (this week) from user_activity_completions
-        week_start = datetime.now() - timedelta(days=datetime.now().weekday())
-        weekly_days = await conn.fetchval(
-            """SELECT COUNT(DISTINCT DATE(completed_at)) 
-               FROM user_activity_completions 
-               WHERE user_id = $1 AND completed_at >= $2""",
-            user_id, week_start
-        )
-        
-        # Get journal entries count
-        journal_entries = await conn.fetchval(
-            "SELECT COUNT(*) FROM journal_entries WHERE user_id = $1",
-            user_id
-        )
-        
-        # Get favorites count - check if we have a favorites table or if it's stored in user_activity_progress
-        favorites_count = await conn.fetchval(
-            """SELECT COUNT(*) FROM user_activity_progress 
-               WHERE user_id = $1 AND is_favorite = true""",
-            user_id
-        )
-        
-        return {
-            "completions": completions_count or 0,
-            "activities_tried": activities_tried or 0,
-            "weekly_streak": weekly_days or 0,
-            "journal_entries": journal_entries or 0,
-            "favorites": favorites_count or 0
-        }
-    finally:
-        await conn.close()
-
-async def get_user_achievements(user_id: str):
-    """Get user's unlocked achievements from database"""
-    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-    try:
-        rows = await conn.fetch(
-            "SELECT achievement_id, unlocked_at FROM user_achievements WHERE user_id = $1",
-            user_id
-        )
-        return {row['achievement_id']: row['unlocked_at'] for row in rows}
-    finally:
-        await conn.close()
-
-async def unlock_achievement(user_id: str, achievement_id: str):
-    """Unlock an achievement for a user"""
-    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-    try:
-        await conn.execute(
-            """INSERT INTO user_achievements (user_id, achievement_id, unlocked_at) 
-               VALUES ($1, $2, $3) ON CONFLICT DO NOTHING""",
-            user_id, achievement_id, datetime.now()
-        )
-    finally:
-        await conn.close()
-
-@router.get("/achievements")
-async def get_achievements(user: AuthorizedUser) -> AchievementsResponse:
-    """Get user's achievements with progress and unlock status"""
-    
-    # Get user statistics
-    stats = await get_user_stats(user.sub)
-    
-    # Get user's unlocked achievements
-    unlocked_achievements = await get_user_achievements(user.sub)
-    
+def build_achievements_response(state: UserAchievementState) -> AchievementsResponse:
+    """Build the achievements response from the rule engine's state"""
     achievements = []
-    newly_unlocked = []
     
     for achievement_def in ACHIEVEMENT_DEFINITIONS:
         achievement_id = achievement_def["id"]
         requirement_type = achievement_def["requirement_type"]
         requirement_value = achievement_def["requirement_value"]
         
-        # Calculate progress
-        current_progress = stats.get(requirement_type, 0)
-        is_unlocked = achievement_id in unlocked_achievements
-        
-        # Check if achievement should be unlocked
-        if not is_unlocked and current_progress >= requirement_value:
-            await unlock_achievement(user.sub, achievement_id)
-            is_unlocked = True
-            newly_unlocked.append(achievement_def["title"])
+        current_progress = state.progress(requirement_type)
         
         achievement = Achievement(
             id=achievement_id,
@@ -309,8 +49,8 @@ async def get_achievements(user: AuthorizedUser) -> AchievementsResponse:
             tier=achievement_def["tier"],
             requirement_type=requirement_type,
             requirement_value=requirement_value,
-            is_unlocked=is_unlocked,
-            unlocked_at=unlocked_achievements.get(achievement_id),
+            is_unlocked=achievement_id in state.unlocked,
+            unlocked_at=state.unlocked.get(achievement_id),
             progress=min(current_progress, requirement_value),
             progress_total=requirement_value
         )
@@ -333,3 +73,29 @@ async def get_achievements(user: AuthorizedUser) -> AchievementsResponse:
         completion_percentage=completion_percentage
     )
 
+
+# Serialized responses per user, stamped with the rule engine's state version
+# and the user's local date, since weekly and streak progress roll over at
+# midnight even without a write. The state and its versions are per process,
+# so the responses stay out of the shared tier.
+_response_cache: cache.Cache[Tuple[bytes, str]] = cache.Cache("achievements", shared=False)
+
+async def get_cached_achievements(user_id: str) -> Tuple[bytes, str]:
+    """Get the user's serialized achievements response and its ETag"""
+    # Counters and unlocks are kept current by the rule engine as writes happen
+    state = await get_user_state(user_id)
+    version = (state.version, state.streak.today())
+    
+    async def build() -> Tuple[bytes, str]:
+        body = build_achievements_response(state).model_dump_json().encode()
+        return body, f'"{hashlib.sha1(body).hexdigest()}"'
+    
+    return await _response_cache.get_or_build(user_id, build, version=version)
+
+@router.get("/achievements", responses={200: {"model": AchievementsResponse}})
+async def get_achievements(user: AuthorizedUser, request: Request) -> Response:
+    """Get user's achievements with progress and unlock status"""
+    body, etag = await get_cached_achievements(user.sub)
+    
+    # Clients must revalidate, but an unchanged response costs only a 304
+    return cached_response(request, body, etag, "private, no-cache")
@@ -0,0 +1,152 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
+from app.auth import AuthorizedUser
+from databutton_app.log import get_logger
+from databutton_app.mw.auth_mw import AUTHORIZED_USER_SCOPE_KEY
+import asyncio
+import json
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from urllib.parse import urlsplit
+
+router = APIRouter()
+logger = get_logger(__name__)
+
+MAX_BATCH_SIZE = 20
+# Sub-requests of one batch in flight at once
+BATCH_CONCURRENCY = 4
+ROUTES_PREFIX = "/routes/"
+# Streaming responses cannot be buffered into a batch, and batches do not nest
+EXCLUDED_PATHS = {"/routes/batch", "/routes/send-message"}
+# Sub-request headers passed through to the route; auth comes from the batch
+FORWARDED_HEADERS = {"content-type", "idempotency-key", "if-none-match", "accept-language"}
+# Sub-response headers returned to the client
+RETURNED_HEADERS = {"etag", "cache-control", "content-type", "server-timing"}
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = "GET"
+    # Path as the client would call it, including "/routes/" and any query string
+    path: str
+    body: Optional[Any] = None
+    headers: Dict[str, str] = Field(default_factory=dict)
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+    # Run sub-requests one after another, in order, for batches whose later
+    # requests depend on earlier writes
+    sequential: bool = False
+
+class SubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str]
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    responses: List[SubResponse]
+
+def validate_path(path: str) -> Tuple[str, str]:
+    """Split a sub-request path into path and query string, rejecting disallowed routes"""
+    parts = urlsplit(path)
+    if parts.scheme or parts.netloc or not parts.path.startswith(ROUTES_PREFIX):
+        raise HTTPException(status_code=400, detail=f"Batch paths must start with {ROUTES_PREFIX}: {path}")
+    if parts.path.rstrip("/") in EXCLUDED_PATHS:
+        raise HTTPException(status_code=400, detail=f"Route cannot be batched: {parts.path}")
+    return parts.path, parts.query
+
+async def run_sub_request(request: Request, user, sub: SubRequest) -> Tuple[int, Dict[str, str], bytes]:
+    """Dispatch one sub-request through the app in-process and buffer its response"""
+    path, query = validate_path(sub.path)
+    body = b"" if sub.body is None else json.dumps(jsonable_encoder(sub.body)).encode()
+    headers = {k.lower(): v for k, v in sub.headers.items() if k.lower() in FORWARDED_HEADERS}
+    if body:
+        headers.setdefault("content-type", "application/json")
+    headers["content-length"] = str(len(body))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub.method,
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+        "state": dict(request.scope.get("state") or {}),
+        AUTHORIZED_USER_SCOPE_KEY: user,
+    }
+
+    request_sent = False
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    status = 500
+    response_headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for key, value in message.get("headers", []):
+                key = key.decode("latin-1").lower()
+                if key in RETURNED_HEADERS:
+                    response_headers[key] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await request.app(scope, receive, send)
+    return status, response_headers, b"".join(chunks)
+
+def encode_sub_response(sub: SubRequest, status: int, headers: Dict[str, str], body: bytes) -> bytes:
+    # JSON bodies are spliced in as is instead of being parsed and re-encoded
+    if not body:
+        body_json = b"null"
+    elif headers.get("content-type", "").startswith("application/json"):
+        body_json = body
+    else:
+        body_json = json.dumps(body.decode("utf-8", errors="replace")).encode()
+    head = json.dumps({"id": sub.id, "status": status, "headers": headers})
+    return head[:-1].encode() + b',"body":' + body_json + b"}"
+
+@router.post("/batch", responses={200: {"model": BatchResponse}})
+async def batch(payload: BatchRequest, user: AuthorizedUser, request: Request) -> Response:
+    """Run several API calls in one round trip
+
+    Sub-requests run in-process under the batch's already authenticated user,
+    at most BATCH_CONCURRENCY at a time (or in order when "sequential" is set).
+    Each sub-request gets its own status, so one failure does not fail the batch.
+    """
+    if len(payload.requests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {MAX_BATCH_SIZE} requests")
+    for sub in payload.requests:
+        validate_path(sub.path)
+
+    semaphore = asyncio.Semaphore(1 if payload.sequential else BATCH_CONCURRENCY)
+
+    async def run(sub: SubRequest) -> bytes:
+        async with semaphore:
+            try:
+                status, headers, body = await run_sub_request(request, user, sub)
+            except Exception:
+                logger.exception("Batch sub-request failed", extra={"method": sub.method, "path": sub.path})
+                status, headers = 500, {"content-type": "application/json"}
+                body = json.dumps({"detail": "Internal Server Error"}).encode()
+            return encode_sub_response(sub, status, headers, body)
+
+    # Tasks are created in order, and the semaphore wakes waiters in FIFO
+    # order, so a sequential batch runs exactly in the order given
+    results = await asyncio.gather(*(run(sub) for sub in payload.requests))
+    return Response(
+        content=b'{"responses":[' + b",".join(results) + b"]}",
+        media_type="application/json",
+        headers={"Cache-Control": "private, no-store"},
+    )
@@ -2,17 +2,37 @@ from pydantic import BaseModel
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from app.auth import AuthorizedUser
+from app.libs.repositories import get_repositories
+from databutton_app import metrics
+from databutton_app.log import get_logger
 from openai import OpenAI
 import asyncio
-import asyncpg
+import time
 import databutton as db
 from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # Initialize OpenAI client
 client = OpenAI(api_key=db.secrets.get("OPENAI_API_KEY"))
+CHAT_MODEL = "gpt-4o-mini"
+
+llm_time_to_first_token = metrics.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending a chat completion request to its first content token",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0),
+)
+llm_stream_duration = metrics.histogram(
+    "llm_stream_duration_seconds",
+    "Time from sending a chat completion request to the end of its stream",
+    ["model"],
+    buckets=(0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0),
+)
+llm_tokens = metrics.counter("llm_tokens_total", "Tokens used by chat completions", ["model", "kind"])
+llm_requests = metrics.counter("llm_requests_total", "Chat completion requests by outcome", ["model", "outcome"])
 
 class ChatMessageRequest(BaseModel):
     message: str
@@ -58,50 +78,20 @@ CRISIS_RESOURCES = """
 • Please reach out to emergency services (112) if you're in immediate danger
 """
 
-async def get_db_connection():
-    """Get database connection"""
-    database_url = db.secrets.get("DATABASE_URL_DEV")
-    return await asyncpg.connect(database_url)
-
 async def save_chat_message(user_id: str, message_text: str, message_type: str):
     """Save a chat message to the database"""
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            """
-            INSERT INTO chat_messages (user_id, message_text, message_type)
-            VALUES ($1, $2, $3)
-            """,
-            user_id, message_text, message_type
-        )
-    finally:
-        await conn.close()
+    await get_repositories().chat.save(user_id, message_text, message_type)
 
 async def get_recent_mood_context(user_id: str) -> str:
     """Get user's recent mood data for context"""
-    conn = await get_db_connection()
-    try:
-        # Get the most recent mood entry
-        recent_mood = await conn.fetchrow(
-            """
-            SELECT mood, notes, created_at
-            FROM mood_entries 
-            WHERE user_id = $1 
-            ORDER BY created_at DESC 
-            LIMIT 1
-            """,
-            user_id
-        )
-        
-        if recent_mood:
-            mood_context = f"\n[USER'S RECENT MOOD: {recent_mood['mood']}"
-            if recent_mood['notes']:
-                mood_context += f". Notes: {recent_mood['notes']}"
-            mood_context += f". Logged {recent_mood['created_at'].strftime('%Y-%m-%d')}]\n"
-            return mood_context
-        return ""
-    finally:
-        await conn.close()
+    recent_mood = await get_repositories().moods.latest(user_id)
+    if recent_mood:
+        mood_context = f"\n[USER'S RECENT MOOD: {recent_mood['mood']}"
+        if recent_mood['notes']:
+            mood_context += f". Notes: {recent_mood['notes']}"
+        mood_context += f". Logged {recent_mood['created_at'].strftime('%Y-%m-%d')}]\n"
+        return mood_context
+    return ""
 
 async def get_ai_response_streaming(user_message: str, user_id: str):
     """Get streaming AI response using OpenAI with professional mental health support"""
@@ -126,21 +116,33 @@ async def get_ai_response_streaming(user_message: str, user_id: str):
         ]
         
         # Get streaming response from OpenAI
+        started = time.perf_counter()
         response = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=CHAT_MODEL,
             messages=messages,
             max_tokens=200,
             temperature=0.7,
             top_p=0.9,
-            stream=True
+            stream=True,
+            # The final chunk then carries token usage, with no choices
+            stream_options={"include_usage": True}
         )
         
         full_response = ""
+        first_token = True
         for chunk in response:
-            if chunk.choices[0].delta.content:
+            if chunk.usage:
+                llm_tokens.labels(CHAT_MODEL, "prompt").inc(chunk.usage.prompt_tokens)
+                llm_tokens.labels(CHAT_MODEL, "completion").inc(chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    llm_time_to_first_token.labels(CHAT_MODEL).observe(time.perf_counter() - started)
+                    first_token = False
                 content = chunk.choices[0].delta.content
                 full_response += content
                 yield content
+        llm_stream_duration.labels(CHAT_MODEL).observe(time.perf_counter() - started)
+        llm_requests.labels(CHAT_MODEL, "ok").inc()
         
         # Check for crisis keywords after getting full response
         crisis_keywords = ['suicide', 'kill myself', 'end it all', 'self-harm', 'hurt myself', 'die']
@@ -153,7 +155,8 @@ async def get_ai_response_streaming(user_message: str, user_id: str):
         await save_chat_message(user_id, full_response, "assistant")
         
     except Exception as e:
-        print(f"Error getting AI response: {e}")
+        llm_requests.labels(CHAT_MODEL, "error").inc()
+        logger.error("Error getting AI response", extra={"error": str(e)})
         error_response = "I'm here for you. Would you like to share what's on your mind? I'm listening."
         yield error_response
         await save_chat_message(user_id, error_response, "assistant")
@@ -224,8 +227,8 @@ async def generate_streaming_response(user_message: str, user_id: str):
             # Small delay for natural typing effect
             await asyncio.sleep(0.05)
             
-    except Exception as e:
-        print(f"Error in streaming response: {e}")
+    except Exception:
+        logger.exception("Error in streaming response")
         error_response = "I apologize, but I'm having trouble responding right now. I'm still here to support you though."
         yield error_response
         await save_chat_message(user_id, error_response, "assistant")
@@ -244,57 +247,22 @@ async def send_chat_message(request: ChatMessageRequest, user: AuthorizedUser):
 @router.get("/history")
 async def get_chat_history(user: AuthorizedUser) -> ChatHistoryResponse:
     """Get chat history for the authenticated user"""
-    conn = await get_db_connection()
-    try:
-        rows = await conn.fetch(
-            """
-            SELECT id, message_text, message_type, created_at
-            FROM chat_messages 
-            WHERE user_id = $1 
-            ORDER BY created_at ASC
-            LIMIT 100
-            """,
-            user.sub
+    rows = await get_repositories().chat.history(user.sub, limit=100)
+    
+    messages = [
+        ChatMessage(
+            id=row['id'],
+            message_text=row['message_text'],
+            message_type=row['message_type'],
+            created_at=row['created_at']
         )
-        
-        messages = [
-            ChatMessage(
-                id=row['id'],
-                message_text=row['message_text'],
-                message_type=row['message_type'],
-                created_at=row['created_at']
-            )
-            for row in rows
-        ]
-        
-        return ChatHistoryResponse(messages=messages)
-    finally:
-        await conn.close()
+        for row in rows
+    ]
+    
+    return ChatHistoryResponse(messages=messages)
 
 @router.delete("/history")
 async def clear_chat_history(user: AuthorizedUser):
     """Clear all chat history for the authenticated user"""
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            "DELETE FROM chat_messages WHERE user_id = $1",
-            user.sub
-        )
-        return {"message": "Chat history cleared successfully"}
-    finally:
-        await conn.close()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    await get_repositories().chat.clear(user.sub)
+    return {"message": "Chat history cleared successfully"}
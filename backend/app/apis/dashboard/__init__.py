@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Response
+from app.auth import AuthorizedUser
+from app.apis.achievements import get_cached_achievements
+from app.apis.selfcare import get_cached_user_progress
+from app.libs.fast_json import dumps
+from app.libs.repositories import get_repositories
+from databutton_app.log import get_logger
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+router = APIRouter()
+logger = get_logger(__name__)
+
+async def progress_section(user_id: str) -> bytes:
+    return dumps(await get_cached_user_progress(user_id), utc_z=False)
+
+async def achievements_section(user_id: str) -> bytes:
+    # Already serialized by the achievements cache, so it is embedded as is
+    body, _ = await get_cached_achievements(user_id)
+    return body
+
+async def mood_history_section(user_id: str) -> bytes:
+    return dumps(await get_repositories().moods.history(user_id), utc_z=False)
+
+DASHBOARD_SECTIONS: Dict[str, Callable[[str], Awaitable[bytes]]] = {
+    "progress": progress_section,
+    "achievements": achievements_section,
+    "mood_history": mood_history_section,
+}
+
+async def timed_section(name: str, user_id: str) -> Tuple[Optional[bytes], float, Optional[str]]:
+    """Run one section, returning its body (None on failure), duration in ms and error"""
+    started = time.perf_counter()
+    try:
+        body = await DASHBOARD_SECTIONS[name](user_id)
+        error = None
+    except Exception as e:
+        logger.exception("Dashboard section failed", extra={"section": name, "user_id": user_id})
+        body, error = None, str(e)
+    return body, (time.perf_counter() - started) * 1000, error
+
+@router.get("/dashboard")
+async def get_dashboard(user: AuthorizedUser) -> Response:
+    """Get progress, achievements and mood history in one call
+
+    Sections are fetched concurrently on separate pooled connections. A failed
+    section is returned as null with its message under "errors" instead of
+    failing the whole dashboard. Per-section timings are in "timings_ms" and
+    the Server-Timing header.
+    """
+    started = time.perf_counter()
+    names = list(DASHBOARD_SECTIONS)
+    results = await asyncio.gather(*(timed_section(name, user.sub) for name in names))
+    total_ms = (time.perf_counter() - started) * 1000
+
+    timings = {name: round(ms, 2) for name, (_, ms, _) in zip(names, results)}
+    timings["total"] = round(total_ms, 2)
+    errors = {name: error for name, (_, _, error) in zip(names, results) if error is not None}
+
+    # Sections are spliced in as bytes so cached bodies are not re-encoded
+    parts = [b'"%s":%s' % (name.encode(), body if body is not None else b"null") for name, (body, _, _) in zip(names, results)]
+    parts.append(b'"timings_ms":' + dumps(timings))
+    parts.append(b'"errors":' + dumps(errors))
+    server_timing = ", ".join(f"{name};dur={ms}" for name, ms in timings.items())
+    return Response(
+        content=b"{" + b",".join(parts) + b"}",
+        media_type="application/json",
+        headers={"Server-Timing": server_timing, "Cache-Control": "private, no-store"},
+    )
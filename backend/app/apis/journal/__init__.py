@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import databutton as db
-import asyncpg
 from typing import List, Optional
 from app.auth import AuthorizedUser
+from app.libs.fast_json import json_response
+from app.libs.events import JOURNAL_ENTRY_CREATED, JOURNAL_ENTRY_DELETED, Event, emit
+from app.libs.repositories import get_repositories
 from datetime import datetime
 
 router = APIRouter()
@@ -20,64 +21,29 @@ class JournalEntry(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-async def get_db_conn():
-    try:
-        conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-        yield conn
-    finally:
-        await conn.close()
-
 @router.post("/journal", response_model=JournalEntry)
-async def create_journal_entry(
-    entry: JournalEntryCreate,
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn),
-):
+async def create_journal_entry(entry: JournalEntryCreate, user: AuthorizedUser):
     try:
-        now = datetime.utcnow()
-        created_at = entry.created_at or now
-        result = await conn.fetchrow(
-            """
-            INSERT INTO journal_entries (user_id, content, mood_emoji, created_at, updated_at)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id, content, mood_emoji, created_at, updated_at
-            """,
-            user.sub,
-            entry.content,
-            entry.mood_emoji,
-            created_at,
-            now,
-        )
+        result = await get_repositories().journal.create(user.sub, entry.content, entry.mood_emoji, entry.created_at)
+        await emit(Event(type=JOURNAL_ENTRY_CREATED, user_id=user.sub, payload={"entry_id": result["id"]}))
         return JournalEntry(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/journal", response_model=List[JournalEntry])
-async def get_journal_entries(
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn)
-):
+@router.get("/journal", responses={200: {"model": List[JournalEntry]}})
+async def get_journal_entries(user: AuthorizedUser):
     try:
-        rows = await conn.fetch(
-            "SELECT id, content, mood_emoji, created_at, updated_at FROM journal_entries WHERE user_id = $1 ORDER BY updated_at DESC",
-            user.sub,
-        )
-        return [JournalEntry(**row) for row in rows]
+        rows = await get_repositories().journal.list(user.sub)
+        # Trusted rows in JournalEntry's shape, serialized once without
+        # building and re-validating a model per entry
+        return json_response(rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/journal/{entry_id}", response_model=JournalEntry)
-async def get_journal_entry(
-    entry_id: int,
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn)
-):
+async def get_journal_entry(entry_id: int, user: AuthorizedUser):
     try:
-        row = await conn.fetchrow(
-            "SELECT id, content, mood_emoji, created_at, updated_at FROM journal_entries WHERE id = $1 AND user_id = $2",
-            entry_id,
-            user.sub
-        )
+        row = await get_repositories().journal.get(user.sub, entry_id)
         if not row:
             raise HTTPException(status_code=404, detail="Journal entry not found")
         return JournalEntry(**row)
@@ -88,27 +54,9 @@ async def get_journal_entry(
 
 
 @router.put("/journal/{entry_id}", response_model=JournalEntry)
-async def update_journal_entry(
-    entry_id: int,
-    entry: JournalEntryCreate,
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn),
-):
+async def update_journal_entry(entry_id: int, entry: JournalEntryCreate, user: AuthorizedUser):
     try:
-        now = datetime.utcnow()
-        result = await conn.fetchrow(
-            """
-            UPDATE journal_entries
-            SET content = $1, mood_emoji = $2, updated_at = $3
-            WHERE id = $4 AND user_id = $5
-            RETURNING id, content, mood_emoji, created_at, updated_at
-            """,
-            entry.content,
-            entry.mood_emoji,
-            now,
-            entry_id,
-            user.sub,
-        )
+        result = await get_repositories().journal.update(user.sub, entry_id, entry.content, entry.mood_emoji)
         if not result:
             raise HTTPException(status_code=404, detail="Journal entry not found")
         return JournalEntry(**result)
@@ -119,26 +67,12 @@ async def update_journal_entry(
 
 
 @router.delete("/journal/{entry_id}", status_code=204)
-async def delete_journal_entry(
-    entry_id: int,
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn),
-):
+async def delete_journal_entry(entry_id: int, user: AuthorizedUser):
     try:
-        result = await conn.execute(
-            "DELETE FROM journal_entries WHERE id = $1 AND user_id = $2",
-            entry_id,
-            user.sub
-        )
-        if result == "DELETE 0":
+        if not await get_repositories().journal.delete(user.sub, entry_id):
             raise HTTPException(status_code=404, detail="Journal entry not found")
+        await emit(Event(type=JOURNAL_ENTRY_DELETED, user_id=user.sub, payload={"entry_id": entry_id}))
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
-
-
-
-
-
-
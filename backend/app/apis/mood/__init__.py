@@ -1,10 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import databutton as db
-import asyncpg
 from typing import List, Optional
 from app.auth import AuthorizedUser
-import os
+from app.libs.fast_json import json_response
+from app.libs.repositories import get_repositories
 
 router = APIRouter()
 
@@ -18,26 +17,10 @@ class MoodLog(BaseModel):
     notes: Optional[str] = None
     created_at: str
 
-async def get_db_conn():
-    try:
-        conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-        yield conn
-    finally:
-        await conn.close()
-
 @router.post("/mood", response_model=MoodLog)
-async def log_mood(
-    mood_entry: MoodEntry,
-    user: AuthorizedUser,
-    conn: asyncpg.Connection = Depends(get_db_conn),
-):
+async def log_mood(mood_entry: MoodEntry, user: AuthorizedUser):
     try:
-        result = await conn.fetchrow(
-            "INSERT INTO mood_entries (user_id, mood, notes) VALUES ($1, $2, $3) RETURNING id, mood, notes, created_at",
-            user.sub,
-            mood_entry.mood,
-            mood_entry.notes,
-        )
+        result = await get_repositories().moods.add(user.sub, mood_entry.mood, mood_entry.notes)
         return MoodLog(
             id=result["id"],
             mood=result["mood"],
@@ -47,24 +30,12 @@ async def log_mood(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/mood", response_model=List[MoodLog])
-async def get_mood_history(
-    user: AuthorizedUser, conn: asyncpg.Connection = Depends(get_db_conn)
-):
+@router.get("/mood", responses={200: {"model": List[MoodLog]}})
+async def get_mood_history(user: AuthorizedUser):
     try:
-        rows = await conn.fetch(
-            "SELECT id, mood, notes, created_at FROM mood_entries WHERE user_id = $1 ORDER BY created_at DESC",
-            user.sub,
-        )
-        return [
-            MoodLog(
-                id=row["id"],
-                mood=row["mood"],
-                notes=row["notes"],
-                created_at=row["created_at"].isoformat(),
-            )
-            for row in rows
-        ]
+        rows = await get_repositories().moods.history(user.sub)
+        # Rows already have MoodLog's shape; created_at is written the way
+        # MoodLog's isoformat() string is
+        return json_response(rows, utc_z=False)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
@@ -1,19 +1,19 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request, Response
 from app.auth import AuthorizedUser
-import asyncpg
-import databutton as db
-import json
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from app.libs.catalog import Catalog, CatalogActivity, get_catalog
+from app.libs.http_cache import cached_response, etag_matches
+from app.libs.recommendations import rank_activities
+from app.libs.events import ACCOUNT_DELETED, ACTIVITY_COMPLETED, FAVORITE_TOGGLED, Event, emit, subscribe
+from app.libs import cache
+from app.libs.repositories import get_repositories
+import asyncio
+import hashlib
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
-# Database connection helper
-async def get_db_connection():
-    """Get database connection"""
-    return await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
-
 # Pydantic models
 class SelfCareActivity(BaseModel):
     id: int
@@ -32,6 +32,8 @@ class ActivityCompletion(BaseModel):
     activity_id: int
     rating: Optional[int] = None
     notes: Optional[str] = None
+    # IANA timezone of the client, e.g. "Africa/Lagos", used for daily streaks
+    timezone: Optional[str] = None
 
 class UserProgress(BaseModel):
     activity_id: int
@@ -47,349 +49,270 @@ class RecommendationsResponse(BaseModel):
     activities: List[SelfCareActivity]
     reason: str
 
+def progress_data(progress) -> Optional[Dict[str, Any]]:
+    """Shape a user_activity_progress row as SelfCareActivity.user_progress"""
+    if not progress:
+        return None
+    return {
+        "total_completions": progress['total_completions'],
+        "last_completed_at": progress['last_completed_at'],
+        "is_favorite": progress['is_favorite']
+    }
+
+def to_selfcare_activity(activity: CatalogActivity, progress=None) -> SelfCareActivity:
+    """Combine a catalog entry with the user's progress on it"""
+    return SelfCareActivity(**activity.as_dict(), user_progress=progress_data(progress))
+
+def progress_etag(catalog: Catalog, *parts) -> str:
+    """ETag for a per-user view: the catalog version plus the user's progress rows"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{catalog.version}-{digest}"'
+
+@router.get("/catalog", responses={200: {"model": ActivitiesResponse}})
+async def get_catalog_activities(request: Request) -> Response:
+    """Get the self-care catalog without user data, cacheable by clients and CDNs"""
+    catalog = await get_catalog()
+    return cached_response(request, catalog.body, catalog.etag, "public, max-age=300, stale-while-revalidate=600")
+
 @router.get("/activities")
-async def get_activities(user: AuthorizedUser, category: Optional[str] = None) -> ActivitiesResponse:
+async def get_activities(
+    user: AuthorizedUser,
+    request: Request,
+    response: Response,
+    category: Optional[str] = None
+) -> ActivitiesResponse:
     """Get all self-care activities, optionally filtered by category"""
-    conn = await get_db_connection()
-    try:
-        # Build query with optional category filter
-        if category:
-            activities_query = """
-                SELECT * FROM selfcare_activities 
-                WHERE category = $1 
-                ORDER BY duration_minutes, title
-            """
-            activities = await conn.fetch(activities_query, category)
-        else:
-            activities_query = """
-                SELECT * FROM selfcare_activities 
-                ORDER BY category, duration_minutes, title
-            """
-            activities = await conn.fetch(activities_query)
-        
-        # Get user progress for all activities
-        progress_query = """
-            SELECT activity_id, total_completions, last_completed_at, is_favorite
-            FROM user_activity_progress 
-            WHERE user_id = $1
-        """
-        user_progress = await conn.fetch(progress_query, user.sub)
-        progress_dict = {p['activity_id']: p for p in user_progress}
-        
-        # Convert to response format
-        activity_list = []
-        for activity in activities:
-            progress = progress_dict.get(activity['id'])
-            user_progress_data = None
-            if progress:
-                user_progress_data = {
-                    "total_completions": progress['total_completions'],
-                    "last_completed_at": progress['last_completed_at'],
-                    "is_favorite": progress['is_favorite']
-                }
-            
-            activity_list.append(SelfCareActivity(
-                id=activity['id'],
-                title=activity['title'],
-                description=activity['description'],
-                category=activity['category'],
-                duration_minutes=activity['duration_minutes'],
-                difficulty_level=activity['difficulty_level'],
-                instructions=json.loads(activity['instructions']) if isinstance(activity['instructions'], str) else activity['instructions'],
-                benefits=activity['benefits'],
-                mood_tags=activity['mood_tags'],
-                icon_name=activity['icon_name'],
-                user_progress=user_progress_data
-            ))
-        
-        # Get all categories
-        categories_query = "SELECT DISTINCT category FROM selfcare_activities ORDER BY category"
-        categories_result = await conn.fetch(categories_query)
-        categories = [row['category'] for row in categories_result]
-        
-        return ActivitiesResponse(activities=activity_list, categories=categories)
-        
-    finally:
-        await conn.close()
+    catalog = await get_catalog()
+    activities = catalog.by_category.get(category, ()) if category else catalog.activities
+    
+    user_progress = await get_repositories().activities.progress(user.sub)
+    
+    # The response only changes with the catalog or the user's progress
+    etag = progress_etag(catalog, category, [tuple(p.values()) for p in user_progress])
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    
+    progress_dict = {p['activity_id']: p for p in user_progress}
+    activity_list = [
+        to_selfcare_activity(activity, progress_dict.get(activity.id))
+        for activity in activities
+    ]
+    return ActivitiesResponse(activities=activity_list, categories=list(catalog.categories))
 
 @router.get("/activities/{activity_id}")
 async def get_activity(activity_id: int, user: AuthorizedUser) -> SelfCareActivity:
     """Get a specific self-care activity with user progress"""
-    conn = await get_db_connection()
-    try:
-        # Get activity
-        activity_query = "SELECT * FROM selfcare_activities WHERE id = $1"
-        activity = await conn.fetchrow(activity_query, activity_id)
-        
-        if not activity:
-            raise HTTPException(status_code=404, detail="Activity not found")
-        
-        # Get user progress
-        progress_query = """
-            SELECT total_completions, last_completed_at, is_favorite
-            FROM user_activity_progress 
-            WHERE user_id = $1 AND activity_id = $2
-        """
-        progress = await conn.fetchrow(progress_query, user.sub, activity_id)
-        
-        user_progress_data = None
-        if progress:
-            user_progress_data = {
-                "total_completions": progress['total_completions'],
-                "last_completed_at": progress['last_completed_at'],
-                "is_favorite": progress['is_favorite']
-            }
-        
-        return SelfCareActivity(
-            id=activity['id'],
-            title=activity['title'],
-            description=activity['description'],
-            category=activity['category'],
-            duration_minutes=activity['duration_minutes'],
-            difficulty_level=activity['difficulty_level'],
-            instructions=json.loads(activity['instructions']) if isinstance(activity['instructions'], str) else activity['instructions'],
-            benefits=activity['benefits'],
-            mood_tags=activity['mood_tags'],
-            icon_name=activity['icon_name'],
-            user_progress=user_progress_data
-        )
-        
-    finally:
-        await conn.close()
+    catalog = await get_catalog()
+    activity = catalog.by_id.get(activity_id)
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    
+    progress = await get_repositories().activities.progress_for(user.sub, activity_id)
+    return to_selfcare_activity(activity, progress)
 
 @router.post("/activities/{activity_id}/complete")
-async def complete_activity(activity_id: int, completion: ActivityCompletion, user: AuthorizedUser):
-    """Mark an activity as completed and update user progress"""
-    conn = await get_db_connection()
-    try:
-        # Verify activity exists
-        activity_check = await conn.fetchrow("SELECT id FROM selfcare_activities WHERE id = $1", activity_id)
-        if not activity_check:
-            raise HTTPException(status_code=404, detail="Activity not found")
-        
-        # Record completion
-        completion_query = """
-            INSERT INTO user_activity_completions (user_id, activity_id, rating, notes)
-            VALUES ($1, $2, $3, $4)
-        """
-        await conn.execute(completion_query, user.sub, activity_id, completion.rating, completion.notes)
-        
-        # Update or create progress record
-        progress_query = """
-            INSERT INTO user_activity_progress (user_id, activity_id, total_completions, last_completed_at)
-            VALUES ($1, $2, 1, NOW())
-            ON CONFLICT (user_id, activity_id) 
-            DO UPDATE SET 
-                total_completions = user_activity_progress.total_completions + 1,
-                last_completed_at = NOW(),
-                updated_at = NOW()
-        """
-        await conn.execute(progress_query, user.sub, activity_id)
-        
-        return {"message": "Activity completed successfully", "activity_id": activity_id}
-        
-    finally:
-        await conn.close()
+async def complete_activity(
+    activity_id: int,
+    completion: ActivityCompletion,
+    user: AuthorizedUser,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Mark an activity as completed and return the updated user progress"""
+    catalog = await get_catalog()
+    if activity_id not in catalog.by_id:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    
+    result = await get_repositories().activities.complete(
+        user.sub, activity_id, completion.rating, completion.notes, idempotency_key, completion.timezone
+    )
+    if result.conflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for another activity")
+    if result.recorded:
+        await emit(Event(
+            type=ACTIVITY_COMPLETED,
+            user_id=user.sub,
+            payload={"activity_id": activity_id, "first_completion": result.progress['total_completions'] == 1}
+        ))
+    
+    return {
+        "message": "Activity completed successfully" if result.recorded else "Activity completion already recorded",
+        "activity_id": activity_id,
+        "user_progress": progress_data(result.progress)
+    }
+
+class FavoritesUpdate(BaseModel):
+    activity_ids: List[int]
+    is_favorite: bool = True
+
+class FavoritesUpdateResponse(BaseModel):
+    is_favorite: bool
+    # Activities whose favorite status changed
+    updated: List[int]
 
 @router.post("/activities/{activity_id}/favorite")
 async def toggle_favorite(activity_id: int, user: AuthorizedUser):
     """Toggle favorite status for an activity"""
-    conn = await get_db_connection()
-    try:
-        # Check if progress record exists
-        progress_check = await conn.fetchrow(
-            "SELECT is_favorite FROM user_activity_progress WHERE user_id = $1 AND activity_id = $2",
-            user.sub, activity_id
-        )
-        
-        if progress_check:
-            # Update existing record
-            new_favorite_status = not progress_check['is_favorite']
-            await conn.execute(
-                "UPDATE user_activity_progress SET is_favorite = $3, updated_at = NOW() WHERE user_id = $1 AND activity_id = $2",
-                user.sub, activity_id, new_favorite_status
-            )
-        else:
-            # Create new progress record
-            await conn.execute(
-                "INSERT INTO user_activity_progress (user_id, activity_id, is_favorite) VALUES ($1, $2, TRUE)",
-                user.sub, activity_id
-            )
-            new_favorite_status = True
-        
-        return {"is_favorite": new_favorite_status}
-        
-    finally:
-        await conn.close()
+    catalog = await get_catalog()
+    if activity_id not in catalog.by_id:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    
+    new_favorite_status = await get_repositories().activities.toggle_favorite(user.sub, activity_id)
+    
+    await emit(Event(
+        type=FAVORITE_TOGGLED,
+        user_id=user.sub,
+        payload={"activity_id": activity_id, "is_favorite": new_favorite_status}
+    ))
+    
+    return {"is_favorite": new_favorite_status}
+
+@router.put("/activities/favorites")
+async def set_favorites(update: FavoritesUpdate, user: AuthorizedUser) -> FavoritesUpdateResponse:
+    """Set the favorite status of several activities at once"""
+    catalog = await get_catalog()
+    activity_ids = sorted(set(update.activity_ids))
+    missing = [activity_id for activity_id in activity_ids if activity_id not in catalog.by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Activities not found: {missing}")
+    
+    flipped = await get_repositories().activities.set_favorites(user.sub, activity_ids, update.is_favorite)
+    
+    for activity_id in flipped:
+        await emit(Event(
+            type=FAVORITE_TOGGLED,
+            user_id=user.sub,
+            payload={"activity_id": activity_id, "is_favorite": update.is_favorite}
+        ))
+    
+    return FavoritesUpdateResponse(is_favorite=update.is_favorite, updated=flipped)
 
 @router.get("/recommendations")
 async def get_mood_recommendations(user: AuthorizedUser, mood: Optional[str] = None) -> RecommendationsResponse:
     """Get activity recommendations based on current mood"""
-    conn = await get_db_connection()
-    try:
-        # If no mood provided, try to get recent mood from mood tracking
-        if not mood:
-            mood_query = """
-                SELECT mood FROM mood_entries 
-                WHERE user_id = $1 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """
-            recent_mood = await conn.fetchrow(mood_query, user.sub)
-            if recent_mood:
-                mood = recent_mood['mood']
-        
-        if mood:
-            # Get activities that match the mood
-            activities_query = """
-                SELECT * FROM selfcare_activities 
-                WHERE $1 = ANY(mood_tags)
-                ORDER BY duration_minutes, difficulty_level
-                LIMIT 6
-            """
-            activities = await conn.fetch(activities_query, mood)
-            reason = f"Based on your current mood: {mood}"
-        else:
-            # Fallback to beginner activities if no mood available
-            activities_query = """
-                SELECT * FROM selfcare_activities 
-                WHERE difficulty_level = 'beginner'
-                ORDER BY duration_minutes
-                LIMIT 6
-            """
-            activities = await conn.fetch(activities_query)
-            reason = "Recommended beginner-friendly activities"
-        
-        # Get user progress for recommended activities
-        if activities:
-            activity_ids = [a['id'] for a in activities]
-            progress_query = """
-                SELECT activity_id, total_completions, last_completed_at, is_favorite
-                FROM user_activity_progress 
-                WHERE user_id = $1 AND activity_id = ANY($2)
-            """
-            user_progress = await conn.fetch(progress_query, user.sub, activity_ids)
-            progress_dict = {p['activity_id']: p for p in user_progress}
-        else:
-            progress_dict = {}
-        
-        # Convert to response format
-        activity_list = []
-        for activity in activities:
-            progress = progress_dict.get(activity['id'])
-            user_progress_data = None
-            if progress:
-                user_progress_data = {
-                    "total_completions": progress['total_completions'],
-                    "last_completed_at": progress['last_completed_at'],
-                    "is_favorite": progress['is_favorite']
-                }
-            
-            activity_list.append(SelfCareActivity(
-                id=activity['id'],
-                title=activity['title'],
-                description=activity['description'],
-                category=activity['category'],
-                duration_minutes=activity['duration_minutes'],
-                difficulty_level=activity['difficulty_level'],
-                instructions=json.loads(activity['instructions']) if isinstance(activity['instructions'], str) else activity['instructions'],
-                benefits=activity['benefits'],
-                mood_tags=activity['mood_tags'],
-                icon_name=activity['icon_name'],
-                user_progress=user_progress_data
-            ))
-        
-        return RecommendationsResponse(activities=activity_list, reason=reason)
-        
-    finally:
-        await conn.close()
+    repos = get_repositories()
+    # If no mood provided, try to get recent mood from mood tracking
+    if not mood:
+        recent_mood = await repos.moods.latest(user.sub)
+        if recent_mood:
+            mood = recent_mood['mood']
+    
+    catalog = await get_catalog()
+    if mood:
+        # Activities that match the mood, from the pre-sorted index
+        candidates = catalog.for_mood(mood)
+        reason = f"Based on your current mood: {mood}"
+    else:
+        # Fallback to beginner activities if no mood available
+        candidates = catalog.beginner
+        reason = "Recommended beginner-friendly activities"
+    
+    # The user's history ranks the candidates and overlays their progress
+    history = await repos.activities.history(user.sub) if candidates else []
+    activities = rank_activities(catalog, candidates, history, limit=6)
+    progress_dict = {p['activity_id']: p for p in history}
+    
+    activity_list = [
+        to_selfcare_activity(activity, progress_dict.get(activity.id))
+        for activity in activities
+    ]
+    
+    return RecommendationsResponse(activities=activity_list, reason=reason)
 
-@router.get("/progress")
-async def get_user_progress(user: AuthorizedUser):
-    """Get user's overall self-care progress and statistics"""
-    conn = await get_db_connection()
-    try:
-        # Get completion statistics
-        stats_query = """
-            SELECT 
-                COUNT(DISTINCT activity_id) as activities_tried,
-                COUNT(*) as total_completions,
-                COUNT(CASE WHEN completed_at >= NOW() - INTERVAL '7 days' THEN 1 END) as completions_this_week,
-                COUNT(CASE WHEN completed_at >= NOW() - INTERVAL '1 day' THEN 1 END) as completions_today
-            FROM user_activity_completions 
-            WHERE user_id = $1
-        """
-        stats = await conn.fetchrow(stats_query, user.sub)
-        
-        # Get favorite activities
-        favorites_query = """
-            SELECT sa.*, uap.total_completions, uap.last_completed_at
-            FROM selfcare_activities sa
-            JOIN user_activity_progress uap ON sa.id = uap.activity_id
-            WHERE uap.user_id = $1 AND uap.is_favorite = TRUE
-            ORDER BY uap.total_completions DESC
-        """
-        favorites = await conn.fetch(favorites_query, user.sub)
-        
-        # Get all activities with progress (not just favorites)
-        all_progress_query = """
-            SELECT sa.*, uap.total_completions, uap.last_completed_at, uap.is_favorite
-            FROM selfcare_activities sa
-            JOIN user_activity_progress uap ON sa.id = uap.activity_id
-            WHERE uap.user_id = $1 AND uap.total_completions > 0
-            ORDER BY uap.total_completions DESC, uap.last_completed_at DESC
-        """
-        all_activities_with_progress = await conn.fetch(all_progress_query, user.sub)
-        
-        # Get recent completions
-        recent_query = """
-            SELECT sa.title, sa.category, uac.completed_at, uac.rating
-            FROM user_activity_completions uac
-            JOIN selfcare_activities sa ON uac.activity_id = sa.id
-            WHERE uac.user_id = $1
-            ORDER BY uac.completed_at DESC
-            LIMIT 10
-        """
-        recent_completions = await conn.fetch(recent_query, user.sub)
-        
-        return {
-            "statistics": {
-                "activities_tried": stats['activities_tried'] or 0,
-                "total_completions": stats['total_completions'] or 0,
-                "completions_this_week": stats['completions_this_week'] or 0,
-                "completions_today": stats['completions_today'] or 0
-            },
-            "favorite_activities": [
-                {
-                    "id": fav['id'],
-                    "title": fav['title'],
-                    "category": fav['category'],
-                    "total_completions": fav['total_completions'],
-                    "last_completed_at": fav['last_completed_at']
-                } for fav in favorites
-            ],
-            "all_activities_with_progress": [
-                {
-                    "id": act['id'],
-                    "title": act['title'],
-                    "category": act['category'],
-                    "total_completions": act['total_completions'],
-                    "last_completed_at": act['last_completed_at'],
-                    "is_favorite": act['is_favorite']
-                } for act in all_activities_with_progress
-            ],
-            "recent_completions": [
-                {
-                    "title": comp['title'],
-                    "category": comp['category'],
-                    "completed_at": comp['completed_at'],
-                    "rating": comp['rating']
-                } for comp in recent_completions
-            ]
-        }
-        
-    finally:
-        await conn.close()
+# Assembled /progress responses per user. Entries carry the user's progress
+# tag, which completions and favorite changes invalidate, and expire when a
+# completion ages out of the weekly or daily window. The max age bounds
+# staleness when the writes behind them did not invalidate the tag.
+PROGRESS_CACHE_MAX_AGE = timedelta(minutes=5)
+_progress_cache: cache.Cache[Tuple[Dict[str, Any], datetime]] = cache.Cache(
+    "progress", ttl=PROGRESS_CACHE_MAX_AGE.total_seconds()
+)
+
+def progress_tag(user_id: str) -> str:
+    return f"progress:{user_id}"
 
+@subscribe(ACTIVITY_COMPLETED, FAVORITE_TOGGLED, ACCOUNT_DELETED)
+async def invalidate_user_progress(event: Event):
+    await cache.invalidate(progress_tag(event.user_id))
 
+async def build_user_progress(user_id: str) -> Tuple[Dict[str, Any], datetime]:
+    """Assemble the progress response and the time it stops being exact"""
+    # Independent reads run concurrently on separate pooled connections, and
+    # activity details come from the in-memory catalog instead of a join
+    repos = get_repositories()
+    catalog, totals, window, progress_rows, recent_completions = await asyncio.gather(
+        get_catalog(),
+        repos.stats.get(user_id),
+        repos.activities.window_stats(user_id),
+        repos.activities.engaged_progress(user_id),
+        repos.activities.recent_completions(user_id, limit=10),
+    )
+    
+    progress_rows = [p for p in progress_rows if p['activity_id'] in catalog.by_id]
+    favorites = sorted(
+        (p for p in progress_rows if p['is_favorite']),
+        key=lambda p: p['total_completions'],
+        reverse=True
+    )
+    all_activities_with_progress = sorted(
+        (p for p in progress_rows if p['total_completions'] > 0),
+        key=lambda p: (p['total_completions'], p['last_completed_at'] or datetime.min.replace(tzinfo=timezone.utc)),
+        reverse=True
+    )
+    
+    response = {
+        "statistics": {
+            "activities_tried": totals['activities_tried'],
+            "total_completions": totals['completions'],
+            "completions_this_week": window['completions_this_week'] or 0,
+            "completions_today": window['completions_today'] or 0
+        },
+        "favorite_activities": [
+            {
+                "id": fav['activity_id'],
+                "title": catalog.by_id[fav['activity_id']].title,
+                "category": catalog.by_id[fav['activity_id']].category,
+                "total_completions": fav['total_completions'],
+                "last_completed_at": fav['last_completed_at']
+            } for fav in favorites
+        ],
+        "all_activities_with_progress": [
+            {
+                "id": act['activity_id'],
+                "title": catalog.by_id[act['activity_id']].title,
+                "category": catalog.by_id[act['activity_id']].category,
+                "total_completions": act['total_completions'],
+                "last_completed_at": act['last_completed_at'],
+                "is_favorite": act['is_favorite']
+            } for act in all_activities_with_progress
+        ],
+        "recent_completions": [
+            {
+                "title": catalog.by_id[comp['activity_id']].title,
+                "category": catalog.by_id[comp['activity_id']].category,
+                "completed_at": comp['completed_at'],
+                "rating": comp['rating']
+            } for comp in recent_completions if comp['activity_id'] in catalog.by_id
+        ]
+    }
+    
+    expires_at = datetime.now(timezone.utc) + PROGRESS_CACHE_MAX_AGE
+    if window['window_changes_at'] is not None:
+        expires_at = min(expires_at, window['window_changes_at'])
+    return response, expires_at
 
+async def get_cached_user_progress(user_id: str) -> Dict[str, Any]:
+    """Get the user's progress response, rebuilding it only after it changed"""
+    response, _ = await _progress_cache.get_or_build(
+        user_id,
+        lambda: build_user_progress(user_id),
+        tags=[progress_tag(user_id)],
+        ttl=lambda built: (built[1] - datetime.now(timezone.utc)).total_seconds(),
+    )
+    return response
+
+@router.get("/progress")
+async def get_user_progress(user: AuthorizedUser):
+    """Get user's overall self-care progress and statistics"""
+    return await get_cached_user_progress(user.sub)
@@ -0,0 +1,392 @@
+"""Achievement rule engine driven by write events.
+
+Rules are indexed by ``requirement_type`` and recent users' counters are kept in
+memory, so an event only evaluates the rules it can affect and reading
+achievements is a lookup instead of a rescan of the user's history. Events
+are recorded with the write and applied by a background job (see
+``app.libs.events``), so writes do not wait for rule evaluation, unlocks
+show up a moment after the write and no committed write is ever missed.
+Each applied event is announced with a NOTIFY, and every other process
+drops its copy of that user's state.
+
+Usage:
+
+    from app.libs.achievements import get_user_state
+
+    state = await get_user_state(user.sub)
+    state.progress("completions"), state.unlocked
+"""
+
+import asyncio
+import itertools
+import json
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from app.libs import cache, notifications, streaks
+from app.libs.events import (
+    ACCOUNT_DELETED,
+    ACTIVITY_COMPLETED,
+    FAVORITE_TOGGLED,
+    JOURNAL_ENTRY_CREATED,
+    JOURNAL_ENTRY_DELETED,
+    Event,
+    subscribe,
+    subscribe_durable,
+)
+from app.libs.repositories import get_repositories
+
+# Define all available achievements
+ACHIEVEMENT_DEFINITIONS = [
+    # Activity Completion Achievements
+    {
+        "id": "first_steps",
+        "title": "First Steps",
+        "description": "Complete your first self-care activity",
+        "icon": "🌱",
+        "category": "Activity",
+        "tier": "bronze",
+        "requirement_type": "completions",
+        "requirement_value": 1
+    },
+    {
+        "id": "getting_started",
+        "title": "Getting Started",
+        "description": "Complete 5 self-care activities",
+        "icon": "🌿",
+        "category": "Activity",
+        "tier": "bronze",
+        "requirement_type": "completions",
+        "requirement_value": 5
+    },
+    {
+        "id": "self_care_explorer",
+        "title": "Self-Care Explorer",
+        "description": "Complete 15 self-care activities",
+        "icon": "🧭",
+        "category": "Activity",
+        "tier": "silver",
+        "requirement_type": "completions",
+        "requirement_value": 15
+    },
+    {
+        "id": "wellness_warrior",
+        "title": "Wellness Warrior",
+        "description": "Complete 30 self-care activities",
+        "icon": "⚔️",
+        "category": "Activity",
+        "tier": "gold",
+        "requirement_type": "completions",
+        "requirement_value": 30
+    },
+    {
+        "id": "mindfulness_master",
+        "title": "Mindfulness Master",
+        "description": "Complete 50 self-care activities",
+        "icon": "🏆",
+        "category": "Activity",
+        "tier": "master",
+        "requirement_type": "completions",
+        "requirement_value": 50
+    },
+    
+    # Activity Variety Achievements
+    {
+        "id": "curious_mind",
+        "title": "Curious Mind",
+        "description": "Try 3 different self-care activities",
+        "icon": "🤔",
+        "category": "Variety",
+        "tier": "bronze",
+        "requirement_type": "activities_tried",
+        "requirement_value": 3
+    },
+    {
+        "id": "variety_seeker",
+        "title": "Variety Seeker",
+        "description": "Try 7 different self-care activities",
+        "icon": "🎯",
+        "category": "Variety",
+        "tier": "silver",
+        "requirement_type": "activities_tried",
+        "requirement_value": 7
+    },
+    {
+        "id": "well_rounded",
+        "title": "Well-Rounded",
+        "description": "Try 12 different self-care activities",
+        "icon": "🌟",
+        "category": "Variety",
+        "tier": "gold",
+        "requirement_type": "activities_tried",
+        "requirement_value": 12
+    },
+    
+    # Streak Achievements
+    {
+        "id": "consistent_carer",
+        "title": "Consistent Carer",
+        "description": "Complete activities 3 days this week",
+        "icon": "📅",
+        "category": "Consistency",
+        "tier": "bronze",
+        "requirement_type": "weekly_streak",
+        "requirement_value": 3
+    },
+    {
+        "id": "weekly_champion",
+        "title": "Weekly Champion",
+        "description": "Complete activities 5 days this week",
+        "icon": "🗓️",
+        "category": "Consistency",
+        "tier": "silver",
+        "requirement_type": "weekly_streak",
+        "requirement_value": 5
+    },
+    {
+        "id": "dedication_master",
+        "title": "Dedication Master",
+        "description": "Complete activities 7 days this week",
+        "icon": "🎖️",
+        "category": "Consistency",
+        "tier": "gold",
+        "requirement_type": "weekly_streak",
+        "requirement_value": 7
+    },
+    {
+        "id": "week_in_a_row",
+        "title": "Week in a Row",
+        "description": "Complete activities 7 days in a row",
+        "icon": "🔥",
+        "category": "Consistency",
+        "tier": "silver",
+        "requirement_type": "streak",
+        "requirement_value": 7
+    },
+    {
+        "id": "habit_formed",
+        "title": "Habit Formed",
+        "description": "Complete activities 30 days in a row",
+        "icon": "💎",
+        "category": "Consistency",
+        "tier": "master",
+        "requirement_type": "streak",
+        "requirement_value": 30
+    },
+    
+    # Journal Achievements
+    {
+        "id": "thought_recorder",
+        "title": "Thought Recorder",
+        "description": "Write your first journal entry",
+        "icon": "📝",
+        "category": "Journal",
+        "tier": "bronze",
+        "requirement_type": "journal_entries",
+        "requirement_value": 1
+    },
+    {
+        "id": "reflective_writer",
+        "title": "Reflective Writer",
+        "description": "Write 5 journal entries",
+        "icon": "📖",
+        "category": "Journal",
+        "tier": "silver",
+        "requirement_type": "journal_entries",
+        "requirement_value": 5
+    },
+    {
+        "id": "journaling_guru",
+        "title": "Journaling Guru",
+        "description": "Write 15 journal entries",
+        "icon": "📚",
+        "category": "Journal",
+        "tier": "gold",
+        "requirement_type": "journal_entries",
+        "requirement_value": 15
+    },
+    
+    # Favorite Achievements
+    {
+        "id": "favorite_finder",
+        "title": "Favorite Finder",
+        "description": "Mark 3 activities as favorites",
+        "icon": "❤️",
+        "category": "Engagement",
+        "tier": "bronze",
+        "requirement_type": "favorites",
+        "requirement_value": 3
+    },
+    {
+        "id": "preference_pro",
+        "title": "Preference Pro",
+        "description": "Mark 7 activities as favorites",
+        "icon": "💖",
+        "category": "Engagement",
+        "tier": "silver",
+        "requirement_type": "favorites",
+        "requirement_value": 7
+    }
+]
+
+
+# Rules indexed by the counter they depend on, cheapest threshold first
+RULES_BY_REQUIREMENT: Dict[str, List[dict]] = defaultdict(list)
+for _definition in ACHIEVEMENT_DEFINITIONS:
+    RULES_BY_REQUIREMENT[_definition["requirement_type"]].append(_definition)
+for _rules in RULES_BY_REQUIREMENT.values():
+    _rules.sort(key=lambda d: d["requirement_value"])
+
+# Counters an event can move, and therefore the only rules worth re-evaluating
+EVENT_REQUIREMENTS = {
+    ACTIVITY_COMPLETED: ("completions", "activities_tried", "weekly_streak", "streak"),
+    FAVORITE_TOGGLED: ("favorites",),
+    JOURNAL_ENTRY_CREATED: ("journal_entries",),
+    # Counters only go down, so nothing new can unlock
+    JOURNAL_ENTRY_DELETED: (),
+}
+
+NOTIFY_CHANNEL = "achievements"
+# Tells this process's own announcements apart from other processes'
+_PROCESS_ID = uuid.uuid4().hex
+
+# Process-wide source of version stamps; a reloaded or changed state always
+# gets a version no earlier state had, so cached responses never go stale
+_versions = itertools.count(1)
+
+# In-memory state is reloaded after this long, which bounds staleness only
+# while the notification listener is down; otherwise other workers' changes
+# drop it right away
+STATE_TTL_SECONDS = 300
+# Users whose state a process keeps; the least recently used are dropped
+STATE_MAX_USERS = 10_000
+
+
+@dataclass
+class UserAchievementState:
+    counters: Dict[str, int] = field(default_factory=dict)
+    streak: streaks.DayBitmap = field(default_factory=streaks.DayBitmap)
+    unlocked: Dict[str, datetime] = field(default_factory=dict)
+    version: int = field(default_factory=lambda: next(_versions))
+
+    def progress(self, requirement_type: str) -> int:
+        # Day-based requirements are evaluated in the user's own timezone
+        if requirement_type == "weekly_streak":
+            return self.streak.days_this_week()
+        if requirement_type == "streak":
+            return self.streak.longest_streak()
+        return self.counters.get(requirement_type, 0)
+
+
+# Process-local, since events mutate the states in place; concurrent loads
+# of one user share a single read
+_states: cache.Cache[UserAchievementState] = cache.Cache(
+    "achievements.state", ttl=STATE_TTL_SECONDS, max_entries=STATE_MAX_USERS, shared=False
+)
+
+
+async def get_user_stats(user_id: str):
+    """Get comprehensive user statistics for achievement calculation"""
+    repos = get_repositories()
+    # Lifetime counters are materialized in user_stats, and days with
+    # activity come from the cached day bitmap
+    counters, streak = await asyncio.gather(
+        repos.stats.get(user_id), repos.activities.activity_days(user_id)
+    )
+    
+    return {
+        "completions": counters["completions"],
+        "activities_tried": counters["activities_tried"],
+        "streak": streak,
+        "journal_entries": counters["journal_entries"],
+        "favorites": counters["favorites"]
+    }
+
+async def get_user_achievements(user_id: str):
+    """Get user's unlocked achievements"""
+    return await get_repositories().achievements.unlocked(user_id)
+
+async def unlock_achievement(user_id: str, achievement_id: str):
+    """Unlock an achievement for a user"""
+    await get_repositories().achievements.unlock(user_id, achievement_id, datetime.now(timezone.utc))
+
+async def evaluate_rules(user_id: str, state: UserAchievementState, requirement_types) -> List[dict]:
+    """Unlock every rule of the given requirement types the user now satisfies"""
+    newly_unlocked = []
+    for requirement_type in requirement_types:
+        current_progress = state.progress(requirement_type)
+        for rule in RULES_BY_REQUIREMENT.get(requirement_type, ()):
+            if rule["requirement_value"] > current_progress:
+                # Rules are sorted by threshold, so no later rule can match
+                break
+            if rule["id"] in state.unlocked:
+                continue
+            await unlock_achievement(user_id, rule["id"])
+            state.unlocked[rule["id"]] = datetime.now(timezone.utc)
+            newly_unlocked.append(rule)
+    return newly_unlocked
+
+def _counters(stats) -> Dict[str, int]:
+    return {key: stats[key] for key in ("completions", "activities_tried", "journal_entries", "favorites")}
+
+async def _load_user_state(user_id: str) -> tuple[UserAchievementState, bool]:
+    """Return the user's state and whether it was freshly read from the database"""
+    fresh = False
+
+    async def load() -> UserAchievementState:
+        nonlocal fresh
+        stats, unlocked = await asyncio.gather(
+            get_user_stats(user_id), get_user_achievements(user_id)
+        )
+        state = UserAchievementState(counters=_counters(stats), streak=stats["streak"], unlocked=unlocked)
+        # Catch up on anything earned before this state was loaded
+        await evaluate_rules(user_id, state, RULES_BY_REQUIREMENT.keys())
+        fresh = True
+        return state
+
+    state = await _states.get_or_build(user_id, load)
+    return state, fresh
+
+async def get_user_state(user_id: str) -> UserAchievementState:
+    """Get the user's achievement counters and unlocks"""
+    state, _ = await _load_user_state(user_id)
+    return state
+
+@subscribe_durable(ACTIVITY_COMPLETED, FAVORITE_TOGGLED, JOURNAL_ENTRY_CREATED, JOURNAL_ENTRY_DELETED)
+async def apply_event(event: Event):
+    """Bring the user's counters up to date and evaluate only the affected rules"""
+    state, fresh = await _load_user_state(event.user_id)
+
+    # The write behind the event moved user_stats in the same transaction, and
+    # a state loaded since then already counts it, so the counters are read
+    # back rather than adding the event to them; a retry reads the same row
+    if not fresh:
+        if event.type == ACTIVITY_COMPLETED:
+            # The day may have been marked by another process
+            streaks.forget(event.user_id)
+        stats = await get_user_stats(event.user_id)
+        state.counters.update(_counters(stats))
+        state.streak = stats["streak"]
+
+    await evaluate_rules(event.user_id, state, EVENT_REQUIREMENTS[event.type])
+    state.version = next(_versions)
+    await _announce(event.user_id)
+
+async def _announce(user_id: str):
+    """Make every other process drop its copy of the user's state"""
+    await notifications.notify(NOTIFY_CHANNEL, json.dumps({"user_id": user_id, "process": _PROCESS_ID}))
+
+def _on_notify(payload: str):
+    message = json.loads(payload)
+    if message["process"] != _PROCESS_ID:
+        _states.discard(message["user_id"])
+
+notifications.listen(NOTIFY_CHANNEL, _on_notify, on_reconnect=_states.clear)
+
+@subscribe(ACCOUNT_DELETED)
+async def forget_user_state(event: Event):
+    """Drop a deleted account's counters and unlocks from memory"""
+    _states.discard(event.user_id)
@@ -0,0 +1,370 @@
+"""Two-tier cache: an in-process LRU in front of an optional shared tier.
+
+Every ``Cache`` keeps an LRU of entries with a TTL in the process. With
+``CACHE_URL`` pointing at a Redis-protocol server, entries are also written
+there, so a process that misses locally takes what another process built;
+local copies then live at most ``CACHE_LOCAL_TTL_SECONDS``. Without it each
+process caches on its own, and a shared tier that fails is skipped, never
+failing the lookup.
+
+Entries can be stamped with a ``version``, and a lookup with a different
+version is a miss, so writers only need to move the version forward. They
+can also carry tags: ``invalidate(tag)`` gives the tag a new token, and no
+entry built under the old one matches anymore. This process sees that at
+once; other processes when their local copy expires.
+
+Concurrent misses for a key share one build in a process. Across processes,
+the first to take a short lock in the shared tier builds while the others
+wait up to ``STAMPEDE_WAIT_SECONDS`` for its result.
+
+Lookups are counted as ``cache_lookups_total`` per cache, tier and result,
+and ``report()`` sums them up with hit rates.
+
+Usage:
+
+    from app.libs import cache
+
+    progress = cache.Cache("progress", ttl=300)
+
+    response = await progress.get_or_build(user.sub, lambda: build(user.sub), tags=[f"progress:{user.sub}"])
+    await cache.invalidate(f"progress:{user.sub}")
+"""
+
+import asyncio
+import os
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar, Union
+
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    redis = None
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+CACHE_URL = os.environ.get("CACHE_URL")
+LOCAL_TTL_SECONDS = float(os.environ.get("CACHE_LOCAL_TTL_SECONDS", "5"))
+# Upper bound on any entry's TTL; tag tokens are kept for twice as long, so
+# an entry never outlives the token it was built under
+MAX_TTL_SECONDS = 86400.0
+SHARED_TIMEOUT_SECONDS = 0.25
+STAMPEDE_LOCK_SECONDS = 10.0
+STAMPEDE_WAIT_SECONDS = 1.0
+STAMPEDE_POLL_SECONDS = 0.02
+KEY_PREFIX = "cache:"
+# Part of every shared key; bump it when what is pickled there changes shape
+FORMAT_VERSION = 1
+
+lookups = metrics.counter("cache_lookups_total", "Cache lookups by tier and result", ["cache", "tier", "result"])
+build_duration = metrics.histogram(
+    "cache_build_seconds",
+    "Time spent building values after a miss",
+    ["cache"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+shared_errors = metrics.counter("cache_shared_errors_total", "Shared tier calls that failed", ["cache"])
+
+Builder = Callable[[], Awaitable[T]]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    version: Any
+    # Tokens of the entry's tags when it was built
+    tokens: Tuple[str, ...]
+    expires_at: float
+
+
+class _Missing:
+    pass
+
+
+MISSING = _Missing()
+
+
+class RedisTier:
+    """The shared tier, on a Redis-protocol server"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("CACHE_URL is set but the redis package is not installed")
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=SHARED_TIMEOUT_SECONDS,
+            socket_connect_timeout=SHARED_TIMEOUT_SECONDS,
+            # RESP2 is what every Redis-protocol server speaks
+            protocol=2,
+        )
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self._client.mget(keys)
+
+    async def set(self, key: str, value: bytes, ttl: float, only_if_absent: bool = False) -> bool:
+        return bool(await self._client.set(key, value, px=max(int(ttl * 1000), 1), nx=only_if_absent))
+
+    async def delete(self, *keys: str):
+        await self._client.delete(*keys)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_shared: Optional[RedisTier] = None
+_caches: Dict[str, "Cache"] = {}
+# Current token per tag, oldest first; a tag never invalidated has ""
+_tags: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+
+def shared_tier() -> Optional[RedisTier]:
+    """The shared tier for CACHE_URL, created on first use; None without one"""
+    global _shared
+    if _shared is None and CACHE_URL:
+        _shared = RedisTier(CACHE_URL)
+    return _shared
+
+
+def _tag_key(tag: str) -> str:
+    return f"{KEY_PREFIX}tag:{tag}"
+
+
+def _local_tokens(tags: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(_tags[tag][0] if tag in _tags else "" for tag in tags)
+
+
+def _set_local_token(tag: str, token: str):
+    now = time.monotonic()
+    _tags[tag] = (token, now)
+    _tags.move_to_end(tag)
+    # Every entry built before the oldest tokens has expired by now
+    while _tags:
+        _, set_at = next(iter(_tags.values()))
+        if now - set_at < 2 * MAX_TTL_SECONDS:
+            break
+        _tags.popitem(last=False)
+
+
+async def invalidate(*tags: str):
+    """Make every entry carrying one of the tags a miss, here and in the shared tier"""
+    token = uuid.uuid4().hex
+    for tag in tags:
+        _set_local_token(tag, token)
+    shared = shared_tier()
+    if shared is None:
+        return
+    try:
+        for tag in tags:
+            await shared.set(_tag_key(tag), token.encode(), 2 * MAX_TTL_SECONDS)
+    except Exception as e:
+        shared_errors.labels("tags").inc()
+        logger.warning("Could not invalidate shared cache tags", extra={"tags": list(tags), "error": repr(e)})
+
+
+class Cache(Generic[T]):
+    """One named cache: an LRU of up to ``max_entries`` in front of the shared tier"""
+
+    def __init__(self, name: str, ttl: float = 300.0, max_entries: int = 10_000, shared: bool = True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # False keeps values in this process only, e.g. when they are built
+        # from per-process state
+        self.shared = shared
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._building: Dict[Tuple[Hashable, Any], asyncio.Task] = {}
+        self._lookups = {
+            (tier, result): lookups.labels(name, tier, result)
+            for tier in ("local", "shared")
+            for result in ("hit", "miss")
+        }
+        self._build_duration = build_duration.labels(name)
+        _caches[name] = self
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        build: Builder[T],
+        *,
+        version: Any = None,
+        tags: Iterable[str] = (),
+        ttl: Union[None, float, Callable[[T], float]] = None,
+    ) -> T:
+        """The cached value for the key, or ``build()``'s result, cached.
+
+        ``ttl`` defaults to the cache's and may be a function of the built
+        value; a TTL of zero or less returns the value without caching it.
+        """
+        tags = tuple(tags)
+        entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry.expires_at > time.monotonic()
+            and entry.version == version
+            and entry.tokens == _local_tokens(tags)
+        ):
+            self._entries.move_to_end(key)
+            self._lookups["local", "hit"].inc()
+            return entry.value
+        self._lookups["local", "miss"].inc()
+
+        flight = (key, version)
+        task = self._building.get(flight)
+        if task is None:
+            task = asyncio.create_task(self._load(key, build, version, tags, ttl))
+            self._building[flight] = task
+            task.add_done_callback(lambda task: self._landed(flight, task))
+        # Shielded, so one caller giving up does not cancel the others' build
+        return await asyncio.shield(task)
+
+    def clear(self):
+        """Drop this process's entries"""
+        self._entries.clear()
+
+    def discard(self, key: Hashable):
+        """Drop this process's entry for the key, if any"""
+        self._entries.pop(key, None)
+
+    def _landed(self, flight: Tuple[Hashable, Any], task: asyncio.Task):
+        if self._building.get(flight) is task:
+            del self._building[flight]
+        if not task.cancelled():
+            # Marks a failure as seen even if every caller gave up on it
+            task.exception()
+
+    async def _load(self, key: Hashable, build: Builder[T], version: Any, tags: Tuple[str, ...], ttl) -> T:
+        shared = shared_tier() if self.shared else None
+        if shared is None:
+            tokens = _local_tokens(tags)
+            value = await self._build(build)
+            self._store(key, value, version, tokens, self._ttl(ttl, value))
+            return value
+
+        storage_key = f"{KEY_PREFIX}{self.name}:{FORMAT_VERSION}:{key}"
+        lock_key = f"{storage_key}:lock"
+        found, tokens = await self._read_shared(shared, storage_key, version, tags)
+        locked = False
+        if found is MISSING:
+            locked = await self._lock(shared, lock_key)
+            # Otherwise another process is building it; take its result if it is quick
+            deadline = time.monotonic() + STAMPEDE_WAIT_SECONDS
+            while not locked and found is MISSING and time.monotonic() < deadline:
+                await asyncio.sleep(STAMPEDE_POLL_SECONDS)
+                found, tokens = await self._read_shared(shared, storage_key, version, tags)
+        if found is not MISSING:
+            self._lookups["shared", "hit"].inc()
+            self._store(key, found, version, tokens, LOCAL_TTL_SECONDS)
+            return found
+        self._lookups["shared", "miss"].inc()
+
+        try:
+            value = await self._build(build)
+            seconds = self._ttl(ttl, value)
+            if seconds > 0:
+                await self._call(shared.set(storage_key, pickle.dumps((version, tokens, value)), seconds))
+        finally:
+            if locked:
+                await self._call(shared.delete(lock_key))
+        self._store(key, value, version, tokens, min(seconds, LOCAL_TTL_SECONDS))
+        return value
+
+    async def _build(self, build: Builder[T]) -> T:
+        started = time.perf_counter()
+        value = await build()
+        self._build_duration.observe(time.perf_counter() - started)
+        return value
+
+    def _ttl(self, ttl, value: T) -> float:
+        if ttl is None:
+            ttl = self.ttl
+        elif callable(ttl):
+            ttl = ttl(value)
+        return min(ttl, MAX_TTL_SECONDS)
+
+    def _store(self, key: Hashable, value: T, version: Any, tokens: Tuple[str, ...], ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = _Entry(value=value, version=version, tokens=tokens, expires_at=time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _read_shared(
+        self, shared: RedisTier, storage_key: str, version: Any, tags: Tuple[str, ...]
+    ) -> Tuple[Any, Tuple[str, ...]]:
+        """The shared entry if it is current, and the tags' current tokens"""
+        try:
+            blob, *tag_tokens = await shared.get_many([storage_key, *map(_tag_key, tags)])
+        except Exception as e:
+            self._shared_failed(e)
+            return MISSING, _local_tokens(tags)
+
+        tokens = tuple(token.decode() if token is not None else "" for token in tag_tokens)
+        # Learn invalidations made by other processes
+        for tag, token in zip(tags, tokens):
+            if _local_tokens((tag,))[0] != token:
+                _set_local_token(tag, token)
+        if blob is None:
+            return MISSING, tokens
+        try:
+            stored_version, stored_tokens, value = pickle.loads(blob)
+        except Exception:
+            return MISSING, tokens
+        if stored_version != version or stored_tokens != tokens:
+            return MISSING, tokens
+        return value, tokens
+
+    async def _lock(self, shared: RedisTier, lock_key: str) -> bool:
+        """Whether this process should build the value; False if another already is"""
+        try:
+            return await shared.set(lock_key, b"1", STAMPEDE_LOCK_SECONDS, only_if_absent=True)
+        except Exception as e:
+            self._shared_failed(e)
+            return True
+
+    async def _call(self, call: Awaitable[Any]):
+        try:
+            await call
+        except Exception as e:
+            self._shared_failed(e)
+
+    def _shared_failed(self, error: Exception):
+        shared_errors.labels(self.name).inc()
+        logger.warning("Shared cache call failed", extra={"cache": self.name, "error": repr(error)})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def report() -> List[dict]:
+    """Lookups, hits per tier, builds and hit rate per cache"""
+    rows = []
+    for name, cache in sorted(_caches.items()):
+        counts = {(tier, result): int(child.value) for (tier, result), child in cache._lookups.items()}
+        lookups_total = counts["local", "hit"] + counts["local", "miss"]
+        hits = counts["local", "hit"] + counts["shared", "hit"]
+        rows.append({
+            "cache": name,
+            "lookups": lookups_total,
+            "local_hits": counts["local", "hit"],
+            "shared_hits": counts["shared", "hit"],
+            "builds": cache._build_duration.count,
+            "hit_rate": round(hits / lookups_total, 4) if lookups_total else 0.0,
+        })
+    return rows
+
+
+async def close():
+    """Close the shared tier's connections; called on application shutdown"""
+    global _shared
+    if _shared is not None:
+        shared, _shared = _shared, None
+        await shared.close()
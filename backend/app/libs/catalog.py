@@ -0,0 +1,260 @@
+"""In-memory, pre-parsed copy of the ``selfcare_activities`` catalog.
+
+The catalog is static content, so it is loaded once into immutable structures
+indexed by id and by category and shared by every request. It is reloaded
+when the catalog version changes: a statement trigger on the table bumps
+``selfcare_catalog_meta.version`` and sends a NOTIFY, which every process
+listens for. A cheap version check every ``VERSION_CHECK_SECONDS`` covers a
+dropped listener connection.
+
+Usage:
+
+    from app.libs.catalog import get_catalog
+
+    catalog = await get_catalog()
+    catalog.by_id[activity_id], catalog.by_category["Breathing"], catalog.etag
+    catalog.for_mood("Anxiety")  # same activities as catalog.for_mood("anxious")
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import asyncpg
+
+from app.libs import notifications
+from app.libs.database import connection
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+NOTIFY_CHANNEL = "selfcare_catalog"
+VERSION_CHECK_SECONDS = 30
+
+# Spellings and related words that mean the same mood, mapped to one canonical
+# tag. Mood logs from the tracker store the 1-5 scale, so those map too.
+MOOD_SYNONYMS = {
+    "anxiety": "anxious",
+    "worried": "anxious",
+    "worry": "anxious",
+    "nervous": "anxious",
+    "panic": "anxious",
+    "panicked": "anxious",
+    "stress": "stressed",
+    "overwhelmed": "stressed",
+    "pressure": "stressed",
+    "sadness": "sad",
+    "down": "sad",
+    "depressed": "sad",
+    "unhappy": "sad",
+    "low": "sad",
+    "anger": "angry",
+    "mad": "angry",
+    "frustrated": "angry",
+    "frustration": "angry",
+    "irritated": "angry",
+    "tiredness": "tired",
+    "exhausted": "tired",
+    "fatigue": "tired",
+    "fatigued": "tired",
+    "sleepy": "tired",
+    "lonely": "lonely",
+    "loneliness": "lonely",
+    "isolated": "lonely",
+    "alone": "lonely",
+    "okay": "neutral",
+    "ok": "neutral",
+    "meh": "neutral",
+    "good": "happy",
+    "great": "happy",
+    "happiness": "happy",
+    "joyful": "happy",
+    "joy": "happy",
+    "1": "sad",
+    "2": "sad",
+    "3": "neutral",
+    "4": "happy",
+    "5": "happy",
+}
+
+_TAG_SEPARATORS = re.compile(r"[\s_\-]+")
+
+
+def normalize_mood(tag: str) -> str:
+    """Canonical form of a mood tag: lowercased, trimmed and synonym-resolved"""
+    tag = _TAG_SEPARATORS.sub(" ", tag.strip().lower())
+    return MOOD_SYNONYMS.get(tag, tag)
+
+
+@dataclass(frozen=True)
+class CatalogActivity:
+    id: int
+    title: str
+    description: str
+    category: str
+    duration_minutes: int
+    difficulty_level: str
+    instructions: Tuple[str, ...]
+    benefits: Tuple[str, ...]
+    mood_tags: Tuple[str, ...]
+    icon_name: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "category": self.category,
+            "duration_minutes": self.duration_minutes,
+            "difficulty_level": self.difficulty_level,
+            "instructions": list(self.instructions),
+            "benefits": list(self.benefits),
+            "mood_tags": list(self.mood_tags),
+            "icon_name": self.icon_name,
+        }
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: int
+    etag: str
+    # Ordered by category, duration_minutes, title
+    activities: Tuple[CatalogActivity, ...]
+    by_id: Mapping[int, CatalogActivity]
+    # Each category ordered by duration_minutes, title
+    by_category: Mapping[str, Tuple[CatalogActivity, ...]]
+    categories: Tuple[str, ...]
+    # Inverted index of normalized mood tag -> activities, each ordered by
+    # duration_minutes, difficulty_level
+    by_mood: Mapping[str, Tuple[CatalogActivity, ...]]
+    # Beginner activities ordered by duration_minutes
+    beginner: Tuple[CatalogActivity, ...]
+    # Serialized {"activities": [...], "categories": [...]} without user data
+    body: bytes
+
+    def for_mood(self, mood: str) -> Tuple[CatalogActivity, ...]:
+        """Activities tagged with the mood or one of its synonyms"""
+        return self.by_mood.get(normalize_mood(mood), ())
+
+
+def _parse_activity(row: asyncpg.Record) -> CatalogActivity:
+    instructions = row['instructions']
+    if isinstance(instructions, str):
+        instructions = json.loads(instructions)
+    return CatalogActivity(
+        id=row['id'],
+        title=row['title'],
+        description=row['description'],
+        category=row['category'],
+        duration_minutes=row['duration_minutes'],
+        difficulty_level=row['difficulty_level'],
+        instructions=tuple(instructions or ()),
+        benefits=tuple(row['benefits'] or ()),
+        mood_tags=tuple(row['mood_tags'] or ()),
+        icon_name=row['icon_name'],
+    )
+
+
+def build_catalog(version: int, rows) -> Catalog:
+    """Build the immutable, indexed catalog from selfcare_activities rows"""
+    activities = tuple(sorted(
+        (_parse_activity(row) for row in rows),
+        key=lambda a: (a.category, a.duration_minutes, a.title),
+    ))
+    by_category: Dict[str, list] = {}
+    by_mood: Dict[str, list] = {}
+    for activity in activities:
+        by_category.setdefault(activity.category, []).append(activity)
+        for tag in {normalize_mood(t) for t in activity.mood_tags}:
+            by_mood.setdefault(tag, []).append(activity)
+
+    categories = tuple(sorted(by_category))
+    body = json.dumps(
+        {"activities": [a.as_dict() for a in activities], "categories": list(categories)},
+        ensure_ascii=False,
+    ).encode()
+    return Catalog(
+        version=version,
+        etag=f'"catalog-{hashlib.sha1(body).hexdigest()}"',
+        activities=activities,
+        by_id=MappingProxyType({a.id: a for a in activities}),
+        by_category=MappingProxyType({
+            category: tuple(sorted(items, key=lambda a: (a.duration_minutes, a.title)))
+            for category, items in by_category.items()
+        }),
+        categories=categories,
+        by_mood=MappingProxyType({
+            tag: tuple(sorted(items, key=lambda a: (a.duration_minutes, a.difficulty_level)))
+            for tag, items in by_mood.items()
+        }),
+        beginner=tuple(sorted(
+            (a for a in activities if a.difficulty_level == 'beginner'),
+            key=lambda a: a.duration_minutes,
+        )),
+        body=body,
+    )
+
+
+_catalog: Optional[Catalog] = None
+_checked_at = 0.0
+_stale = True
+_lock = asyncio.Lock()
+# Set by use_catalog; the database is then never read
+_pinned = False
+
+
+def _on_notify(payload: str):
+    global _stale
+    _stale = True
+
+
+async def _load(conn: asyncpg.Connection) -> Catalog:
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        version = await conn.fetchval("SELECT version FROM selfcare_catalog_meta")
+        rows = await conn.fetch("SELECT * FROM selfcare_activities")
+    return build_catalog(version, rows)
+
+
+async def get_catalog() -> Catalog:
+    """Get the current catalog, reloading it only when its version changed"""
+    global _catalog, _checked_at, _stale
+    catalog = _catalog
+    if _pinned or (catalog is not None and not _stale and time.monotonic() - _checked_at < VERSION_CHECK_SECONDS):
+        return catalog
+
+    async with _lock:
+        if _catalog is not None and not _stale and time.monotonic() - _checked_at < VERSION_CHECK_SECONDS:
+            return _catalog
+
+        async with connection() as conn:
+            _stale = False
+            if _catalog is not None:
+                version = await conn.fetchval("SELECT version FROM selfcare_catalog_meta")
+                if version == _catalog.version:
+                    _checked_at = time.monotonic()
+                    return _catalog
+            _catalog = await _load(conn)
+            _checked_at = time.monotonic()
+            logger.info("Loaded self-care catalog", extra={"version": _catalog.version, "activities": len(_catalog.activities)})
+        return _catalog
+
+
+def use_catalog(catalog: Catalog):
+    """Serve this catalog from now on instead of reading ``selfcare_activities``"""
+    global _catalog, _pinned
+    _catalog, _pinned = catalog, True
+
+
+def invalidate_catalog():
+    """Force a version check on the next access"""
+    global _stale
+    _stale = True
+
+
+# Changes made while the listener was disconnected would otherwise be missed
+notifications.listen(NOTIFY_CHANNEL, _on_notify, on_reconnect=invalidate_catalog)
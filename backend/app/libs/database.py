@@ -0,0 +1,101 @@
+"""Shared asyncpg connection pool.
+
+The pool is created lazily on first use, inside the running event loop, and
+closed from the app's lifespan on shutdown.
+
+Usage:
+
+    from app.libs.database import connection
+
+    async with connection() as conn:
+        rows = await conn.fetch("SELECT ...", user.sub)
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import asyncpg
+import databutton as db
+
+from app.libs import statements
+from app.libs.query_trace import TracedConnection
+from databutton_app import metrics
+
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+# Idle connections above the minimum are closed after this many seconds
+POOL_MAX_INACTIVE_SECONDS = 300.0
+# Per-connection prepared statement cache; registered statements take up to
+# half of it so ad-hoc statements cannot evict them all
+STATEMENT_CACHE_SIZE = 100
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+acquire_latency = metrics.histogram(
+    "db_pool_acquire_seconds",
+    "Time spent waiting for a pooled connection",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+def pool_metrics():
+    if _pool is None:
+        return []
+    size, idle = _pool.get_size(), _pool.get_idle_size()
+    return [
+        ("db_pool_connections", "gauge", "Connections in the pool by state", [
+            ({"state": "idle"}, idle),
+            ({"state": "in_use"}, size - idle),
+        ]),
+        ("db_pool_max_connections", "gauge", "Upper bound on pool connections", [({}, _pool.get_max_size())]),
+    ]
+
+
+metrics.register_collector(pool_metrics)
+
+
+def database_url() -> str:
+    return db.secrets.get("DATABASE_URL_DEV")
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Get the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                database_url(),
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=POOL_MAX_INACTIVE_SECONDS,
+                connection_class=TracedConnection,
+                # Prepared registered statements stay until the connection closes
+                statement_cache_size=max(STATEMENT_CACHE_SIZE, 2 * len(statements.registered())),
+                max_cached_statement_lifetime=0,
+                init=statements.prepare_all,
+            )
+        return _pool
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[asyncpg.Connection]:
+    """Borrow a pooled connection for the duration of the block"""
+    pool = await get_pool()
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        acquire_latency.observe(time.perf_counter() - started)
+        yield conn
+
+
+async def close_pool():
+    """Close the pool; called on application shutdown"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
@@ -0,0 +1,331 @@
+"""Background deletion jobs for a user's data.
+
+Deleting an account or a chat history enqueues a row in ``deletion_jobs``
+and returns straight away. A worker task in every process claims jobs with
+``FOR UPDATE SKIP LOCKED`` and deletes in batches of ``BATCH_SIZE`` rows, one
+short transaction per batch that also adds the batch to the job's progress.
+Between batches it pauses for ``BATCH_PAUSE_SECONDS``, and longer while
+replicas lag more than ``MAX_REPLICATION_LAG_SECONDS`` behind, so a large
+deletion never holds many locks or floods the WAL.
+
+Jobs survive restarts: a running job whose heartbeat is older than
+``STALE_AFTER_SECONDS`` is claimed again, and since every batch only deletes
+what is left, a resumed job carries on where it stopped.
+
+A finished account deletion is announced with a NOTIFY on
+``NOTIFY_CHANNEL``. Every process listens for it and emits
+``ACCOUNT_DELETED`` locally, so all of them drop what they cached for the
+user, not just the one that ran the job.
+
+Usage:
+
+    from app.libs import deletion
+
+    deletion.start()                      # from the app lifespan
+    job = await deletion.enqueue_account(user.sub)
+    job = await deletion.latest_job(user.sub, "account")
+    await deletion.stop()
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import asyncpg
+
+from app.libs import statements
+from app.libs.database import connection, database_url
+from app.libs.events import ACCOUNT_DELETED, Event, emit
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+BATCH_SIZE = int(os.environ.get("DELETION_BATCH_SIZE", "1000"))
+BATCH_PAUSE_SECONDS = float(os.environ.get("DELETION_BATCH_PAUSE_SECONDS", "0.05"))
+MAX_REPLICATION_LAG_SECONDS = float(os.environ.get("DELETION_MAX_REPLICATION_LAG_SECONDS", "5"))
+# Longest single pause while waiting for replicas to catch up
+MAX_LAG_PAUSE_SECONDS = 5.0
+POLL_SECONDS = 30.0
+NOTIFY_CHANNEL = "account_deleted"
+STALE_AFTER_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+rows_deleted = metrics.counter("deletion_rows_total", "Rows deleted by deletion jobs", ["table"])
+throttled_seconds = metrics.counter(
+    "deletion_throttled_seconds_total",
+    "Time deletion jobs waited for replicas beyond the normal pause",
+)
+jobs_finished = metrics.counter("deletion_jobs_total", "Deletion jobs finished, by outcome", ["kind", "status"])
+
+
+@dataclass(frozen=True)
+class DeletionTarget:
+    table: str
+    # Columns that identify one row, including the partition key
+    keys: Tuple[str, ...]
+    # For deletions up to a point in time
+    time_column: Optional[str] = None
+    # The row's user, for tables without a user_id column; needs an index
+    # like the user_id columns (jobs_user for the jobs payload)
+    owner: str = "user_id"
+
+
+CHAT_MESSAGES = DeletionTarget("chat_messages", ("id", "created_at"), "created_at")
+
+# Every table with a user's data. Queued background jobs go first, so none
+# of them runs after the tables it writes have been cleared; the rest
+# follow largest first
+ACCOUNT_TARGETS = (
+    DeletionTarget("jobs", ("id",), owner="payload ->> 'user_id'"),
+    CHAT_MESSAGES,
+    DeletionTarget("user_activity_completions", ("id", "completed_at")),
+    DeletionTarget("mood_entries", ("id", "created_at")),
+    DeletionTarget("mood_logs", ("id",)),
+    DeletionTarget("journal_entries", ("id",)),
+    DeletionTarget("user_activity_completion_keys", ("user_id", "idempotency_key")),
+    DeletionTarget("user_activity_progress", ("id",)),
+    DeletionTarget("user_achievements", ("user_id", "achievement_id")),
+    DeletionTarget("user_activity_days", ("user_id",)),
+    DeletionTarget("user_stats", ("user_id",)),
+    DeletionTarget("chat_history_clears", ("user_id",)),
+)
+
+
+def _batch_sql(target: DeletionTarget, through: bool = False) -> str:
+    """One batch of a user's rows: $1 user, $2 batch size, $3 the time to delete through"""
+    until = f" AND {target.time_column} <= $3" if through else ""
+    return f"""
+        WITH doomed AS (
+            SELECT {', '.join(target.keys)}
+            FROM {target.table}
+            WHERE {target.owner} = $1{until}
+            LIMIT $2
+        )
+        DELETE FROM {target.table} t
+        USING doomed
+        WHERE {' AND '.join(f't.{key} = doomed.{key}' for key in target.keys)}
+    """
+
+
+ACCOUNT_BATCHES = {
+    target.table: statements.register(f"deletion.account.{target.table}", _batch_sql(target))
+    for target in ACCOUNT_TARGETS
+}
+CHAT_HISTORY_BATCH = statements.register("deletion.chat_history", _batch_sql(CHAT_MESSAGES, through=True))
+
+JOB_COLUMNS = "id, kind, status, progress, created_at, finished_at"
+
+# An account deletion already under way is returned instead of starting another
+ENQUEUE_ACCOUNT = statements.register("deletion.enqueue_account", f"""
+    WITH open AS (
+        SELECT {JOB_COLUMNS}
+        FROM deletion_jobs
+        WHERE user_id = $1 AND kind = 'account' AND status IN ('pending', 'running')
+        LIMIT 1
+    ),
+    created AS (
+        INSERT INTO deletion_jobs (user_id, kind)
+        SELECT $1, 'account' WHERE NOT EXISTS (SELECT 1 FROM open)
+        RETURNING {JOB_COLUMNS}
+    )
+    SELECT * FROM open UNION ALL SELECT * FROM created
+""")
+LATEST_JOB = statements.register("deletion.latest", f"""
+    SELECT {JOB_COLUMNS}
+    FROM deletion_jobs
+    WHERE user_id = $1 AND kind = $2
+    ORDER BY created_at DESC
+    LIMIT 1
+""")
+CLAIM_JOB = statements.register("deletion.claim", """
+    UPDATE deletion_jobs SET
+        status = 'running',
+        attempts = attempts + 1,
+        started_at = COALESCE(started_at, NOW()),
+        heartbeat_at = NOW()
+    WHERE id = (
+        SELECT id
+        FROM deletion_jobs
+        WHERE status IN ('pending', 'running')
+            AND (status = 'pending' OR heartbeat_at < NOW() - make_interval(secs => $1))
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, user_id, kind, through, attempts
+""")
+RECORD_PROGRESS = statements.register("deletion.progress", """
+    UPDATE deletion_jobs SET
+        progress = jsonb_set(progress, ARRAY[$2::text], to_jsonb(COALESCE((progress ->> $2::text)::bigint, 0) + $3)),
+        heartbeat_at = NOW()
+    WHERE id = $1
+""")
+FINISH_JOB = "UPDATE deletion_jobs SET status = 'done', error = NULL, finished_at = NOW() WHERE id = $1"
+# Failed attempts go back to the queue until MAX_ATTEMPTS
+FAIL_JOB = """
+    UPDATE deletion_jobs SET
+        status = CASE WHEN attempts >= $3 THEN 'failed' ELSE 'pending' END,
+        error = $2,
+        finished_at = CASE WHEN attempts >= $3 THEN NOW() END
+    WHERE id = $1
+    RETURNING status
+"""
+REPLICATION_LAG = "SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0)::float FROM pg_stat_replication"
+
+_wakeup = asyncio.Event()
+_worker_task: Optional[asyncio.Task] = None
+_listener: Optional[asyncpg.Connection] = None
+# Running ACCOUNT_DELETED emits, kept until done so they are not collected
+_forgetting = set()
+
+
+def job_dict(row: asyncpg.Record) -> dict:
+    """A job row as returned by the API, with progress decoded"""
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"]) if isinstance(job["progress"], str) else job["progress"]
+    return job
+
+
+def wake():
+    """Let this process's worker pick up a job just enqueued without waiting for its poll"""
+    _wakeup.set()
+
+
+async def enqueue_account(user_id: str) -> dict:
+    """Schedule deletion of all of the user's data"""
+    async with connection() as conn:
+        row = await conn.fetchrow(ENQUEUE_ACCOUNT, user_id)
+    wake()
+    return job_dict(row)
+
+
+async def latest_job(user_id: str, kind: str) -> Optional[dict]:
+    async with connection() as conn:
+        row = await conn.fetchrow(LATEST_JOB, user_id, kind)
+    return job_dict(row) if row is not None else None
+
+
+def _on_notify(connection, pid, channel, payload):
+    task = asyncio.create_task(emit(Event(type=ACCOUNT_DELETED, user_id=payload)))
+    _forgetting.add(task)
+    task.add_done_callback(_forgetting.discard)
+
+
+def _listening() -> bool:
+    return _listener is not None and not _listener.is_closed()
+
+
+async def _ensure_listener():
+    """Keep one connection per process listening for finished account deletions"""
+    global _listener
+    if _listening():
+        return
+    try:
+        # LISTEN needs a connection of its own that is never returned to the pool
+        _listener = await asyncpg.connect(database_url())
+        await _listener.add_listener(NOTIFY_CHANNEL, _on_notify)
+    except Exception as e:
+        # Cached state then only goes when it expires
+        logger.warning("Account deletion listener unavailable", extra={"error": str(e)})
+        _listener = None
+
+
+def _steps(job: asyncpg.Record):
+    if job["kind"] == "account":
+        return [(table, query, ()) for table, query in ACCOUNT_BATCHES.items()]
+    return [(CHAT_MESSAGES.table, CHAT_HISTORY_BATCH, (job["through"],))]
+
+
+async def _pause(lag: float):
+    pause = BATCH_PAUSE_SECONDS
+    if lag > MAX_REPLICATION_LAG_SECONDS:
+        # Give replicas roughly the time they are behind
+        pause = max(pause, min(lag, MAX_LAG_PAUSE_SECONDS))
+        throttled_seconds.inc(pause - BATCH_PAUSE_SECONDS)
+    await asyncio.sleep(pause)
+
+
+async def run_job(job: asyncpg.Record):
+    """Delete everything the job covers, batch by batch, recording progress"""
+    for table, query, args in _steps(job):
+        while True:
+            # A connection per batch, so the pauses do not hold one
+            async with connection() as conn:
+                async with conn.transaction():
+                    deleted = int((await conn.execute(query, job["user_id"], BATCH_SIZE, *args)).rsplit(" ", 1)[-1])
+                    if deleted:
+                        await conn.execute(RECORD_PROGRESS, job["id"], table, deleted)
+                lag = await conn.fetchval(REPLICATION_LAG) if deleted == BATCH_SIZE else 0.0
+            rows_deleted.labels(table).inc(deleted)
+            if deleted < BATCH_SIZE:
+                break
+            await _pause(lag)
+
+
+async def _process(job: asyncpg.Record):
+    try:
+        await run_job(job)
+    except asyncio.CancelledError:
+        # Left running; claimed again once its heartbeat is stale
+        raise
+    except Exception as e:
+        logger.exception("Deletion job failed", extra={"job_id": job["id"], "kind": job["kind"]})
+        async with connection() as conn:
+            status = await conn.fetchval(FAIL_JOB, job["id"], repr(e), MAX_ATTEMPTS)
+        if status == "failed":
+            jobs_finished.labels(job["kind"], "failed").inc()
+        return
+
+    async with connection() as conn:
+        async with conn.transaction():
+            await conn.execute(FINISH_JOB, job["id"])
+            if job["kind"] == "account":
+                # Delivered to every listening process, this one included, on commit
+                await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, job["user_id"])
+    jobs_finished.labels(job["kind"], "done").inc()
+    logger.info("Deletion job finished", extra={"job_id": job["id"], "kind": job["kind"]})
+    if job["kind"] == "account" and not _listening():
+        await emit(Event(type=ACCOUNT_DELETED, user_id=job["user_id"]))
+
+
+async def _worker():
+    while True:
+        try:
+            _wakeup.clear()
+            # Reattaches a listener whose connection dropped
+            await _ensure_listener()
+            async with connection() as conn:
+                job = await conn.fetchrow(CLAIM_JOB, STALE_AFTER_SECONDS)
+            if job is None:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _process(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Deletion worker failed")
+            await asyncio.sleep(POLL_SECONDS)
+
+
+def start():
+    """Start this process's deletion worker"""
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(_worker())
+
+
+async def stop():
+    global _worker_task, _listener
+    if _worker_task is not None:
+        task, _worker_task = _worker_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    if _listener is not None:
+        listener, _listener = _listener, None
+        await listener.close()
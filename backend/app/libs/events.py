@@ -0,0 +1,109 @@
+"""In-process domain events emitted by API handlers after a successful write.
+
+Subscribers that must see every committed write, even if the process dies
+right after the commit, subscribe with ``subscribe_durable`` instead. The
+repositories ``record`` those events inside the write's transaction, which
+queues a job (``app.libs.jobs``) that delivers them once the write commits,
+on whichever worker claims it, and again if a subscriber fails.
+
+Usage:
+
+    from app.libs.events import Event, emit, record, subscribe, subscribe_durable
+
+    @subscribe("activity_completed")
+    async def on_activity_completed(event: Event):
+        ...
+
+    await emit(Event(type="activity_completed", user_id=user.sub))
+
+    async with conn.transaction():
+        ...
+        await record(Event(type="activity_completed", user_id=user_id), conn=conn)
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+
+from app.libs import jobs
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+ACCOUNT_DELETED = "account_deleted"
+ACTIVITY_COMPLETED = "activity_completed"
+FAVORITE_TOGGLED = "favorite_toggled"
+JOURNAL_ENTRY_CREATED = "journal_entry_created"
+JOURNAL_ENTRY_DELETED = "journal_entry_deleted"
+
+
+@dataclass(frozen=True)
+class Event:
+    type: str
+    user_id: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+Handler = Callable[[Event], Awaitable[None]]
+
+DELIVER_JOB = "events.deliver"
+
+_subscribers: Dict[str, List[Handler]] = {}
+_durable_subscribers: Dict[str, List[Handler]] = {}
+
+
+def _register(registry: Dict[str, List[Handler]], event_types) -> Callable[[Handler], Handler]:
+    def decorator(handler: Handler) -> Handler:
+        for event_type in event_types:
+            registry.setdefault(event_type, []).append(handler)
+        return handler
+
+    return decorator
+
+
+def subscribe(*event_types: str) -> Callable[[Handler], Handler]:
+    """Register the decorated coroutine for one or more event types"""
+    return _register(_subscribers, event_types)
+
+
+def subscribe_durable(*event_types: str) -> Callable[[Handler], Handler]:
+    """Register the decorated coroutine for recorded events; it must be safe to run twice"""
+    return _register(_durable_subscribers, event_types)
+
+
+async def record(event: Event, conn: Optional[asyncpg.Connection] = None) -> None:
+    """Queue the event for its durable subscribers, in ``conn``'s transaction if given"""
+    if event.type in _durable_subscribers:
+        await jobs.enqueue(DELIVER_JOB, asdict(event), conn=conn)
+
+
+@jobs.handler(DELIVER_JOB, concurrency=8)
+async def deliver(job: jobs.Job):
+    """Run the durable subscribers of a recorded event; a failure retries the job"""
+    event = Event(**job.payload)
+    for handler in _durable_subscribers.get(event.type, ()):
+        await handler(event)
+
+
+async def emit(event: Event) -> None:
+    """Run every subscriber of the event; a failing subscriber never fails the write"""
+    for handler in _subscribers.get(event.type, ()):
+        try:
+            await handler(event)
+        except Exception:
+            logger.exception("Event handler failed", extra={"handler": handler.__name__, "event_type": event.type})
+
+
+__all__ = [
+    "ACCOUNT_DELETED",
+    "ACTIVITY_COMPLETED",
+    "FAVORITE_TOGGLED",
+    "JOURNAL_ENTRY_CREATED",
+    "JOURNAL_ENTRY_DELETED",
+    "Event",
+    "emit",
+    "record",
+    "subscribe",
+    "subscribe_durable",
+]
@@ -0,0 +1,98 @@
+"""Fast JSON responses for trusted database output.
+
+Routes that return rows straight from the database can opt in to skip
+building Pydantic models and FastAPI's response_model validation, and have
+the rows serialized once by orjson. Falls back to the standard library when
+orjson is not installed.
+
+The output matches FastAPI's: with ``utc_z=True`` (the default) datetimes are
+written the way Pydantic writes datetime fields ("...Z" for UTC), with
+``utc_z=False`` the way ``datetime.isoformat()`` does ("...+00:00"), for
+models whose timestamps are pre-formatted strings.
+
+Usage:
+
+    from app.libs.fast_json import json_response
+
+    @router.get("/journal", responses={200: {"model": List[JournalEntry]}})
+    async def get_journal_entries(...):
+        rows = await conn.fetch("SELECT ...", user.sub)
+        # The schema is documented under responses, since none is applied
+        return json_response(rows)
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from asyncpg import Record
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Record):
+        return dict(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_default(utc_z: bool):
+    def default(value: Any) -> Any:
+        if isinstance(value, (datetime, date, time)):
+            text = value.isoformat()
+            if utc_z and text.endswith("+00:00"):
+                text = text[:-6] + "Z"
+            return text
+        return _default(value)
+    return default
+
+
+def _rows(value: Any) -> Any:
+    # Converting records up front keeps orjson on its native fast path
+    # instead of calling back into Python for every row
+    if isinstance(value, list) and value and isinstance(value[0], Record):
+        return [dict(row) for row in value]
+    if isinstance(value, Record):
+        return dict(value)
+    return value
+
+
+def dumps(value: Any, *, utc_z: bool = True) -> bytes:
+    """Serialize rows, dicts and lists of them to JSON bytes"""
+    value = _rows(value)
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_UTC_Z if utc_z else 0)
+        return orjson.dumps(value, default=_default, option=option)
+    return json.dumps(
+        value, default=_stdlib_default(utc_z), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def json_response(
+    value: Any,
+    *,
+    utc_z: bool = True,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """A JSON response for trusted data, bypassing response_model validation"""
+    return Response(
+        content=dumps(value, utc_z=utc_z),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,27 @@
+"""Helpers for conditional requests and HTTP cache headers.
+
+Usage:
+
+    from app.libs.http_cache import cached_response
+
+    return cached_response(request, body, etag, "private, no-cache")
+"""
+
+from fastapi import Request, Response
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check an ETag against the request's If-None-Match header"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def cached_response(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    """Return the JSON body with validators, or a bodiless 304 if the client has it"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
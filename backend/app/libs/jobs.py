@@ -0,0 +1,268 @@
+"""Durable background jobs, queued in the ``jobs`` outbox table.
+
+Request handlers hand expensive work off with ``enqueue`` and return; the
+row is the promise that it runs. Pass the handler's connection to enqueue
+inside its transaction, and the job exists exactly when the write commits.
+
+Every process runs one dispatcher that claims due jobs of the registered
+types with ``FOR UPDATE SKIP LOCKED``, never more at once than a type's
+``concurrency``. Claiming marks a job running and moves its ``run_at`` a
+lease ahead, so the job of a process that died is claimed again once the
+lease runs out. A job that raises or overruns its ``timeout`` is retried
+with exponential backoff until ``max_attempts``, then kept as failed.
+
+On shutdown the dispatcher stops claiming, gives running jobs
+``DRAIN_SECONDS`` to finish and hands the rest back to the queue.
+
+Usage:
+
+    from app.libs import jobs
+
+    @jobs.handler("events.deliver", concurrency=4)
+    async def deliver(job: jobs.Job):
+        ...
+
+    await jobs.enqueue("events.deliver", {"user_id": user.sub})
+    await jobs.enqueue("events.deliver", payload, conn=conn)
+
+    jobs.start()                          # from the app lifespan
+    await jobs.stop()
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import asyncpg
+
+from app.libs import statements
+from app.libs.database import connection
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", "2"))
+DRAIN_SECONDS = float(os.environ.get("JOBS_DRAIN_SECONDS", "10"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 600.0
+# Added to a job's timeout for its lease, so a live process always records
+# the outcome before anyone else may claim the job
+LEASE_MARGIN_SECONDS = 30.0
+
+jobs_finished = metrics.counter("jobs_total", "Jobs run, by outcome", ["type", "outcome"])
+job_duration = metrics.histogram(
+    "job_duration_seconds",
+    "Time a job's handler ran",
+    ["type"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 4.0, 16.0, 64.0),
+)
+jobs_running = metrics.gauge("jobs_running", "Jobs running in this process", ["type"])
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    type: str
+    payload: Dict[str, Any]
+    # 1 on the first run
+    attempts: int
+
+
+Handler = Callable[[Job], Awaitable[None]]
+
+
+@dataclass
+class JobType:
+    name: str
+    run: Handler
+    concurrency: int
+    max_attempts: int
+    # Longest one run may take before it counts as failed
+    timeout: float
+    running: Dict[asyncio.Task, Job] = field(default_factory=dict)
+
+
+_types: Dict[str, JobType] = {}
+
+ENQUEUE = statements.register("jobs.enqueue", """
+    INSERT INTO jobs (type, payload, run_at)
+    VALUES ($1, $2::jsonb, NOW() + make_interval(secs => $3))
+""")
+CLAIM = statements.register("jobs.claim", """
+    WITH due AS (
+        SELECT id
+        FROM jobs
+        WHERE type = $1 AND status IN ('pending', 'running') AND run_at <= NOW()
+        ORDER BY run_at
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE jobs SET
+        status = 'running',
+        attempts = attempts + 1,
+        run_at = NOW() + make_interval(secs => $3)
+    FROM due
+    WHERE jobs.id = due.id
+    RETURNING jobs.id, jobs.payload, jobs.attempts
+""")
+# Outcomes only apply to the claim they belong to, in case the lease ran out
+# and another process claimed the job again
+FINISH = statements.register("jobs.finish", "DELETE FROM jobs WHERE id = $1 AND attempts = $2")
+RETRY = statements.register("jobs.retry", """
+    UPDATE jobs SET
+        status = CASE WHEN attempts >= $3 THEN 'failed' ELSE 'pending' END,
+        run_at = NOW() + make_interval(secs => $4),
+        error = $5
+    WHERE id = $1 AND attempts = $2
+    RETURNING status
+""")
+RELEASE = """
+    UPDATE jobs SET status = 'pending', run_at = NOW(), attempts = jobs.attempts - 1
+    FROM unnest($1::bigint[], $2::integer[]) AS released (id, attempts)
+    WHERE jobs.id = released.id AND jobs.attempts = released.attempts
+"""
+
+_wakeup = asyncio.Event()
+_dispatcher: Optional[asyncio.Task] = None
+
+
+def handler(name: str, concurrency: int = 4, max_attempts: int = 5, timeout: float = 60.0) -> Callable[[Handler], Handler]:
+    """Register the decorated coroutine as the handler of a job type"""
+
+    def decorator(run: Handler) -> Handler:
+        _types[name] = JobType(name=name, run=run, concurrency=concurrency, max_attempts=max_attempts, timeout=timeout)
+        return run
+
+    return decorator
+
+
+def wake():
+    """Let this process's dispatcher claim new jobs without waiting for its poll"""
+    _wakeup.set()
+
+
+async def enqueue(
+    job_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    conn: Optional[asyncpg.Connection] = None,
+    delay: float = 0.0,
+):
+    """Queue a job; with ``conn`` it is part of that connection's transaction"""
+    args = (job_type, json.dumps(payload or {}), delay)
+    if conn is not None:
+        await conn.execute(ENQUEUE, *args)
+    else:
+        async with connection() as conn:
+            await conn.execute(ENQUEUE, *args)
+    wake()
+
+
+def backoff(attempts: int) -> float:
+    """Seconds before the next attempt, doubling per attempt, with jitter"""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def _run(job_type: JobType, job: Job):
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(job_type.run(job), job_type.timeout)
+    except asyncio.CancelledError:
+        # Cancelled by a drain, which hands the job back
+        raise
+    except Exception as e:
+        logger.exception("Job failed", extra={"job_id": job.id, "type": job.type, "attempts": job.attempts})
+        async with connection() as conn:
+            status = await conn.fetchval(
+                RETRY, job.id, job.attempts, job_type.max_attempts, backoff(job.attempts), repr(e)
+            )
+        outcome = "failed" if status == "failed" else "retried"
+    else:
+        async with connection() as conn:
+            await conn.execute(FINISH, job.id, job.attempts)
+        outcome = "done"
+    job_duration.labels(job.type).observe(time.perf_counter() - started)
+    jobs_finished.labels(job.type, outcome).inc()
+
+
+def _finished(job_type: JobType, task: asyncio.Task):
+    job = job_type.running.pop(task)
+    jobs_running.labels(job.type).dec()
+    if not task.cancelled() and task.exception() is not None:
+        # Could not record the outcome; the job runs again when its lease ends
+        logger.error("Job outcome not recorded", extra={"job_id": job.id, "error": repr(task.exception())})
+    # A slot is free
+    wake()
+
+
+async def _claim(job_type: JobType) -> int:
+    free = job_type.concurrency - len(job_type.running)
+    if free <= 0:
+        return 0
+    async with connection() as conn:
+        rows = await conn.fetch(CLAIM, job_type.name, free, job_type.timeout + LEASE_MARGIN_SECONDS)
+    for row in rows:
+        job = Job(id=row["id"], type=job_type.name, payload=json.loads(row["payload"]), attempts=row["attempts"])
+        task = asyncio.create_task(_run(job_type, job))
+        job_type.running[task] = job
+        jobs_running.labels(job.type).inc()
+        task.add_done_callback(lambda task, job_type=job_type: _finished(job_type, task))
+    return len(rows)
+
+
+async def _dispatch():
+    while True:
+        _wakeup.clear()
+        try:
+            claimed = 0
+            for job_type in list(_types.values()):
+                claimed += await _claim(job_type)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job dispatcher failed")
+            await asyncio.sleep(POLL_SECONDS)
+            continue
+        if claimed:
+            # More may be due than there were free slots
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    """Start this process's job dispatcher"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = asyncio.create_task(_dispatch())
+
+
+async def stop():
+    """Stop claiming, let running jobs finish for DRAIN_SECONDS and hand back the rest"""
+    global _dispatcher
+    if _dispatcher is None:
+        return
+    task, _dispatcher = _dispatcher, None
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    running = {task: job for job_type in _types.values() for task, job in job_type.running.items()}
+    if not running:
+        return
+    _, unfinished = await asyncio.wait(running, timeout=DRAIN_SECONDS)
+    for task in unfinished:
+        task.cancel()
+    await asyncio.gather(*unfinished, return_exceptions=True)
+    if unfinished:
+        released = [running[task] for task in unfinished]
+        async with connection() as conn:
+            await conn.execute(RELEASE, [job.id for job in released], [job.attempts for job in released])
+        logger.info("Handed unfinished jobs back", extra={"jobs": len(released)})
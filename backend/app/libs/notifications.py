@@ -0,0 +1,134 @@
+"""One LISTEN connection per process, shared by every notification channel.
+
+Modules register callbacks per channel with ``listen`` at import time. The
+app lifespan ``start()``s a task that opens the connection, subscribes every
+channel and keeps it alive, reconnecting with exponential backoff when it
+drops, so nothing on the request path ever waits for a connection to the
+listener. Notifications sent while the connection is down are lost, so the
+``on_reconnect`` callbacks run after every (re)connect to let modules drop
+whatever they may have missed.
+
+Callbacks run on the event loop with the notification's payload and must
+not block; schedule a task for anything that awaits.
+
+Usage:
+
+    from app.libs import notifications
+
+    notifications.listen("selfcare_catalog", on_change, on_reconnect=invalidate_catalog)
+
+    notifications.start()                 # from the app lifespan
+    await notifications.notify("account_deleted", user.sub, conn=conn)
+    await notifications.stop()
+"""
+
+import asyncio
+import random
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+from app.libs.database import connection, database_url
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+CONNECT_TIMEOUT_SECONDS = 5.0
+# How often an idle listener checks that its connection still works
+HEALTH_CHECK_SECONDS = 30.0
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+NOTIFY = "SELECT pg_notify($1, $2)"
+
+Callback = Callable[[str], None]
+
+_channels: Dict[str, List[Callback]] = {}
+_reconnect_callbacks: List[Callable[[], None]] = []
+_connection: Optional[asyncpg.Connection] = None
+_task: Optional[asyncio.Task] = None
+_failures = 0
+
+
+def listen(channel: str, callback: Callback, on_reconnect: Optional[Callable[[], None]] = None):
+    """Call ``callback(payload)`` for every notification on the channel"""
+    _channels.setdefault(channel, []).append(callback)
+    if on_reconnect is not None:
+        _reconnect_callbacks.append(on_reconnect)
+
+
+def is_listening() -> bool:
+    """Whether this process currently receives notifications"""
+    return _connection is not None and not _connection.is_closed()
+
+
+async def notify(channel: str, payload: str, conn: Optional[asyncpg.Connection] = None):
+    """Send a notification; with ``conn`` it is delivered when its transaction commits"""
+    if conn is not None:
+        await conn.execute(NOTIFY, channel, payload)
+    else:
+        async with connection() as conn:
+            await conn.execute(NOTIFY, channel, payload)
+
+
+def _dispatch(connection, pid, channel, payload):
+    for callback in _channels.get(channel, ()):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Notification callback failed", extra={"channel": channel})
+
+
+def _reconnected():
+    for callback in _reconnect_callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Reconnect callback failed")
+
+
+async def _listen_once():
+    global _connection, _failures
+    conn = await asyncpg.connect(database_url(), timeout=CONNECT_TIMEOUT_SECONDS)
+    try:
+        for channel in _channels:
+            await conn.add_listener(channel, _dispatch)
+        _connection, _failures = conn, 0
+        _reconnected()
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_SECONDS)
+            await conn.execute("SELECT 1", timeout=CONNECT_TIMEOUT_SECONDS)
+    finally:
+        _connection = None
+        if not conn.is_closed():
+            await conn.close()
+
+
+async def _run():
+    global _failures
+    while True:
+        try:
+            await _listen_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Notification listener unavailable", extra={"error": str(e), "failures": _failures})
+        # Back off from repeated connection failures, not from a drop after a healthy run
+        _failures += 1
+        delay = min(RETRY_BASE_SECONDS * 2 ** (_failures - 1), RETRY_MAX_SECONDS)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def start():
+    """Start this process's listener"""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        task, _task = _task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
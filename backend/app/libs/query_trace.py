@@ -0,0 +1,261 @@
+"""Per-request database query tracing.
+
+Pooled connections are ``TracedConnection``s, which record each statement's
+fingerprint, duration and row count into the trace of the request that is
+running, kept in a context variable. Tasks spawned by a handler (for example
+with ``asyncio.gather``) inherit the context, so their queries count towards
+the same request.
+
+``QueryTraceMiddleware`` starts a trace per request and, when it finishes,
+logs a JSON line if the request went over ``QUERY_BUDGET_COUNT`` statements
+or ``QUERY_BUDGET_MS`` of database time, or ran one statement
+``QUERY_REPEAT_THRESHOLD`` or more times (the N+1 pattern). With
+``QUERY_TRACE_DEBUG=1`` every trace is logged and responses carry an
+``X-Query-Trace`` summary and a ``Server-Timing`` db entry.
+
+Usage:
+
+    from app.libs.query_trace import current_trace
+
+    trace = current_trace()
+    if trace is not None:
+        print(trace.count, trace.total_ms)
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.libs import statements
+from databutton_app import metrics
+from databutton_app.log import get_logger
+from databutton_app.mw.metrics_mw import route_template
+
+logger = get_logger(__name__)
+
+QUERY_BUDGET_COUNT = int(os.environ.get("QUERY_BUDGET_COUNT", "20"))
+QUERY_BUDGET_MS = float(os.environ.get("QUERY_BUDGET_MS", "100"))
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "5"))
+QUERY_TRACE_DEBUG = os.environ.get("QUERY_TRACE_DEBUG", "") in ("1", "true", "yes")
+
+queries_per_request = metrics.histogram(
+    "db_queries_per_request",
+    "Database statements run while handling one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+db_time_per_request = metrics.histogram(
+    "db_time_per_request_seconds",
+    "Time spent in database statements while handling one request",
+    ["route"],
+)
+budget_violations = metrics.counter(
+    "db_query_budget_violations_total",
+    "Requests over the query count or DB time budget, or with a repeated statement",
+    ["route", "kind"],
+)
+
+
+# String and numeric literals; $n placeholders are left alone
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![$\w])\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_FINGERPRINT_CACHE_SIZE = 2048
+_fingerprints: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+
+def fingerprint(query: str) -> Tuple[str, str]:
+    """A short id and the normalized text of a statement, literals replaced by ?"""
+    cached = _fingerprints.get(query)
+    if cached is not None:
+        return cached
+    text = _WHITESPACE.sub(" ", _LITERALS.sub("?", query)).strip()
+    result = (hashlib.sha1(text.encode()).hexdigest()[:12], text)
+    _fingerprints[query] = result
+    if len(_fingerprints) > _FINGERPRINT_CACHE_SIZE:
+        _fingerprints.popitem(last=False)
+    return result
+
+
+@dataclass
+class StatementStats:
+    text: str
+    # Registry name, for statements registered in app.libs.statements
+    name: Optional[str] = None
+    calls: int = 0
+    rows: int = 0
+    total_ms: float = 0.0
+
+
+@dataclass
+class RequestTrace:
+    count: int = 0
+    rows: int = 0
+    total_ms: float = 0.0
+    statements: Dict[str, StatementStats] = field(default_factory=dict)
+
+    def record(self, query: str, elapsed_ms: float, rows: int, name: Optional[str] = None):
+        fp, text = fingerprint(query)
+        stats = self.statements.get(fp)
+        if stats is None:
+            stats = self.statements[fp] = StatementStats(text=text, name=name)
+        stats.calls += 1
+        stats.rows += rows
+        stats.total_ms += elapsed_ms
+        self.count += 1
+        self.rows += rows
+        self.total_ms += elapsed_ms
+
+    def repeated(self) -> List[str]:
+        return [fp for fp, s in self.statements.items() if s.calls >= QUERY_REPEAT_THRESHOLD]
+
+    def summary(self) -> str:
+        return f"count={self.count};db_ms={self.total_ms:.1f};rows={self.rows};repeated={len(self.repeated())}"
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.count,
+            "db_ms": round(self.total_ms, 2),
+            "rows": self.rows,
+            "statements": [
+                {"fingerprint": fp, "name": s.name, "calls": s.calls, "rows": s.rows, "ms": round(s.total_ms, 2), "sql": s.text[:300]}
+                for fp, s in sorted(self.statements.items(), key=lambda item: -item[1].total_ms)
+            ],
+        }
+
+
+_current: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("query_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def _status_rows(status: str) -> int:
+    # Command tags end in the affected row count, e.g. "UPDATE 3", "INSERT 0 1"
+    tail = status.rsplit(" ", 1)[-1] if status else ""
+    return int(tail) if tail.isdigit() else 0
+
+
+class TracedConnection(asyncpg.Connection):
+    """asyncpg connection timing registered statements and recording into the current request's trace"""
+
+    def _observe(self, query: str, started: float, rows: int):
+        elapsed = time.perf_counter() - started
+        statement = statements.lookup(query)
+        if statement is not None:
+            statement.timing.observe(elapsed)
+        trace = _current.get()
+        if trace is not None:
+            trace.record(query, elapsed * 1000, rows, statement.name if statement is not None else None)
+
+    async def execute(self, query: str, *args, timeout: Optional[float] = None) -> str:
+        started = time.perf_counter()
+        status = await super().execute(query, *args, timeout=timeout)
+        self._observe(query, started, _status_rows(status))
+        return status
+
+    async def executemany(self, command: str, args, *, timeout: Optional[float] = None):
+        started = time.perf_counter()
+        result = await super().executemany(command, args, timeout=timeout)
+        self._observe(command, started, 0)
+        return result
+
+    async def fetch(self, query, *args, timeout=None, record_class=None) -> list:
+        started = time.perf_counter()
+        rows = await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        self._observe(query, started, len(rows))
+        return rows
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        started = time.perf_counter()
+        row = await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        self._observe(query, started, 0 if row is None else 1)
+        return row
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        started = time.perf_counter()
+        value = await super().fetchval(query, *args, column=column, timeout=timeout)
+        self._observe(query, started, 0 if value is None else 1)
+        return value
+
+    async def reset(self, *, timeout=None):
+        # The pool resets connections on release; that is not the request's work
+        token = _current.set(None)
+        try:
+            return await super().reset(timeout=timeout)
+        finally:
+            _current.reset(token)
+
+
+def log_trace(scope: Scope, status: int, trace: RequestTrace, problems: List[str]):
+    logger.log(
+        logging.WARNING if problems else logging.INFO,
+        "Query trace",
+        extra={
+            "method": scope["method"],
+            "route": route_template(scope),
+            "status": status,
+            "problems": problems,
+            **trace.as_dict(),
+        },
+    )
+
+
+class QueryTraceMiddleware:
+    def __init__(self, app: ASGIApp, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+        status = 500
+
+        async def send_with_trace(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if QUERY_TRACE_DEBUG:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-Query-Trace", trace.summary())
+                    headers.append("Server-Timing", f'db;dur={trace.total_ms:.1f};desc="{trace.count} queries"')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            _current.reset(token)
+            self.finish(scope, status, trace)
+
+    def finish(self, scope: Scope, status: int, trace: RequestTrace):
+        route = route_template(scope)
+        queries_per_request.labels(route).observe(trace.count)
+        db_time_per_request.labels(route).observe(trace.total_ms / 1000)
+
+        problems = []
+        if trace.count > QUERY_BUDGET_COUNT:
+            problems.append(f"{trace.count} queries (budget {QUERY_BUDGET_COUNT})")
+            budget_violations.labels(route, "count").inc()
+        if trace.total_ms > QUERY_BUDGET_MS:
+            problems.append(f"{trace.total_ms:.1f} ms in the database (budget {QUERY_BUDGET_MS:g} ms)")
+            budget_violations.labels(route, "time").inc()
+        for fp in trace.repeated():
+            problems.append(f"statement {fp} ran {trace.statements[fp].calls} times, possible N+1")
+            budget_violations.labels(route, "repeated").inc()
+
+        if problems or QUERY_TRACE_DEBUG:
+            log_trace(scope, status, trace, problems)
@@ -0,0 +1,250 @@
+"""Personalized ranking of self-care activities.
+
+An item-item cosine similarity matrix is built from every user's completions
+and held in memory. A lifespan task rebuilds it every
+``SIMILARITY_REFRESH_SECONDS`` and when the catalog version changes,
+streaming the interactions through a cursor, and backs off after a failed
+rebuild. Requests never start a rebuild; until the first one finishes they
+get catalog order. At request time the user's own history (completions,
+ratings, recency, favorites) becomes a preference vector, and candidates are
+scored with one matrix-vector product.
+
+Usage:
+
+    from app.libs.recommendations import rank_activities
+
+    history = await get_repositories().activities.history(user.sub)
+    ranked = rank_activities(catalog, candidates, history, limit=6)
+
+    recommendations.start()               # from the app lifespan
+    await recommendations.stop()
+"""
+
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from app.libs import statements
+from app.libs.catalog import Catalog, CatalogActivity, get_catalog
+from app.libs.database import connection
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+SIMILARITY_REFRESH_SECONDS = float(os.environ.get("SIMILARITY_REFRESH_SECONDS", "3600"))
+# How often the refresh task looks for a new catalog version; also the first
+# delay after a failed rebuild, doubling up to SIMILARITY_REFRESH_SECONDS
+SIMILARITY_CHECK_SECONDS = 60.0
+# Interaction rows fetched from the cursor per round trip
+INTERACTIONS_BATCH_SIZE = 10000
+# Users are folded into the co-occurrence matrix this many at a time
+USER_CHUNK_SIZE = 5000
+# Days for a completion's weight in the preference vector to halve
+RECENCY_HALF_LIFE_DAYS = 14
+FAVORITE_BONUS = 1.0
+
+# Score weights: similarity to what the user engages with, their own affinity
+# for the activity, and the catalog order of the candidates as a prior
+SIMILARITY_WEIGHT = 1.0
+AFFINITY_WEIGHT = 0.5
+PRIOR_WEIGHT = 0.25
+
+INTERACTIONS_QUERY = statements.register("recommendations.interactions", """
+    SELECT user_id, activity_id, COUNT(*) AS completions, AVG(rating)::float AS avg_rating
+    FROM user_activity_completions
+    GROUP BY user_id, activity_id
+    ORDER BY user_id
+""")
+
+
+@dataclass(frozen=True)
+class SimilarityModel:
+    catalog_version: int
+    # Column index of each activity id in the similarity matrix
+    index: Dict[int, int]
+    # Item-item cosine similarity with a zero diagonal, float32
+    similarity: np.ndarray
+    built_at: float
+
+
+def interaction_weight(completions: int, avg_rating: Optional[float]) -> float:
+    """Strength of one user's signal for one activity"""
+    # Ratings are 1-5; unrated completions count as neutral
+    rating_factor = 1.0 if avg_rating is None else 0.5 + (avg_rating - 1) / 4 * 1.5
+    return math.log1p(completions) * rating_factor
+
+
+class SimilarityBuilder:
+    """Accumulates X^T X over users in chunks, fed interactions ordered by user"""
+
+    def __init__(self, catalog: Catalog):
+        self.catalog_version = catalog.version
+        self.index = {activity.id: i for i, activity in enumerate(catalog.activities)}
+        n_items = len(self.index)
+        self.cooccurrence = np.zeros((n_items, n_items), dtype=np.float64)
+        self.chunk = np.zeros((USER_CHUNK_SIZE, n_items), dtype=np.float64)
+        self.row, self.current_user = -1, None
+        self.interactions = 0
+
+    def add(self, interactions: Iterable):
+        for record in interactions:
+            self.interactions += 1
+            column = self.index.get(record['activity_id'])
+            if column is None:
+                continue
+            if record['user_id'] != self.current_user:
+                self.current_user = record['user_id']
+                self.row += 1
+                if self.row == USER_CHUNK_SIZE:
+                    self.cooccurrence += self.chunk.T @ self.chunk
+                    self.chunk.fill(0)
+                    self.row = 0
+            self.chunk[self.row, column] = interaction_weight(record['completions'], record['avg_rating'])
+
+    def finish(self) -> SimilarityModel:
+        """Normalize the accumulated co-occurrence to cosine similarity"""
+        if self.row >= 0:
+            used = self.chunk[: self.row + 1]
+            self.cooccurrence += used.T @ used
+
+        norms = np.sqrt(np.diag(self.cooccurrence))
+        norms[norms == 0] = 1.0
+        similarity = self.cooccurrence / np.outer(norms, norms)
+        np.fill_diagonal(similarity, 0.0)
+        return SimilarityModel(
+            catalog_version=self.catalog_version,
+            index=self.index,
+            similarity=similarity.astype(np.float32),
+            built_at=time.monotonic(),
+        )
+
+
+def build_similarity(catalog: Catalog, interactions: Iterable) -> SimilarityModel:
+    """Build the cosine similarity matrix from interactions ordered by user"""
+    builder = SimilarityBuilder(catalog)
+    builder.add(interactions)
+    return builder.finish()
+
+
+_model: Optional[SimilarityModel] = None
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def refresh_similarity(catalog: Catalog) -> SimilarityModel:
+    """Rebuild the similarity matrix from all users' completions"""
+    global _model
+    builder = SimilarityBuilder(catalog)
+    async with connection() as conn:
+        # A cursor only exists inside a transaction; it keeps one batch of
+        # interactions in memory instead of the whole table
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(INTERACTIONS_QUERY)
+            while True:
+                batch = await cursor.fetch(INTERACTIONS_BATCH_SIZE)
+                if not batch:
+                    break
+                # The matrix math is CPU-bound; keep it off the event loop
+                await asyncio.to_thread(builder.add, batch)
+    _model = await asyncio.to_thread(builder.finish)
+    logger.info("Built activity similarity", extra={"activities": len(_model.index), "interactions": builder.interactions})
+    return _model
+
+
+def _stale(model: Optional[SimilarityModel], catalog: Catalog) -> bool:
+    return (
+        model is None
+        or model.catalog_version != catalog.version
+        or time.monotonic() - model.built_at > SIMILARITY_REFRESH_SECONDS
+    )
+
+
+async def _refresh_loop():
+    failures = 0
+    while True:
+        try:
+            catalog = await get_catalog()
+            if _stale(_model, catalog):
+                await refresh_similarity(catalog)
+            failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failures += 1
+            logger.exception("Activity similarity refresh failed", extra={"failures": failures})
+        delay = min(SIMILARITY_CHECK_SECONDS * 2 ** failures, SIMILARITY_REFRESH_SECONDS)
+        await asyncio.sleep(delay)
+
+
+def start():
+    """Build the similarity model now and keep it fresh; SIMILARITY_REFRESH_SECONDS=0 disables it"""
+    global _refresh_task
+    if SIMILARITY_REFRESH_SECONDS > 0 and _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop():
+    global _refresh_task
+    if _refresh_task is not None:
+        task, _refresh_task = _refresh_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def get_similarity_model(catalog: Catalog) -> Optional[SimilarityModel]:
+    """The current model, if it was built for this catalog version"""
+    model = _model
+    if model is None or model.catalog_version != catalog.version:
+        return None
+    return model
+
+
+def preference_vector(model: SimilarityModel, history: Sequence, now: datetime) -> np.ndarray:
+    """The user's engagement with each activity, decayed by recency"""
+    preferences = np.zeros(len(model.index), dtype=np.float32)
+    for record in history:
+        column = model.index.get(record['activity_id'])
+        if column is None:
+            continue
+        weight = interaction_weight(record['total_completions'] or 0, record['avg_rating'])
+        if record['last_completed_at'] is not None:
+            age_days = max((now - record['last_completed_at']).total_seconds(), 0) / 86400
+            weight *= 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+        if record['is_favorite']:
+            weight += FAVORITE_BONUS
+        preferences[column] = weight
+    return preferences
+
+
+def rank_activities(
+    catalog: Catalog,
+    candidates: Sequence[CatalogActivity],
+    history: Sequence,
+    limit: int = 6,
+) -> Sequence[CatalogActivity]:
+    """Order candidates by the user's history; falls back to catalog order"""
+    model = get_similarity_model(catalog)
+    if model is None or not history or not candidates:
+        return list(candidates[:limit])
+
+    preferences = preference_vector(model, history, datetime.now(timezone.utc))
+    if not preferences.any():
+        return list(candidates[:limit])
+
+    columns = np.fromiter((model.index[a.id] for a in candidates), dtype=np.intp, count=len(candidates))
+    similarity = model.similarity[columns] @ preferences
+    peak = similarity.max()
+    if peak > 0:
+        similarity /= peak
+    affinity = preferences[columns] / preferences.max()
+    # Earlier candidates are the better mood and duration matches
+    prior = 1.0 - np.arange(len(candidates), dtype=np.float32) / len(candidates)
+
+    scores = SIMILARITY_WEIGHT * similarity + AFFINITY_WEIGHT * affinity + PRIOR_WEIGHT * prior
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [candidates[i] for i in order]
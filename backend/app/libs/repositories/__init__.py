@@ -0,0 +1,80 @@
+"""Data access for the API routers, one repository per aggregate.
+
+Routers and libs go through these classes instead of holding SQL, so a
+statement lives in one place and caching, batching or tracing can be added
+there once. ``REPOSITORY_BACKEND`` picks the implementation: ``postgres``
+(the default, on the shared pool) or ``memory`` (process-local dicts, for
+tests and database-free runs).
+
+Usage:
+
+    from app.libs.repositories import get_repositories
+
+    repos = get_repositories()
+    entry = await repos.journal.create(user.sub, "Felt calmer today")
+    mood = await repos.moods.latest(user.sub)
+
+Tests can swap the backend with ``set_repositories(memory_repositories())``.
+"""
+
+import os
+from typing import Callable, Dict, Optional
+
+from app.libs.repositories.base import (
+    AchievementRepository,
+    ActivityRepository,
+    ChatRepository,
+    CompletionResult,
+    JournalRepository,
+    MoodLogRepository,
+    MoodRepository,
+    Repositories,
+    Row,
+    StatsRepository,
+)
+from app.libs.repositories.memory import MemoryStore, memory_repositories
+from app.libs.repositories.postgres import postgres_repositories
+
+REPOSITORY_BACKEND = os.environ.get("REPOSITORY_BACKEND", "postgres")
+
+BACKENDS: Dict[str, Callable[[], Repositories]] = {
+    "postgres": postgres_repositories,
+    "memory": memory_repositories,
+}
+
+_repositories: Optional[Repositories] = None
+
+
+def get_repositories() -> Repositories:
+    """The process-wide repositories, built for REPOSITORY_BACKEND on first use"""
+    global _repositories
+    if _repositories is None:
+        if REPOSITORY_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown REPOSITORY_BACKEND {REPOSITORY_BACKEND!r}, expected one of {sorted(BACKENDS)}")
+        _repositories = BACKENDS[REPOSITORY_BACKEND]()
+    return _repositories
+
+
+def set_repositories(repositories: Optional[Repositories]):
+    """Replace the process-wide repositories; None rebuilds them on next use"""
+    global _repositories
+    _repositories = repositories
+
+
+__all__ = [
+    "AchievementRepository",
+    "ActivityRepository",
+    "ChatRepository",
+    "CompletionResult",
+    "JournalRepository",
+    "MemoryStore",
+    "MoodLogRepository",
+    "MoodRepository",
+    "Repositories",
+    "Row",
+    "StatsRepository",
+    "get_repositories",
+    "memory_repositories",
+    "postgres_repositories",
+    "set_repositories",
+]
@@ -0,0 +1,154 @@
+"""Repository interfaces, one class per aggregate.
+
+Rows are read-only mappings keyed by column name: ``asyncpg.Record`` from
+the Postgres backend and plain dicts from the in-memory one, so callers index
+them the same way and can pass them straight to ``fast_json``.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+from app.libs.streaks import DayBitmap
+
+Row = Mapping[str, Any]
+
+
+class JournalRepository:
+    async def create(self, user_id: str, content: str, mood_emoji: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        """Insert an entry and count it in the user's stats"""
+        raise NotImplementedError
+
+    async def list(self, user_id: str) -> List[Row]:
+        """The user's entries, most recently updated first"""
+        raise NotImplementedError
+
+    async def get(self, user_id: str, entry_id: int) -> Optional[Row]:
+        raise NotImplementedError
+
+    async def update(self, user_id: str, entry_id: int, content: str, mood_emoji: Optional[str] = None) -> Optional[Row]:
+        raise NotImplementedError
+
+    async def delete(self, user_id: str, entry_id: int) -> bool:
+        """Delete an entry and uncount it; False if the user has no such entry"""
+        raise NotImplementedError
+
+
+class MoodRepository:
+    """Quick mood check-ins (``mood_entries``)"""
+
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None) -> Row:
+        raise NotImplementedError
+
+    async def history(self, user_id: str) -> List[Row]:
+        """The user's check-ins, newest first"""
+        raise NotImplementedError
+
+    async def latest(self, user_id: str) -> Optional[Row]:
+        raise NotImplementedError
+
+
+class MoodLogRepository:
+    """Backdatable mood logs (``mood_logs``)"""
+
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        raise NotImplementedError
+
+
+class ChatRepository:
+    async def save(self, user_id: str, message_text: str, message_type: str):
+        raise NotImplementedError
+
+    async def history(self, user_id: str, limit: int = 100) -> List[Row]:
+        """The user's first ``limit`` messages, oldest first"""
+        raise NotImplementedError
+
+    async def clear(self, user_id: str):
+        raise NotImplementedError
+
+
+@dataclass
+class CompletionResult:
+    # False when the idempotency key was seen before and nothing was written
+    recorded: bool
+    # total_completions, last_completed_at and is_favorite after the call
+    progress: Row
+    # True when the idempotency key was first used for another activity
+    conflict: bool = False
+
+
+class ActivityRepository:
+    """Completions, per-activity progress and favorites"""
+
+    async def progress(self, user_id: str) -> List[Row]:
+        """Every progress row of the user, ordered by activity"""
+        raise NotImplementedError
+
+    async def progress_for(self, user_id: str, activity_id: int) -> Optional[Row]:
+        raise NotImplementedError
+
+    async def engaged_progress(self, user_id: str) -> List[Row]:
+        """Progress rows for favorites and activities completed at least once"""
+        raise NotImplementedError
+
+    async def history(self, user_id: str) -> List[Row]:
+        """Progress rows with the user's average rating, as ranking input"""
+        raise NotImplementedError
+
+    async def window_stats(self, user_id: str) -> Row:
+        """Completions this week and today, and when either count next changes"""
+        raise NotImplementedError
+
+    async def recent_completions(self, user_id: str, limit: int = 10) -> List[Row]:
+        raise NotImplementedError
+
+    async def activity_days(self, user_id: str) -> DayBitmap:
+        """The user's active days, kept current by ``complete``"""
+        raise NotImplementedError
+
+    async def complete(
+        self,
+        user_id: str,
+        activity_id: int,
+        rating: Optional[int] = None,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        timezone: Optional[str] = None,
+    ) -> CompletionResult:
+        """Record a completion once per idempotency key, updating progress, stats and active days"""
+        raise NotImplementedError
+
+    async def toggle_favorite(self, user_id: str, activity_id: int) -> bool:
+        """Flip the favorite flag and return the new value"""
+        raise NotImplementedError
+
+    async def set_favorites(self, user_id: str, activity_ids: List[int], is_favorite: bool) -> List[int]:
+        """Set the flag on several activities, returning those whose flag changed"""
+        raise NotImplementedError
+
+
+class AchievementRepository:
+    async def unlocked(self, user_id: str) -> Dict[str, datetime]:
+        """Unlock times by achievement id"""
+        raise NotImplementedError
+
+    async def unlock(self, user_id: str, achievement_id: str, unlocked_at: datetime):
+        """Record an unlock; unlocking twice keeps the first time"""
+        raise NotImplementedError
+
+
+class StatsRepository:
+    async def get(self, user_id: str) -> Dict[str, int]:
+        """The user's lifetime counters, keyed by ``user_stats.COUNTERS``"""
+        raise NotImplementedError
+
+
+@dataclass
+class Repositories:
+    journal: JournalRepository
+    moods: MoodRepository
+    mood_logs: MoodLogRepository
+    chat: ChatRepository
+    activities: ActivityRepository
+    achievements: AchievementRepository
+    stats: StatsRepository
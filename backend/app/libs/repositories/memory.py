@@ -0,0 +1,345 @@
+"""Repositories kept in process memory, for tests and database-free runs.
+
+They follow the Postgres backend's contracts (row columns, ordering, counter
+semantics and idempotency) on plain dicts, with ``user_stats`` counters
+computed from the stored rows instead of materialized. Nothing is persisted
+and nothing is shared between processes. Every write takes effect at once,
+so events are recorded on their own rather than in a transaction.
+"""
+
+import itertools
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.libs.events import (
+    ACTIVITY_COMPLETED,
+    FAVORITE_TOGGLED,
+    JOURNAL_ENTRY_CREATED,
+    JOURNAL_ENTRY_DELETED,
+    Event,
+    record,
+)
+from app.libs.repositories.base import (
+    AchievementRepository,
+    ActivityRepository,
+    ChatRepository,
+    CompletionResult,
+    JournalRepository,
+    MoodLogRepository,
+    MoodRepository,
+    Repositories,
+    Row,
+    StatsRepository,
+)
+from app.libs.streaks import DayBitmap, day_index, resolve_timezone
+
+
+def _now() -> datetime:
+    return datetime.now(dt_timezone.utc)
+
+
+def _pick(row: dict, *columns: str) -> dict:
+    return {column: row[column] for column in columns}
+
+
+@dataclass
+class MemoryStore:
+    """All tables of one in-memory backend; rows are dicts including user_id"""
+    journal_entries: Dict[int, dict] = field(default_factory=dict)
+    mood_entries: List[dict] = field(default_factory=list)
+    mood_logs: List[dict] = field(default_factory=list)
+    chat_messages: List[dict] = field(default_factory=list)
+    completions: List[dict] = field(default_factory=list)
+    # (user_id, activity_id) -> progress row
+    progress: Dict[Tuple[str, int], dict] = field(default_factory=dict)
+    achievements: Dict[str, Dict[str, datetime]] = field(default_factory=dict)
+    activity_days: Dict[str, DayBitmap] = field(default_factory=dict)
+    ids: "itertools.count[int]" = field(default_factory=lambda: itertools.count(1))
+
+
+class MemoryJournalRepository(JournalRepository):
+    COLUMNS = ("id", "content", "mood_emoji", "created_at", "updated_at")
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def create(self, user_id: str, content: str, mood_emoji: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        now = _now()
+        row = {
+            "id": next(self.store.ids),
+            "user_id": user_id,
+            "content": content,
+            "mood_emoji": mood_emoji,
+            "created_at": created_at or now,
+            "updated_at": now,
+        }
+        self.store.journal_entries[row["id"]] = row
+        await record(Event(type=JOURNAL_ENTRY_CREATED, user_id=user_id, payload={"entry_id": row["id"]}))
+        return _pick(row, *self.COLUMNS)
+
+    async def list(self, user_id: str) -> List[Row]:
+        rows = [r for r in self.store.journal_entries.values() if r["user_id"] == user_id]
+        rows.sort(key=lambda r: r["updated_at"], reverse=True)
+        return [_pick(r, *self.COLUMNS) for r in rows]
+
+    async def get(self, user_id: str, entry_id: int) -> Optional[Row]:
+        row = self.store.journal_entries.get(entry_id)
+        if row is None or row["user_id"] != user_id:
+            return None
+        return _pick(row, *self.COLUMNS)
+
+    async def update(self, user_id: str, entry_id: int, content: str, mood_emoji: Optional[str] = None) -> Optional[Row]:
+        row = self.store.journal_entries.get(entry_id)
+        if row is None or row["user_id"] != user_id:
+            return None
+        row.update(content=content, mood_emoji=mood_emoji, updated_at=_now())
+        return _pick(row, *self.COLUMNS)
+
+    async def delete(self, user_id: str, entry_id: int) -> bool:
+        row = self.store.journal_entries.get(entry_id)
+        if row is None or row["user_id"] != user_id:
+            return False
+        del self.store.journal_entries[entry_id]
+        await record(Event(type=JOURNAL_ENTRY_DELETED, user_id=user_id, payload={"entry_id": entry_id}))
+        return True
+
+
+class MemoryMoodRepository(MoodRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None) -> Row:
+        row = {"id": next(self.store.ids), "user_id": user_id, "mood": mood, "notes": notes, "created_at": _now()}
+        self.store.mood_entries.append(row)
+        return _pick(row, "id", "mood", "notes", "created_at")
+
+    async def history(self, user_id: str) -> List[Row]:
+        rows = [r for r in self.store.mood_entries if r["user_id"] == user_id]
+        rows.sort(key=lambda r: r["created_at"], reverse=True)
+        return [_pick(r, "id", "mood", "notes", "created_at") for r in rows]
+
+    async def latest(self, user_id: str) -> Optional[Row]:
+        rows = await self.history(user_id)
+        return _pick(rows[0], "mood", "notes", "created_at") if rows else None
+
+
+class MemoryMoodLogRepository(MoodLogRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        row = {"id": next(self.store.ids), "user_id": user_id, "mood": mood, "notes": notes, "created_at": created_at or _now()}
+        self.store.mood_logs.append(row)
+        return _pick(row, "id", "mood", "notes", "created_at")
+
+
+class MemoryChatRepository(ChatRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def save(self, user_id: str, message_text: str, message_type: str):
+        self.store.chat_messages.append({
+            "id": next(self.store.ids),
+            "user_id": user_id,
+            "message_text": message_text,
+            "message_type": message_type,
+            "created_at": _now(),
+        })
+
+    async def history(self, user_id: str, limit: int = 100) -> List[Row]:
+        rows = sorted((r for r in self.store.chat_messages if r["user_id"] == user_id), key=lambda r: r["created_at"])
+        return [_pick(r, "id", "message_text", "message_type", "created_at") for r in rows[:limit]]
+
+    async def clear(self, user_id: str):
+        self.store.chat_messages[:] = [r for r in self.store.chat_messages if r["user_id"] != user_id]
+
+
+class MemoryActivityRepository(ActivityRepository):
+    PROGRESS_COLUMNS = ("activity_id", "total_completions", "last_completed_at", "is_favorite")
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _user_progress(self, user_id: str) -> List[dict]:
+        rows = [r for (uid, _), r in self.store.progress.items() if uid == user_id]
+        return sorted(rows, key=lambda r: r["activity_id"])
+
+    def _progress_row(self, user_id: str, activity_id: int) -> dict:
+        key = (user_id, activity_id)
+        row = self.store.progress.get(key)
+        if row is None:
+            row = self.store.progress[key] = {
+                "activity_id": activity_id,
+                "total_completions": 0,
+                "last_completed_at": None,
+                "is_favorite": False,
+            }
+        return row
+
+    def _completions(self, user_id: str) -> List[dict]:
+        return [c for c in self.store.completions if c["user_id"] == user_id]
+
+    async def progress(self, user_id: str) -> List[Row]:
+        return [_pick(r, *self.PROGRESS_COLUMNS) for r in self._user_progress(user_id)]
+
+    async def progress_for(self, user_id: str, activity_id: int) -> Optional[Row]:
+        row = self.store.progress.get((user_id, activity_id))
+        return _pick(row, "total_completions", "last_completed_at", "is_favorite") if row else None
+
+    async def engaged_progress(self, user_id: str) -> List[Row]:
+        return [
+            _pick(r, *self.PROGRESS_COLUMNS)
+            for r in self._user_progress(user_id)
+            if r["is_favorite"] or r["total_completions"] > 0
+        ]
+
+    async def history(self, user_id: str) -> List[Row]:
+        ratings: Dict[int, List[int]] = {}
+        for c in self._completions(user_id):
+            if c["rating"] is not None:
+                ratings.setdefault(c["activity_id"], []).append(c["rating"])
+        return [
+            {
+                **_pick(r, *self.PROGRESS_COLUMNS),
+                "avg_rating": sum(ratings[r["activity_id"]]) / len(ratings[r["activity_id"]]) if r["activity_id"] in ratings else None,
+            }
+            for r in self._user_progress(user_id)
+        ]
+
+    async def window_stats(self, user_id: str) -> Row:
+        now = _now()
+        week = [c["completed_at"] for c in self._completions(user_id) if c["completed_at"] >= now - timedelta(days=7)]
+        today = [at for at in week if at >= now - timedelta(days=1)]
+        changes = [min(week) + timedelta(days=7)] if week else []
+        if today:
+            changes.append(min(today) + timedelta(days=1))
+        return {
+            "completions_this_week": len(week),
+            "completions_today": len(today),
+            "window_changes_at": min(changes) if changes else None,
+        }
+
+    async def recent_completions(self, user_id: str, limit: int = 10) -> List[Row]:
+        rows = sorted(self._completions(user_id), key=lambda c: c["completed_at"], reverse=True)
+        return [_pick(c, "activity_id", "completed_at", "rating") for c in rows[:limit]]
+
+    async def activity_days(self, user_id: str) -> DayBitmap:
+        return self.store.activity_days.setdefault(user_id, DayBitmap())
+
+    async def complete(
+        self,
+        user_id: str,
+        activity_id: int,
+        rating: Optional[int] = None,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        timezone: Optional[str] = None,
+    ) -> CompletionResult:
+        progress = self._progress_row(user_id, activity_id)
+        if idempotency_key is not None:
+            replayed = next(
+                (c for c in self.store.completions if c["user_id"] == user_id and c["idempotency_key"] == idempotency_key),
+                None,
+            )
+            if replayed is not None:
+                return CompletionResult(
+                    recorded=False,
+                    progress=_pick(progress, "total_completions", "last_completed_at", "is_favorite"),
+                    conflict=replayed["activity_id"] != activity_id,
+                )
+
+        now = _now()
+        self.store.completions.append({
+            "user_id": user_id,
+            "activity_id": activity_id,
+            "rating": rating,
+            "notes": notes,
+            "completed_at": now,
+            "idempotency_key": idempotency_key,
+        })
+        progress["total_completions"] += 1
+        progress["last_completed_at"] = now
+
+        # Updated in place, like the streaks cache, so holders see the new day
+        days = await self.activity_days(user_id)
+        days.timezone = resolve_timezone(timezone) or days.timezone
+        index = day_index(now.astimezone(ZoneInfo(days.timezone)).date())
+        if index >= 0:
+            days.bits |= 1 << index
+        await record(Event(
+            type=ACTIVITY_COMPLETED,
+            user_id=user_id,
+            payload={"activity_id": activity_id, "first_completion": progress["total_completions"] == 1},
+        ))
+        return CompletionResult(recorded=True, progress=_pick(progress, "total_completions", "last_completed_at", "is_favorite"))
+
+    async def toggle_favorite(self, user_id: str, activity_id: int) -> bool:
+        key = (user_id, activity_id)
+        existed = key in self.store.progress
+        row = self._progress_row(user_id, activity_id)
+        # A newly created row starts out as a favorite
+        row["is_favorite"] = not row["is_favorite"] if existed else True
+        await record(Event(
+            type=FAVORITE_TOGGLED,
+            user_id=user_id,
+            payload={"activity_id": activity_id, "is_favorite": row["is_favorite"]},
+        ))
+        return row["is_favorite"]
+
+    async def set_favorites(self, user_id: str, activity_ids: List[int], is_favorite: bool) -> List[int]:
+        flipped = []
+        for activity_id in sorted(set(activity_ids)):
+            existed = (user_id, activity_id) in self.store.progress
+            row = self._progress_row(user_id, activity_id)
+            # A newly created row only counts as a change when it is a favorite
+            if (existed and row["is_favorite"] != is_favorite) or (not existed and is_favorite):
+                flipped.append(activity_id)
+            row["is_favorite"] = is_favorite
+        if flipped:
+            await record(Event(
+                type=FAVORITE_TOGGLED,
+                user_id=user_id,
+                payload={"activity_ids": flipped, "is_favorite": is_favorite},
+            ))
+        return flipped
+
+
+class MemoryAchievementRepository(AchievementRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def unlocked(self, user_id: str) -> Dict[str, datetime]:
+        return dict(self.store.achievements.get(user_id, {}))
+
+    async def unlock(self, user_id: str, achievement_id: str, unlocked_at: datetime):
+        self.store.achievements.setdefault(user_id, {}).setdefault(achievement_id, unlocked_at)
+
+
+class MemoryStatsRepository(StatsRepository):
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get(self, user_id: str) -> Dict[str, int]:
+        completions = [c for c in self.store.completions if c["user_id"] == user_id]
+        progress = [r for (uid, _), r in self.store.progress.items() if uid == user_id]
+        return {
+            "completions": len(completions),
+            "activities_tried": len({c["activity_id"] for c in completions}),
+            "journal_entries": sum(1 for r in self.store.journal_entries.values() if r["user_id"] == user_id),
+            "favorites": sum(1 for r in progress if r["is_favorite"]),
+        }
+
+
+def memory_repositories(store: Optional[MemoryStore] = None) -> Repositories:
+    store = store or MemoryStore()
+    return Repositories(
+        journal=MemoryJournalRepository(store),
+        moods=MemoryMoodRepository(store),
+        mood_logs=MemoryMoodLogRepository(store),
+        chat=MemoryChatRepository(store),
+        activities=MemoryActivityRepository(store),
+        achievements=MemoryAchievementRepository(store),
+        stats=MemoryStatsRepository(store),
+    )
@@ -0,0 +1,481 @@
+"""Repositories backed by the shared asyncpg pool.
+
+Every statement is registered in ``app.libs.statements`` under a name, so it
+is prepared on each pooled connection when the connection opens and timed
+per name on every call.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from app.libs import cache, deletion, statements, streaks, user_stats
+from app.libs.database import connection
+from app.libs.events import (
+    ACCOUNT_DELETED,
+    ACTIVITY_COMPLETED,
+    FAVORITE_TOGGLED,
+    JOURNAL_ENTRY_CREATED,
+    JOURNAL_ENTRY_DELETED,
+    Event,
+    record,
+    subscribe,
+)
+from app.libs.repositories.base import (
+    AchievementRepository,
+    ActivityRepository,
+    ChatRepository,
+    CompletionResult,
+    JournalRepository,
+    MoodLogRepository,
+    MoodRepository,
+    Repositories,
+    Row,
+    StatsRepository,
+)
+from app.libs.streaks import DayBitmap
+
+JOURNAL_COLUMNS = "id, content, mood_emoji, created_at, updated_at"
+
+INSERT_JOURNAL_ENTRY = statements.register("journal.insert", f"""
+    INSERT INTO journal_entries (user_id, content, mood_emoji, created_at, updated_at)
+    VALUES ($1, $2, $3, $4, $5)
+    RETURNING {JOURNAL_COLUMNS}
+""")
+LIST_JOURNAL_ENTRIES = statements.register("journal.list", f"SELECT {JOURNAL_COLUMNS} FROM journal_entries WHERE user_id = $1 ORDER BY updated_at DESC")
+GET_JOURNAL_ENTRY = statements.register("journal.get", f"SELECT {JOURNAL_COLUMNS} FROM journal_entries WHERE id = $1 AND user_id = $2")
+UPDATE_JOURNAL_ENTRY = statements.register("journal.update", f"""
+    UPDATE journal_entries
+    SET content = $1, mood_emoji = $2, updated_at = $3
+    WHERE id = $4 AND user_id = $5
+    RETURNING {JOURNAL_COLUMNS}
+""")
+DELETE_JOURNAL_ENTRY = statements.register("journal.delete", "DELETE FROM journal_entries WHERE id = $1 AND user_id = $2")
+
+INSERT_MOOD_ENTRY = statements.register("moods.insert", "INSERT INTO mood_entries (user_id, mood, notes) VALUES ($1, $2, $3) RETURNING id, mood, notes, created_at")
+MOOD_HISTORY = statements.register("moods.history", "SELECT id, mood, notes, created_at FROM mood_entries WHERE user_id = $1 ORDER BY created_at DESC")
+LATEST_MOOD = statements.register("moods.latest", """
+    SELECT mood, notes, created_at
+    FROM mood_entries
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT 1
+""")
+
+INSERT_MOOD_LOG = statements.register("mood_logs.insert", """
+    INSERT INTO mood_logs (user_id, mood, notes, created_at)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id, mood, notes, created_at
+""")
+
+INSERT_CHAT_MESSAGE = statements.register("chat.insert", """
+    INSERT INTO chat_messages (user_id, message_text, message_type)
+    VALUES ($1, $2, $3)
+""")
+# Messages up to the user's last clear are hidden until its deletion job has
+# removed them
+CHAT_HISTORY = statements.register("chat.history", """
+    SELECT id, message_text, message_type, created_at
+    FROM chat_messages
+    WHERE user_id = $1
+        AND created_at > COALESCE((SELECT cleared_at FROM chat_history_clears WHERE user_id = $1), '-infinity')
+    ORDER BY created_at ASC
+    LIMIT $2
+""")
+# Hides the history and enqueues the deletion of its rows in one statement
+CLEAR_CHAT_HISTORY = statements.register("chat.clear", """
+    WITH cleared AS (
+        INSERT INTO chat_history_clears (user_id, cleared_at) VALUES ($1, NOW())
+        ON CONFLICT (user_id) DO UPDATE SET cleared_at = EXCLUDED.cleared_at
+        RETURNING cleared_at
+    )
+    INSERT INTO deletion_jobs (user_id, kind, through)
+    SELECT $1, 'chat_history', cleared_at FROM cleared
+""")
+
+USER_PROGRESS = statements.register("activities.progress", """
+    SELECT activity_id, total_completions, last_completed_at, is_favorite
+    FROM user_activity_progress
+    WHERE user_id = $1
+    ORDER BY activity_id
+""")
+ACTIVITY_PROGRESS = statements.register("activities.progress_for", """
+    SELECT total_completions, last_completed_at, is_favorite
+    FROM user_activity_progress
+    WHERE user_id = $1 AND activity_id = $2
+""")
+ENGAGED_PROGRESS = statements.register("activities.engaged_progress", """
+    SELECT activity_id, total_completions, last_completed_at, is_favorite
+    FROM user_activity_progress
+    WHERE user_id = $1 AND (is_favorite = TRUE OR total_completions > 0)
+""")
+
+# The user's progress rows with their average rating; doubles as the
+# progress overlay for the recommended activities
+ACTIVITY_HISTORY = statements.register("activities.history", """
+    SELECT p.activity_id, p.total_completions, p.last_completed_at, p.is_favorite, r.avg_rating
+    FROM user_activity_progress p
+    LEFT JOIN LATERAL (
+        SELECT AVG(c.rating)::float AS avg_rating
+        FROM user_activity_completions c
+        WHERE c.user_id = p.user_id AND c.activity_id = p.activity_id AND c.rating IS NOT NULL
+    ) r ON TRUE
+    WHERE p.user_id = $1
+""")
+
+WINDOW_STATS = statements.register("activities.window_stats", """
+    SELECT
+        COUNT(*) as completions_this_week,
+        COUNT(*) FILTER (WHERE completed_at >= NOW() - INTERVAL '1 day') as completions_today,
+        LEAST(
+            MIN(completed_at) + INTERVAL '7 days',
+            MIN(completed_at) FILTER (WHERE completed_at >= NOW() - INTERVAL '1 day') + INTERVAL '1 day'
+        ) as window_changes_at
+    FROM user_activity_completions
+    WHERE user_id = $1 AND completed_at >= NOW() - INTERVAL '7 days'
+""")
+
+RECENT_COMPLETIONS = statements.register("activities.recent_completions", """
+    SELECT activity_id, completed_at, rating
+    FROM user_activity_completions
+    WHERE user_id = $1
+    ORDER BY completed_at DESC
+    LIMIT $2
+""")
+
+# Records the completion, bumps progress and the user_stats counters in a
+# single statement. A replayed idempotency key claims nothing, so nothing is
+# inserted; REPLAYED_COMPLETION then reads what the key refers to.
+COMPLETE_ACTIVITY = statements.register("activities.complete", """
+    WITH claimed AS (
+        INSERT INTO user_activity_completion_keys (user_id, idempotency_key, activity_id)
+        SELECT $1, $5::text, $2::int WHERE $5::text IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING idempotency_key
+    ),
+    inserted AS (
+        INSERT INTO user_activity_completions (user_id, activity_id, rating, notes, idempotency_key)
+        SELECT $1, $2::int, $3::int, $4::text, $5::text
+        WHERE $5::text IS NULL OR EXISTS (SELECT 1 FROM claimed)
+        RETURNING activity_id
+    ),
+    progress AS (
+        INSERT INTO user_activity_progress (user_id, activity_id, total_completions, last_completed_at)
+        SELECT $1, activity_id, 1, NOW() FROM inserted
+        ON CONFLICT (user_id, activity_id)
+        DO UPDATE SET
+            total_completions = user_activity_progress.total_completions + 1,
+            last_completed_at = NOW(),
+            updated_at = NOW()
+        RETURNING total_completions, last_completed_at, is_favorite
+    ),
+    stats AS (
+        UPDATE user_stats SET
+            completions = completions + 1,
+            activities_tried = activities_tried + CASE WHEN progress.total_completions = 1 THEN 1 ELSE 0 END,
+            updated_at = NOW()
+        FROM progress
+        WHERE user_stats.user_id = $1
+        RETURNING user_stats.user_id
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM inserted) AS recorded,
+        EXISTS (SELECT 1 FROM stats) AS stats_updated,
+        p.total_completions,
+        p.last_completed_at,
+        p.is_favorite
+    FROM (SELECT 1) AS one
+    LEFT JOIN progress p ON TRUE
+""")
+
+# What a replayed idempotency key refers to, read after the statement that
+# found it taken: a request that held the key may have committed after that
+# statement's snapshot, so only a new statement sees its rows
+REPLAYED_COMPLETION = statements.register("activities.replayed_completion", """
+    SELECT
+        k.activity_id AS key_activity_id,
+        p.total_completions,
+        p.last_completed_at,
+        p.is_favorite
+    FROM user_activity_completion_keys k
+    LEFT JOIN user_activity_progress p ON p.user_id = k.user_id AND p.activity_id = $3
+    WHERE k.user_id = $1 AND k.idempotency_key = $2
+""")
+
+# Flips the favorite flag, creating the progress row as a favorite if it does
+# not exist, and moves the favorites counter in the same statement. The row
+# lock taken by ON CONFLICT serializes concurrent toggles instead of racing.
+TOGGLE_FAVORITE = statements.register("activities.toggle_favorite", """
+    WITH toggled AS (
+        INSERT INTO user_activity_progress (user_id, activity_id, is_favorite)
+        VALUES ($1, $2, TRUE)
+        ON CONFLICT (user_id, activity_id)
+        DO UPDATE SET
+            is_favorite = NOT user_activity_progress.is_favorite,
+            updated_at = NOW()
+        RETURNING is_favorite
+    ),
+    stats AS (
+        UPDATE user_stats SET
+            favorites = GREATEST(favorites + CASE WHEN toggled.is_favorite THEN 1 ELSE -1 END, 0),
+            updated_at = NOW()
+        FROM toggled
+        WHERE user_stats.user_id = $1
+        RETURNING user_stats.user_id
+    )
+    SELECT toggled.is_favorite, EXISTS (SELECT 1 FROM stats) AS stats_updated
+    FROM toggled
+""")
+
+# Sets the favorite flag on many activities; only rows whose flag actually
+# changes are written and counted
+SET_FAVORITES = statements.register("activities.set_favorites", """
+    WITH previous AS (
+        SELECT activity_id
+        FROM user_activity_progress
+        WHERE user_id = $1 AND activity_id = ANY($2::int[])
+    ),
+    changed AS (
+        INSERT INTO user_activity_progress (user_id, activity_id, is_favorite)
+        SELECT $1, id, $3 FROM unnest($2::int[]) AS id
+        ON CONFLICT (user_id, activity_id)
+        DO UPDATE SET
+            is_favorite = EXCLUDED.is_favorite,
+            updated_at = NOW()
+        WHERE user_activity_progress.is_favorite IS DISTINCT FROM EXCLUDED.is_favorite
+        RETURNING activity_id
+    ),
+    flipped AS (
+        -- A newly inserted row only changes the count when it is a favorite
+        SELECT changed.activity_id
+        FROM changed
+        LEFT JOIN previous ON previous.activity_id = changed.activity_id
+        WHERE previous.activity_id IS NOT NULL OR $3
+    ),
+    stats AS (
+        UPDATE user_stats SET
+            favorites = GREATEST(favorites + (CASE WHEN $3 THEN 1 ELSE -1 END) * (SELECT COUNT(*) FROM flipped), 0),
+            updated_at = NOW()
+        WHERE user_id = $1 AND EXISTS (SELECT 1 FROM flipped)
+        RETURNING user_id
+    )
+    SELECT
+        ARRAY(SELECT activity_id FROM flipped ORDER BY activity_id) AS flipped,
+        EXISTS (SELECT 1 FROM stats) AS stats_updated
+""")
+
+UNLOCKED_ACHIEVEMENTS = statements.register("achievements.unlocked", "SELECT achievement_id, unlocked_at FROM user_achievements WHERE user_id = $1")
+UNLOCK_ACHIEVEMENT = statements.register("achievements.unlock", """
+    INSERT INTO user_achievements (user_id, achievement_id, unlocked_at)
+    VALUES ($1, $2, $3) ON CONFLICT DO NOTHING
+""")
+
+
+class PostgresJournalRepository(JournalRepository):
+    async def create(self, user_id: str, content: str, mood_emoji: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        now = datetime.now(dt_timezone.utc)
+        async with connection() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(INSERT_JOURNAL_ENTRY, user_id, content, mood_emoji, created_at or now, now)
+                await user_stats.increment(conn, user_id, journal_entries=1)
+                await record(Event(type=JOURNAL_ENTRY_CREATED, user_id=user_id, payload={"entry_id": row["id"]}), conn=conn)
+        return row
+
+    async def list(self, user_id: str) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(LIST_JOURNAL_ENTRIES, user_id)
+
+    async def get(self, user_id: str, entry_id: int) -> Optional[Row]:
+        async with connection() as conn:
+            return await conn.fetchrow(GET_JOURNAL_ENTRY, entry_id, user_id)
+
+    async def update(self, user_id: str, entry_id: int, content: str, mood_emoji: Optional[str] = None) -> Optional[Row]:
+        async with connection() as conn:
+            return await conn.fetchrow(UPDATE_JOURNAL_ENTRY, content, mood_emoji, datetime.now(dt_timezone.utc), entry_id, user_id)
+
+    async def delete(self, user_id: str, entry_id: int) -> bool:
+        async with connection() as conn:
+            async with conn.transaction():
+                result = await conn.execute(DELETE_JOURNAL_ENTRY, entry_id, user_id)
+                if result == "DELETE 0":
+                    return False
+                await user_stats.increment(conn, user_id, journal_entries=-1)
+                await record(Event(type=JOURNAL_ENTRY_DELETED, user_id=user_id, payload={"entry_id": entry_id}), conn=conn)
+        return True
+
+
+# Read by recommendations and every chat message; a logged mood invalidates it
+_latest_moods: cache.Cache[Optional[Row]] = cache.Cache("moods.latest", ttl=300)
+
+
+def mood_tag(user_id: str) -> str:
+    return f"moods:{user_id}"
+
+
+@subscribe(ACCOUNT_DELETED)
+async def forget_latest_mood(event: Event):
+    await cache.invalidate(mood_tag(event.user_id))
+
+
+class PostgresMoodRepository(MoodRepository):
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None) -> Row:
+        async with connection() as conn:
+            row = await conn.fetchrow(INSERT_MOOD_ENTRY, user_id, mood, notes)
+        await cache.invalidate(mood_tag(user_id))
+        return row
+
+    async def history(self, user_id: str) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(MOOD_HISTORY, user_id)
+
+    async def latest(self, user_id: str) -> Optional[Row]:
+        return await _latest_moods.get_or_build(user_id, lambda: self._latest(user_id), tags=[mood_tag(user_id)])
+
+    async def _latest(self, user_id: str) -> Optional[Row]:
+        async with connection() as conn:
+            row = await conn.fetchrow(LATEST_MOOD, user_id)
+        # A plain dict, so the shared tier can store it
+        return dict(row) if row is not None else None
+
+
+class PostgresMoodLogRepository(MoodLogRepository):
+    async def add(self, user_id: str, mood: str, notes: Optional[str] = None, created_at: Optional[datetime] = None) -> Row:
+        async with connection() as conn:
+            return await conn.fetchrow(INSERT_MOOD_LOG, user_id, mood, notes, created_at or datetime.now(dt_timezone.utc))
+
+
+class PostgresChatRepository(ChatRepository):
+    async def save(self, user_id: str, message_text: str, message_type: str):
+        async with connection() as conn:
+            await conn.execute(INSERT_CHAT_MESSAGE, user_id, message_text, message_type)
+
+    async def history(self, user_id: str, limit: int = 100) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(CHAT_HISTORY, user_id, limit)
+
+    async def clear(self, user_id: str):
+        async with connection() as conn:
+            await conn.execute(CLEAR_CHAT_HISTORY, user_id)
+        deletion.wake()
+
+
+class PostgresActivityRepository(ActivityRepository):
+    async def progress(self, user_id: str) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(USER_PROGRESS, user_id)
+
+    async def progress_for(self, user_id: str, activity_id: int) -> Optional[Row]:
+        async with connection() as conn:
+            return await conn.fetchrow(ACTIVITY_PROGRESS, user_id, activity_id)
+
+    async def engaged_progress(self, user_id: str) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(ENGAGED_PROGRESS, user_id)
+
+    async def history(self, user_id: str) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(ACTIVITY_HISTORY, user_id)
+
+    async def window_stats(self, user_id: str) -> Row:
+        async with connection() as conn:
+            return await conn.fetchrow(WINDOW_STATS, user_id)
+
+    async def recent_completions(self, user_id: str, limit: int = 10) -> List[Row]:
+        async with connection() as conn:
+            return await conn.fetch(RECENT_COMPLETIONS, user_id, limit)
+
+    async def activity_days(self, user_id: str) -> DayBitmap:
+        async with connection() as conn:
+            return await streaks.get_bitmap(conn, user_id)
+
+    async def complete(
+        self,
+        user_id: str,
+        activity_id: int,
+        rating: Optional[int] = None,
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        timezone: Optional[str] = None,
+    ) -> CompletionResult:
+        async with connection() as conn:
+            # One unit: the completion, the seeded counters, the marked day and
+            # the recorded event commit together or not at all
+            async with conn.transaction():
+                result = await conn.fetchrow(COMPLETE_ACTIVITY, user_id, activity_id, rating, notes, idempotency_key)
+                if result['recorded']:
+                    if not result['stats_updated']:
+                        # First tracked write for this user seeds the counters
+                        await user_stats.reconcile_user_stats(conn, user_id)
+                    await streaks.record_activity(conn, user_id, timezone=timezone)
+                    await record(Event(
+                        type=ACTIVITY_COMPLETED,
+                        user_id=user_id,
+                        payload={"activity_id": activity_id, "first_completion": result['total_completions'] == 1},
+                    ), conn=conn)
+                    return CompletionResult(recorded=True, progress=result)
+                replayed = await conn.fetchrow(REPLAYED_COMPLETION, user_id, idempotency_key, activity_id)
+        if replayed is None:
+            # The key was pruned in the meantime
+            return CompletionResult(recorded=False, progress=result)
+        return CompletionResult(
+            recorded=False,
+            progress=replayed,
+            conflict=replayed['key_activity_id'] != activity_id,
+        )
+
+    async def toggle_favorite(self, user_id: str, activity_id: int) -> bool:
+        async with connection() as conn:
+            async with conn.transaction():
+                result = await conn.fetchrow(TOGGLE_FAVORITE, user_id, activity_id)
+                if not result['stats_updated']:
+                    # First tracked write for this user seeds the counters
+                    await user_stats.reconcile_user_stats(conn, user_id)
+                await record(Event(
+                    type=FAVORITE_TOGGLED,
+                    user_id=user_id,
+                    payload={"activity_id": activity_id, "is_favorite": result['is_favorite']},
+                ), conn=conn)
+        return result['is_favorite']
+
+    async def set_favorites(self, user_id: str, activity_ids: List[int], is_favorite: bool) -> List[int]:
+        async with connection() as conn:
+            async with conn.transaction():
+                result = await conn.fetchrow(SET_FAVORITES, user_id, activity_ids, is_favorite)
+                if result['flipped'] and not result['stats_updated']:
+                    await user_stats.reconcile_user_stats(conn, user_id)
+                if result['flipped']:
+                    # One event for the batch; durable subscribers re-read the counters
+                    await record(Event(
+                        type=FAVORITE_TOGGLED,
+                        user_id=user_id,
+                        payload={"activity_ids": list(result['flipped']), "is_favorite": is_favorite},
+                    ), conn=conn)
+        return list(result['flipped'])
+
+
+class PostgresAchievementRepository(AchievementRepository):
+    async def unlocked(self, user_id: str) -> Dict[str, datetime]:
+        async with connection() as conn:
+            rows = await conn.fetch(UNLOCKED_ACHIEVEMENTS, user_id)
+        return {row['achievement_id']: row['unlocked_at'] for row in rows}
+
+    async def unlock(self, user_id: str, achievement_id: str, unlocked_at: datetime):
+        async with connection() as conn:
+            await conn.execute(UNLOCK_ACHIEVEMENT, user_id, achievement_id, unlocked_at)
+
+
+class PostgresStatsRepository(StatsRepository):
+    async def get(self, user_id: str) -> Dict[str, int]:
+        async with connection() as conn:
+            return await user_stats.get_user_stats(conn, user_id)
+
+
+def postgres_repositories() -> Repositories:
+    return Repositories(
+        journal=PostgresJournalRepository(),
+        moods=PostgresMoodRepository(),
+        mood_logs=PostgresMoodLogRepository(),
+        chat=PostgresChatRepository(),
+        activities=PostgresActivityRepository(),
+        achievements=PostgresAchievementRepository(),
+        stats=PostgresStatsRepository(),
+    )
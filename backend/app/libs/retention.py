@@ -0,0 +1,212 @@
+"""Monthly partitions, retention and batched deletes for the high-volume tables.
+
+``chat_messages``, ``mood_entries`` and ``user_activity_completions`` are
+partitioned by month (see ``migrations/0003_monthly_partitions.sql``).
+Maintenance keeps partitions ``MONTHS_AHEAD`` months ahead of the clock and
+detaches months older than a table's retention, moving them to the
+``archive`` schema or dropping them (``RETENTION_MODE``), so old data leaves
+without a row-by-row DELETE. Retention is opt-in per table:
+``CHAT_MESSAGES_RETENTION_MONTHS`` and ``MOOD_ENTRIES_RETENTION_MONTHS``.
+Completions are always kept, since lifetime counters are recounted from them.
+
+Per-user deletes that cannot wait for retention are deletion jobs, see
+``app.libs.deletion``.
+
+Usage:
+
+    from app.libs import retention
+
+    retention.start()                     # from the app lifespan
+    await retention.stop()
+
+Run ``python -m app.libs.retention`` to run maintenance once.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import asyncpg
+import databutton as db
+
+from app.libs.database import close_pool, connection
+from databutton_app.log import configure_logging, get_logger, shutdown_logging
+
+logger = get_logger(__name__)
+
+MONTHS_AHEAD = 3
+RETENTION_MODES = ("archive", "drop")
+RETENTION_MODE = os.environ.get("RETENTION_MODE", "archive")
+ARCHIVE_SCHEMA = "archive"
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+# pg_try_advisory_lock key, so one process per database runs maintenance
+MAINTENANCE_LOCK_KEY = 0x72657461
+
+PRUNE_BATCH_SIZE = 1000
+PRUNE_PAUSE_SECONDS = 0.05
+# Completion idempotency keys only have to outlive client retries
+IDEMPOTENCY_KEY_DAYS = 30
+
+if RETENTION_MODE not in RETENTION_MODES:
+    raise ValueError(f"Unknown RETENTION_MODE {RETENTION_MODE!r}, expected one of {RETENTION_MODES}")
+
+
+def _months(variable: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.environ.get(variable)
+    return int(value) if value else default
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    name: str
+    key: str
+    # Whole months kept before the current one; None keeps everything
+    retention_months: Optional[int]
+
+
+# Retention removes users' data, so every table keeps everything unless its
+# variable is set
+PARTITIONED_TABLES = (
+    PartitionedTable("chat_messages", "created_at", _months("CHAT_MESSAGES_RETENTION_MONTHS")),
+    PartitionedTable("mood_entries", "created_at", _months("MOOD_ENTRIES_RETENTION_MONTHS")),
+    # Lifetime counters are reconciled from completions (see user_stats), so
+    # pruning them would shrink every user's totals; not configurable
+    PartitionedTable("user_activity_completions", "completed_at", None),
+)
+
+if os.environ.get("COMPLETIONS_RETENTION_MONTHS"):
+    raise ValueError(
+        "COMPLETIONS_RETENTION_MONTHS is not supported: user_stats reconciliation "
+        "recounts lifetime counters from user_activity_completions"
+    )
+
+ENSURE_PARTITIONS = """
+    SELECT create_monthly_partition($1, (date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => m))::date)
+    FROM generate_series(0, $2) AS m
+"""
+
+# Month partitions of a table, named <table>_pYYYY_MM by create_monthly_partition
+LIST_PARTITIONS = """
+    SELECT c.relname AS name, to_date(substring(c.relname FROM '_p(\\d{4}_\\d{2})$'), 'YYYY_MM') AS month
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = $1::text::regclass AND c.relname ~ '_p\\d{4}_\\d{2}$'
+    ORDER BY month
+"""
+
+PRUNE_IDEMPOTENCY_KEYS = """
+    DELETE FROM user_activity_completion_keys
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM user_activity_completion_keys
+        WHERE created_at < NOW() - make_interval(days => $1)
+        LIMIT $2
+    ))
+"""
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def _deleted(status: str) -> int:
+    return int(status.rsplit(" ", 1)[-1])
+
+
+async def ensure_partitions(conn: asyncpg.Connection, table: PartitionedTable, months_ahead: int = MONTHS_AHEAD):
+    """Create the partitions for this month and the next ``months_ahead``"""
+    await conn.execute(ENSURE_PARTITIONS, table.name, months_ahead)
+
+
+async def apply_retention(conn: asyncpg.Connection, table: PartitionedTable) -> List[str]:
+    """Detach and archive or drop partitions older than the table's retention"""
+    if table.retention_months is None:
+        return []
+    today = datetime.now(timezone.utc).date()
+    months = today.year * 12 + today.month - 1 - table.retention_months
+    cutoff = today.replace(year=months // 12, month=months % 12 + 1, day=1)
+
+    removed = []
+    for partition in await conn.fetch(LIST_PARTITIONS, table.name):
+        if partition["month"] >= cutoff:
+            break
+        async with conn.transaction():
+            # Detaching locks the parent; give up rather than queue requests behind it
+            await conn.execute("SET LOCAL lock_timeout = '5s'")
+            await conn.execute(f'ALTER TABLE {table.name} DETACH PARTITION "{partition["name"]}"')
+            if RETENTION_MODE == "drop":
+                await conn.execute(f'DROP TABLE "{partition["name"]}"')
+            else:
+                await conn.execute(f'ALTER TABLE "{partition["name"]}" SET SCHEMA {ARCHIVE_SCHEMA}')
+        logger.info("Retired partition", extra={"partition": partition["name"], "mode": RETENTION_MODE})
+        removed.append(partition["name"])
+    return removed
+
+
+async def prune_idempotency_keys(conn: asyncpg.Connection) -> int:
+    total = 0
+    while True:
+        deleted = _deleted(await conn.execute(PRUNE_IDEMPOTENCY_KEYS, IDEMPOTENCY_KEY_DAYS, PRUNE_BATCH_SIZE))
+        total += deleted
+        if deleted < PRUNE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(PRUNE_PAUSE_SECONDS)
+
+
+async def run_maintenance(conn: asyncpg.Connection) -> bool:
+    """Partitions ahead, retention and key pruning; False if another process holds the lock"""
+    if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_KEY):
+        return False
+    try:
+        for table in PARTITIONED_TABLES:
+            await ensure_partitions(conn, table)
+            await apply_retention(conn, table)
+        pruned = await prune_idempotency_keys(conn)
+        logger.info("Ran database maintenance", extra={"idempotency_keys_pruned": pruned})
+        return True
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_KEY)
+
+
+async def _maintenance_loop():
+    while True:
+        try:
+            async with connection() as conn:
+                await run_maintenance(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Database maintenance failed")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+def start():
+    """Run maintenance now and every MAINTENANCE_INTERVAL_SECONDS; 0 disables it"""
+    global _maintenance_task
+    if MAINTENANCE_INTERVAL_SECONDS > 0 and _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_maintenance_loop())
+
+
+async def stop():
+    global _maintenance_task
+    if _maintenance_task is not None:
+        task, _maintenance_task = _maintenance_task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def run():
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        if not await run_maintenance(conn):
+            logger.info("Maintenance is already running elsewhere")
+    finally:
+        await conn.close()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        asyncio.run(run())
+    finally:
+        shutdown_logging()
@@ -0,0 +1,118 @@
+"""Registry of named SQL statements, prepared on every pooled connection.
+
+Modules register their hot statements by name at import time and keep using
+the returned SQL text as before. When the pool opens a connection, its
+``init`` hook prepares every registered statement into asyncpg's statement
+cache, so the first request on a fresh connection does not pay for parsing
+and planning. Statements that cannot be prepared yet (e.g. a table whose
+migration has not run yet) are skipped and prepared on first use as usual.
+
+``TracedConnection`` times every execution of a registered statement; the
+counts and durations are exported as ``db_statement_duration_seconds`` and
+available from ``report()``.
+
+Usage:
+
+    from app.libs import statements
+
+    LIST_ENTRIES = statements.register("journal.list", "SELECT ... WHERE user_id = $1")
+
+    rows = await conn.fetch(LIST_ENTRIES, user.sub)
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+statement_duration = metrics.histogram(
+    "db_statement_duration_seconds",
+    "Execution time of registered SQL statements",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+prepare_failures = metrics.counter(
+    "db_statement_prepare_failures_total",
+    "Registered statements that could not be prepared when a connection opened",
+    ["statement"],
+)
+
+
+@dataclass
+class Statement:
+    name: str
+    sql: str
+    # This statement's db_statement_duration_seconds child, looked up once
+    timing: object
+
+
+_by_name: Dict[str, Statement] = {}
+_by_sql: Dict[str, Statement] = {}
+
+
+def register(name: str, sql: str) -> str:
+    """Add a statement to the registry and return its SQL for use in calls"""
+    existing = _by_name.get(name)
+    if existing is not None:
+        # Modules can be re-imported (e.g. by the API loader); keep one entry
+        if existing.sql != sql:
+            raise ValueError(f"Statement {name} is already registered with different SQL")
+        return existing.sql
+    statement = Statement(name=name, sql=sql, timing=statement_duration.labels(name))
+    _by_name[name] = _by_sql[sql] = statement
+    return sql
+
+
+def lookup(sql: str) -> Optional[Statement]:
+    """The registered statement with exactly this SQL text, if any"""
+    return _by_sql.get(sql)
+
+
+def registered() -> List[Statement]:
+    return list(_by_name.values())
+
+
+async def prepare_all(conn: asyncpg.Connection):
+    """Pool ``init`` hook: prepare every registered statement on a new connection"""
+    started = time.perf_counter()
+    prepared = 0
+    for statement in registered():
+        try:
+            # The cache-backed lookup fetch() itself uses, so later calls
+            # with the same text find the prepared statement. The public
+            # conn.prepare() bypasses that cache (use_cache=False) and would
+            # prepare a second copy that fetch() never uses, hence the
+            # private call and the exact asyncpg pin in requirements.txt
+            await conn._get_statement(statement.sql, None)
+            prepared += 1
+        except asyncpg.PostgresError as e:
+            prepare_failures.labels(statement.name).inc()
+            logger.debug("Statement not prepared", extra={"statement": statement.name, "error": str(e)})
+    # asyncpg ends parse/describe with Flush, not Sync, leaving the server in
+    # an implicit transaction until the next query; a BEGIN with an isolation
+    # level would fail in it, so close it here
+    await conn.execute("SELECT 1")
+    logger.debug(
+        "Prepared statements",
+        extra={"prepared": prepared, "total": len(_by_name), "ms": round((time.perf_counter() - started) * 1000, 1)},
+    )
+
+
+def report() -> List[dict]:
+    """Calls and timings per registered statement, by total time spent"""
+    rows = []
+    for statement in registered():
+        calls, total = statement.timing.count, statement.timing.sum
+        rows.append({
+            "statement": statement.name,
+            "calls": calls,
+            "total_ms": round(total * 1000, 2),
+            "mean_ms": round(total * 1000 / calls, 3) if calls else 0.0,
+        })
+    return sorted(rows, key=lambda row: -row["total_ms"])
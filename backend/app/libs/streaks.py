@@ -0,0 +1,207 @@
+"""Per-user day bitmaps for streak queries.
+
+Each user has one bit per calendar day, in their own timezone, counted from
+``EPOCH``. The bitmap is stored as ``bytea`` in ``user_activity_days`` and
+cached in memory as a Python int, so marking a day is a single ``set_bit`` and
+streak queries are a few big-int operations instead of a scan of completions.
+A cached bitmap is reloaded after ``BITMAP_TTL_SECONDS``, so days marked by
+other processes show up.
+
+Bit ``n`` is bit ``n % 8`` of byte ``n // 8``, which matches Postgres
+``set_bit`` on ``bytea`` and ``int.from_bytes(days, "little")``.
+
+Usage:
+
+    from app.libs import streaks
+
+    async with conn.transaction():
+        ...
+        await streaks.record_activity(conn, user.sub, timezone="Africa/Lagos")
+
+    bitmap = await streaks.get_bitmap(conn, user.sub)
+    bitmap.current_streak(), bitmap.longest_streak(), bitmap.days_this_week()
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import asyncpg
+
+from app.libs import statements
+from app.libs.events import ACCOUNT_DELETED, Event, subscribe
+
+EPOCH = date(2020, 1, 1)
+DEFAULT_TIMEZONE = "UTC"
+BITMAP_TTL_SECONDS = 60
+
+# Sets bit $2, growing the bytea with zero bytes when the bit is past its end
+MARK_DAY_QUERY = statements.register("streaks.mark_day", """
+    INSERT INTO user_activity_days (user_id, timezone, days)
+    VALUES ($1, $3, set_bit(decode(repeat('00', $2 / 8 + 1), 'hex'), $2, 1))
+    ON CONFLICT (user_id) DO UPDATE SET
+        days = set_bit(
+            CASE WHEN length(user_activity_days.days) * 8 > $2
+                THEN user_activity_days.days
+                ELSE user_activity_days.days || decode(repeat('00', $2 / 8 + 1 - length(user_activity_days.days)), 'hex')
+            END,
+            $2, 1
+        ),
+        timezone = $3,
+        updated_at = NOW()
+    RETURNING days
+""")
+
+DAYS_QUERY = statements.register("streaks.get", "SELECT days, timezone FROM user_activity_days WHERE user_id = $1")
+
+# Rebuilds the bitmap from completions for users who predate the table, with
+# days in timezone $2
+BACKFILL_QUERY = statements.register("streaks.backfill", """
+    SELECT DISTINCT (completed_at AT TIME ZONE $2)::date AS day
+    FROM user_activity_completions
+    WHERE user_id = $1
+""")
+
+STORE_BACKFILL_QUERY = statements.register("streaks.store_backfill", """
+    INSERT INTO user_activity_days (user_id, timezone, days) VALUES ($1, $2, $3)
+    ON CONFLICT (user_id) DO NOTHING
+""")
+
+def resolve_timezone(name: Optional[str]) -> Optional[str]:
+    """Return the name if it is a known IANA timezone, otherwise None"""
+    if not name:
+        return None
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    return name
+
+
+def day_index(day: date) -> int:
+    return (day - EPOCH).days
+
+
+@dataclass
+class DayBitmap:
+    bits: int = 0
+    timezone: str = DEFAULT_TIMEZONE
+    # When this process last read the bits from the database
+    loaded_at: float = field(default=0.0, compare=False, repr=False)
+
+    def today(self, now: Optional[datetime] = None) -> date:
+        now = now or datetime.now(dt_timezone.utc)
+        return now.astimezone(ZoneInfo(self.timezone)).date()
+
+    def has_day(self, day: date) -> bool:
+        index = day_index(day)
+        return index >= 0 and bool(self.bits >> index & 1)
+
+    def count_days(self, start: date, end: date) -> int:
+        """Number of active days in the inclusive range start..end"""
+        lo, hi = max(day_index(start), 0), day_index(end)
+        if hi < lo:
+            return 0
+        return (self.bits >> lo & ((1 << (hi - lo + 1)) - 1)).bit_count()
+
+    def days_this_week(self, now: Optional[datetime] = None) -> int:
+        today = self.today(now)
+        return self.count_days(today - timedelta(days=today.weekday()), today)
+
+    def current_streak(self, now: Optional[datetime] = None) -> int:
+        """Consecutive active days ending today, or yesterday if today is still open"""
+        index = day_index(self.today(now))
+        if index < 0:
+            return 0
+        if not self.bits >> index & 1:
+            index -= 1
+            if index < 0 or not self.bits >> index & 1:
+                return 0
+        window = (1 << (index + 1)) - 1
+        gaps = ~self.bits & window
+        if not gaps:
+            return index + 1
+        return index - (gaps.bit_length() - 1)
+
+    def longest_streak(self) -> int:
+        """Longest run of consecutive active days, in O(run length) int operations"""
+        bits, length = self.bits, 0
+        while bits:
+            bits &= bits << 1
+            length += 1
+        return length
+
+
+_bitmaps: Dict[str, DayBitmap] = {}
+
+
+@subscribe(ACCOUNT_DELETED)
+async def forget_bitmap(event: Event):
+    _bitmaps.pop(event.user_id, None)
+
+
+def _apply(user_id: str, bits: int, timezone: str) -> DayBitmap:
+    # Update in place so holders of the cached object see the change
+    bitmap = _bitmaps.setdefault(user_id, DayBitmap())
+    bitmap.bits = bits
+    bitmap.timezone = timezone
+    bitmap.loaded_at = time.monotonic()
+    return bitmap
+
+
+async def get_bitmap(conn: asyncpg.Connection, user_id: str, timezone: Optional[str] = None) -> DayBitmap:
+    """Get the user's day bitmap from memory, loading or backfilling it when missing or stale"""
+    bitmap = _bitmaps.get(user_id)
+    if bitmap is not None and time.monotonic() - bitmap.loaded_at < BITMAP_TTL_SECONDS:
+        return bitmap
+
+    row = await conn.fetchrow(DAYS_QUERY, user_id)
+    if row is not None:
+        return _apply(user_id, int.from_bytes(row["days"], "little"), row["timezone"])
+
+    # Backfilled in the caller's timezone for the user. Reads know none and
+    # use UTC, so for users far from UTC an old completion near midnight may
+    # land on the neighbouring day; days marked later use their own timezone
+    tz = resolve_timezone(timezone) or DEFAULT_TIMEZONE
+    bits = 0
+    for record in await conn.fetch(BACKFILL_QUERY, user_id, tz):
+        index = day_index(record["day"])
+        if index >= 0:
+            bits |= 1 << index
+    if bits:
+        await conn.execute(STORE_BACKFILL_QUERY, user_id, tz, bits.to_bytes((bits.bit_length() + 7) // 8, "little"))
+    return _apply(user_id, bits, tz)
+
+
+async def record_activity(
+    conn: asyncpg.Connection,
+    user_id: str,
+    timezone: Optional[str] = None,
+    at: Optional[datetime] = None,
+) -> DayBitmap:
+    """Mark the day of ``at`` (default now) as active in the user's timezone"""
+    bitmap = await get_bitmap(conn, user_id, timezone=timezone)
+    tz = resolve_timezone(timezone) or bitmap.timezone
+    index = day_index((at or datetime.now(dt_timezone.utc)).astimezone(ZoneInfo(tz)).date())
+    if index < 0:
+        return bitmap
+
+    # Bits are only ever set, so an already marked day needs no write. The
+    # cached bits may predate days other processes marked, so re-read them
+    # first; a mark returns the current bits anyway
+    if bitmap.bits >> index & 1 and tz == bitmap.timezone:
+        row = await conn.fetchrow(DAYS_QUERY, user_id)
+        if row is not None:
+            bitmap = _apply(user_id, int.from_bytes(row["days"], "little"), row["timezone"])
+            if bitmap.bits >> index & 1 and tz == bitmap.timezone:
+                return bitmap
+
+    days = await conn.fetchval(MARK_DAY_QUERY, user_id, index, tz)
+    return _apply(user_id, int.from_bytes(days, "little"), tz)
+
+
+def forget(user_id: str):
+    """Drop the cached bitmap so the next read reloads it"""
+    _bitmaps.pop(user_id, None)
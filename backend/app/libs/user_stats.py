@@ -0,0 +1,168 @@
+"""Materialized per-user counters kept in the ``user_stats`` table.
+
+Writers update the counters inside the same transaction as the row they
+insert or delete, so reads are a single primary-key lookup instead of a
+COUNT over the user's whole history. ``reconcile_user_stats`` rebuilds the
+counters from the source tables and is also used to seed a missing row.
+
+Usage:
+
+    from app.libs import user_stats
+
+    async with conn.transaction():
+        await conn.execute("INSERT INTO journal_entries ...")
+        await user_stats.increment(conn, user.sub, journal_entries=1)
+
+    stats = await user_stats.get_user_stats(conn, user.sub)
+
+Run ``python -m app.libs.user_stats`` to reconcile every user.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+import asyncpg
+import databutton as db
+
+from app.libs import statements
+from databutton_app.log import configure_logging, get_logger, shutdown_logging
+
+logger = get_logger(__name__)
+
+COUNTERS = ("completions", "activities_tried", "journal_entries", "favorites")
+
+# Recounts one user from the source tables, seeding the row if it is missing
+RECONCILE_USER_QUERY = statements.register("user_stats.reconcile", """
+    INSERT INTO user_stats (user_id, completions, activities_tried, journal_entries, favorites, updated_at)
+    SELECT
+        u.user_id,
+        COALESCE(c.completions, 0),
+        COALESCE(c.activities_tried, 0),
+        COALESCE(j.journal_entries, 0),
+        COALESCE(f.favorites, 0),
+        NOW()
+    FROM (SELECT $1::text AS user_id) u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS completions, COUNT(DISTINCT activity_id) AS activities_tried
+        FROM user_activity_completions
+        WHERE user_id = $1
+        GROUP BY user_id
+    ) c ON c.user_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS journal_entries
+        FROM journal_entries
+        WHERE user_id = $1
+        GROUP BY user_id
+    ) j ON j.user_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS favorites
+        FROM user_activity_progress
+        WHERE is_favorite = TRUE AND user_id = $1
+        GROUP BY user_id
+    ) f ON f.user_id = u.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        completions = EXCLUDED.completions,
+        activities_tried = EXCLUDED.activities_tried,
+        journal_entries = EXCLUDED.journal_entries,
+        favorites = EXCLUDED.favorites,
+        updated_at = EXCLUDED.updated_at
+""")
+
+# The same recount for every user, for the reconciliation job; it reads the
+# source tables whole, so it is not registered for the request path
+RECONCILE_ALL_QUERY = """
+    INSERT INTO user_stats (user_id, completions, activities_tried, journal_entries, favorites, updated_at)
+    SELECT
+        u.user_id,
+        COALESCE(c.completions, 0),
+        COALESCE(c.activities_tried, 0),
+        COALESCE(j.journal_entries, 0),
+        COALESCE(f.favorites, 0),
+        NOW()
+    FROM (
+        SELECT user_id FROM user_activity_completions
+        UNION
+        SELECT user_id FROM journal_entries
+        UNION
+        SELECT user_id FROM user_activity_progress
+    ) u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS completions, COUNT(DISTINCT activity_id) AS activities_tried
+        FROM user_activity_completions
+        GROUP BY user_id
+    ) c ON c.user_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS journal_entries
+        FROM journal_entries
+        GROUP BY user_id
+    ) j ON j.user_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS favorites
+        FROM user_activity_progress
+        WHERE is_favorite = TRUE
+        GROUP BY user_id
+    ) f ON f.user_id = u.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        completions = EXCLUDED.completions,
+        activities_tried = EXCLUDED.activities_tried,
+        journal_entries = EXCLUDED.journal_entries,
+        favorites = EXCLUDED.favorites,
+        updated_at = EXCLUDED.updated_at
+"""
+
+STATS_QUERY = statements.register("user_stats.get", f"SELECT {', '.join(COUNTERS)} FROM user_stats WHERE user_id = $1")
+
+async def reconcile_user_stats(conn: asyncpg.Connection, user_id: Optional[str] = None) -> str:
+    """Rebuild counters from the source tables for one user, or for all users"""
+    if user_id is None:
+        return await conn.execute(RECONCILE_ALL_QUERY)
+    return await conn.execute(RECONCILE_USER_QUERY, user_id)
+
+
+async def increment(conn: asyncpg.Connection, user_id: str, **deltas: int):
+    """Apply counter deltas; call inside the transaction that made the change"""
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f"Unknown user_stats counters: {sorted(unknown)}")
+
+    assignments = ", ".join(
+        f"{name} = GREATEST({name} + ${i}, 0)" for i, name in enumerate(deltas, start=2)
+    )
+    result = await conn.execute(
+        f"UPDATE user_stats SET {assignments}, updated_at = NOW() WHERE user_id = $1",
+        user_id, *deltas.values()
+    )
+    if result == "UPDATE 0":
+        # First tracked write for this user: seed the row from the source
+        # tables, which already include the change made in this transaction
+        await reconcile_user_stats(conn, user_id)
+
+
+async def get_user_stats(conn: asyncpg.Connection, user_id: str) -> Dict[str, int]:
+    """Get the user's materialized counters, seeding them on first read"""
+    row = await conn.fetchrow(STATS_QUERY, user_id)
+    if row is None:
+        await reconcile_user_stats(conn, user_id)
+        row = await conn.fetchrow(STATS_QUERY, user_id)
+    return {name: row[name] for name in COUNTERS}
+
+
+async def run_reconciliation():
+    """Reconciliation job: rebuild every user's counters from the source tables"""
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        result = await reconcile_user_stats(conn)
+        logger.info("Reconciled user_stats", extra={"status": result})
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        asyncio.run(run_reconciliation())
+    finally:
+        shutdown_logging()
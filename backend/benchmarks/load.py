@@ -0,0 +1,358 @@
+"""Drive every API route under concurrency and record a baseline.
+
+The app comes from ``main.create_app()`` and is called in-process, so the
+numbers cover middleware, auth, handlers and the database, but not the HTTP
+server or the network. External services are replaced by local stand-ins
+(see ``benchmarks.standins``): tokens are signed with a generated key and
+checked against a local JWKS by the real auth path, and chat replies stream
+from a fake completion server. By default Postgres must be real, as the
+self-care catalog is read from it; use a scratch database migrated with
+``python -m migrations``, since virtual users' data is left behind. With ``--backend memory`` user data goes to the
+in-memory repositories instead and no database is needed: a
+``DatabaseStandIn`` serves a fixed catalog and runs jobs and account
+deletions in process. That isolates the cost of the app from the database.
+
+Each route runs on its own, ``--requests`` times split evenly over
+``--concurrency`` virtual users, after a setup phase that seeds every user
+with journal entries, mood logs and activity completions. Results are one
+JSON document with throughput, latency percentiles, status counts and
+database statements and time per request for each route, plus calls and
+timings per registered SQL statement and hit rates per cache. With
+``--shared-cache`` the cache gets a shared tier on a local Redis-protocol
+stand-in. Pass an earlier result as ``--baseline`` to print the change per
+route.
+
+Run from the backend directory:
+
+    python -m benchmarks.load --database-url postgresql://localhost/bench \\
+        --concurrency 10 --requests 200 --output baseline.json
+
+    python -m benchmarks.load --backend memory --output memory.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.standins import AUDIENCE, DatabaseStandIn, SharedCacheStandIn, StandIns
+
+MOODS = ["happy", "calm", "anxious", "sad", "tired"]
+
+
+@dataclass
+class VirtualUser:
+    sub: str
+    headers: Dict[str, str]
+    entry_ids: List[int] = field(default_factory=list)
+    # Entries created only to be deleted by the DELETE scenario
+    spare_entry_ids: List[int] = field(default_factory=list)
+    activity_ids: List[int] = field(default_factory=list)
+    calls: int = 0
+
+    @property
+    def entry_id(self) -> int:
+        return self.entry_ids[self.calls % len(self.entry_ids)]
+
+    @property
+    def activity_id(self) -> int:
+        return self.activity_ids[self.calls % len(self.activity_ids)]
+
+
+@dataclass
+class Scenario:
+    method: str
+    route: str
+    path: Callable[[VirtualUser], str]
+    body: Optional[Callable[[VirtualUser], dict]] = None
+    headers: Optional[Callable[[VirtualUser], Dict[str, str]]] = None
+    expect: Tuple[int, ...] = (200,)
+    # Runs --slow-requests times instead of --requests (streamed chat replies)
+    slow: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.route}"
+
+
+def fixed(path: str) -> Callable[[VirtualUser], str]:
+    return lambda user: path
+
+
+SCENARIOS = [
+    Scenario("GET", "/routes/catalog", fixed("/routes/catalog")),
+    Scenario("GET", "/routes/activities", fixed("/routes/activities")),
+    Scenario("GET", "/routes/activities/{activity_id}", lambda u: f"/routes/activities/{u.activity_id}"),
+    Scenario("GET", "/routes/recommendations", fixed("/routes/recommendations?mood=anxious")),
+    Scenario("GET", "/routes/progress", fixed("/routes/progress")),
+    Scenario("GET", "/routes/achievements", fixed("/routes/achievements")),
+    Scenario("GET", "/routes/dashboard", fixed("/routes/dashboard")),
+    Scenario("GET", "/routes/journal", fixed("/routes/journal")),
+    Scenario("GET", "/routes/journal/{entry_id}", lambda u: f"/routes/journal/{u.entry_id}"),
+    Scenario("POST", "/routes/journal", fixed("/routes/journal"), body=lambda u: {"content": "Benchmark entry", "mood_emoji": "🙂"}),
+    Scenario("PUT", "/routes/journal/{entry_id}", lambda u: f"/routes/journal/{u.entry_id}", body=lambda u: {"content": f"Edited {u.calls}"}),
+    Scenario("DELETE", "/routes/journal/{entry_id}", lambda u: f"/routes/journal/{u.spare_entry_ids.pop()}", expect=(204,)),
+    Scenario("GET", "/routes/mood", fixed("/routes/mood")),
+    Scenario("POST", "/routes/mood", fixed("/routes/mood"), body=lambda u: {"mood": MOODS[u.calls % len(MOODS)]}),
+    Scenario("POST", "/routes/moods", fixed("/routes/moods"), body=lambda u: {"mood": MOODS[u.calls % len(MOODS)], "notes": "Benchmark"}),
+    Scenario(
+        "POST", "/routes/activities/{activity_id}/complete",
+        lambda u: f"/routes/activities/{u.activity_id}/complete",
+        body=lambda u: {"activity_id": u.activity_id, "rating": 4, "timezone": "Europe/Oslo"},
+        headers=lambda u: {"Idempotency-Key": uuid.uuid4().hex},
+    ),
+    Scenario("POST", "/routes/activities/{activity_id}/favorite", lambda u: f"/routes/activities/{u.activity_id}/favorite"),
+    Scenario(
+        "PUT", "/routes/activities/favorites", fixed("/routes/activities/favorites"),
+        body=lambda u: {"activity_ids": u.activity_ids[:2], "is_favorite": u.calls % 2 == 0},
+    ),
+    Scenario(
+        "POST", "/routes/batch", fixed("/routes/batch"),
+        body=lambda u: {"requests": [
+            {"id": "journal", "path": "/routes/journal"},
+            {"id": "mood", "path": "/routes/mood"},
+            {"id": "progress", "path": "/routes/progress"},
+        ]},
+    ),
+    Scenario("POST", "/routes/send-message", fixed("/routes/send-message"), body=lambda u: {"message": "I feel a bit anxious today"}, slow=True),
+    Scenario("GET", "/routes/history", fixed("/routes/history")),
+    Scenario("DELETE", "/routes/history", fixed("/routes/history")),
+    # Last, since the deletions they schedule empty the users' data
+    Scenario("DELETE", "/routes/account", fixed("/routes/account"), expect=(202,)),
+    Scenario("GET", "/routes/account/deletion", fixed("/routes/account/deletion")),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed_user(client: httpx.AsyncClient, user: VirtualUser, entries: int, spares: int, moods: int):
+    """Give a virtual user enough history that list and stats routes do real work"""
+    now = datetime.now(timezone.utc)
+    activities = (await client.get("/routes/activities", headers=user.headers)).raise_for_status().json()
+    user.activity_ids = [a["id"] for a in activities["activities"]]
+    if not user.activity_ids:
+        raise SystemExit("The self-care catalog is empty; seed selfcare_activities first")
+
+    for i in range(entries + spares):
+        created_at = (now - timedelta(days=i % 60, hours=i)).isoformat()
+        response = await client.post(
+            "/routes/journal", headers=user.headers, json={"content": f"Seed entry {i}", "created_at": created_at}
+        )
+        (user.entry_ids if i < entries else user.spare_entry_ids).append(response.raise_for_status().json()["id"])
+    for i in range(moods):
+        created_at = (now - timedelta(days=i)).isoformat()
+        response = await client.post(
+            "/routes/moods", headers=user.headers, json={"mood": MOODS[i % len(MOODS)], "created_at": created_at}
+        )
+        response.raise_for_status()
+    for activity_id in user.activity_ids[:3]:
+        response = await client.post(
+            f"/routes/activities/{activity_id}/complete",
+            headers={**user.headers, "Idempotency-Key": uuid.uuid4().hex},
+            json={"activity_id": activity_id, "rating": 5},
+        )
+        response.raise_for_status()
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, users: List[VirtualUser], total: int) -> dict:
+    from app.libs import query_trace
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def worker(user: VirtualUser, count: int):
+        for _ in range(count):
+            headers = dict(user.headers)
+            if scenario.headers:
+                headers.update(scenario.headers(user))
+            started = time.perf_counter()
+            response = await client.request(
+                scenario.method,
+                scenario.path(user),
+                headers=headers,
+                json=scenario.body(user) if scenario.body else None,
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+            user.calls += 1
+
+    queries_before = query_trace.queries_per_request.totals()[1]
+    db_before = query_trace.db_time_per_request.totals()[1]
+    started = time.perf_counter()
+    # Fixed share per user, so every user's spare entries cover its deletes
+    await asyncio.gather(*(
+        worker(user, total // len(users) + (1 if i < total % len(users) else 0))
+        for i, user in enumerate(users)
+    ))
+    elapsed = time.perf_counter() - started
+    queries = query_trace.queries_per_request.totals()[1] - queries_before
+    db_seconds = query_trace.db_time_per_request.totals()[1] - db_before
+
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status not in scenario.expect)
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 2),
+            "p50": round(percentile(ordered, 50), 2),
+            "p95": round(percentile(ordered, 95), 2),
+            "p99": round(percentile(ordered, 99), 2),
+            "max": round(ordered[-1], 2),
+        },
+        "queries_per_request": round(queries / total, 2),
+        "db_ms_per_request": round(db_seconds * 1000 / total, 2),
+    }
+
+
+async def run(args) -> dict:
+    with ExitStack() as stack:
+        standins = stack.enter_context(StandIns(token_delay=args.token_delay_ms / 1000))
+        # Read when the chat API module is imported, so set before importing the app
+        os.environ["OPENAI_BASE_URL"] = standins.openai_base_url
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        if args.shared_cache:
+            os.environ["CACHE_URL"] = stack.enter_context(SharedCacheStandIn()).url
+        if args.backend == "memory":
+            stack.enter_context(DatabaseStandIn())
+        from app.libs import cache, statements
+        from databutton_app.mw.auth_mw import AuthConfig
+        from main import create_app
+
+        app = create_app()
+        app.state.auth_config = AuthConfig(jwks_url=standins.jwks_url, audience=AUDIENCE, header="authorization")
+
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            VirtualUser(sub=f"bench-{run_id}-{i}", headers={"Authorization": f"Bearer {standins.token(f'bench-{run_id}-{i}')}"})
+            for i in range(args.concurrency)
+        ]
+        spares = math.ceil(args.requests / args.concurrency)
+        selected = [s for s in SCENARIOS if not args.routes or any(r in s.name for r in args.routes)]
+
+        results: Dict[str, dict] = {}
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                print(f"seeding {len(users)} users", file=sys.stderr)
+                await asyncio.gather(*(seed_user(client, u, args.seed_entries, spares, args.seed_moods) for u in users))
+                for scenario in selected:
+                    total = args.slow_requests if scenario.slow else args.requests
+                    results[scenario.name] = result = await run_scenario(client, scenario, users, total)
+                    print(
+                        f"{scenario.name:48} {result['throughput_rps']:8.1f} rps"
+                        f"  p50 {result['latency_ms']['p50']:7.2f}  p95 {result['latency_ms']['p95']:7.2f}"
+                        f"  p99 {result['latency_ms']['p99']:7.2f} ms"
+                        f"  {result['queries_per_request']:5.1f} q/req  errors {result['errors']}",
+                        file=sys.stderr,
+                    )
+
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "slow_requests": args.slow_requests,
+            "seed_entries": args.seed_entries,
+            "seed_moods": args.seed_moods,
+            "token_delay_ms": args.token_delay_ms,
+            "shared_cache": args.shared_cache,
+        },
+        "routes": results,
+        # Registered statements over the whole run, seeding included
+        "statements": [row for row in statements.report() if row["calls"]],
+        "caches": cache.report(),
+    }
+
+
+def compare(baseline: dict, current: dict):
+    """Print the change in throughput, p50, p95 and queries per route against a baseline"""
+    def change(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+6.1f}%" if old else "     n/a"
+
+    print(f"\nagainst {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')})", file=sys.stderr)
+    for name, new in current["routes"].items():
+        old = baseline["routes"].get(name)
+        if old is None:
+            print(f"{name:48} new route", file=sys.stderr)
+            continue
+        print(
+            f"{name:48} rps {change(old['throughput_rps'], new['throughput_rps'])}"
+            f"  p50 {change(old['latency_ms']['p50'], new['latency_ms']['p50'])}"
+            f"  p95 {change(old['latency_ms']['p95'], new['latency_ms']['p95'])}"
+            f"  q/req {old['queries_per_request']:g} -> {new['queries_per_request']:g}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Postgres to run against (default: DATABASE_URL_DEV); unused with --backend memory")
+    parser.add_argument("--backend", choices=["postgres", "memory"], default="postgres", help="Repository backend for user data")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users issuing requests at once")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--slow-requests", type=int, default=20, help="Requests for the streamed chat route")
+    parser.add_argument("--seed-entries", type=int, default=50, help="Journal entries per user")
+    parser.add_argument("--seed-moods", type=int, default=60, help="Mood logs per user, one per day")
+    parser.add_argument("--token-delay-ms", type=float, default=5, help="Delay between fake completion tokens")
+    parser.add_argument("--shared-cache", action="store_true", help="Give the cache a shared tier on a local Redis-protocol stand-in")
+    parser.add_argument("--routes", nargs="*", help="Only run routes whose 'METHOD /path' contains one of these")
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL_DEV"] = args.database_url
+    if args.backend == "postgres" and not os.environ.get("DATABASE_URL_DEV"):
+        parser.error("pass --database-url or set DATABASE_URL_DEV")
+    os.environ["REPOSITORY_BACKEND"] = args.backend
+    # Per-request query trace warnings would drown out the results
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
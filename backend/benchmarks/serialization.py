@@ -0,0 +1,153 @@
+"""Compare the model-based and fast response paths on large lists.
+
+Serves the same in-memory rows through two FastAPI routes: one building a
+Pydantic model per row under a response_model (the path the journal and mood
+routes used before), one returning ``app.libs.fast_json.json_response``. Each
+route is called in-process, so the timings cover validation, serialization
+and response handling without the network or the database. Both routes are
+checked to return the same JSON before anything is timed.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization --rows 1000 5000 --repeat 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from app.libs import fast_json
+
+
+class JournalEntry(BaseModel):
+    id: int
+    content: str
+    mood_emoji: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class MoodLog(BaseModel):
+    id: int
+    mood: str
+    notes: Optional[str] = None
+    created_at: str
+
+
+def journal_rows(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": i,
+            "content": f"Entry {i}: " + "Today I noticed how I felt and wrote it down. " * 8,
+            "mood_emoji": "🙂" if i % 3 else None,
+            "created_at": now - timedelta(hours=i, microseconds=i),
+            "updated_at": now - timedelta(hours=i),
+        }
+        for i in range(count)
+    ]
+
+
+def mood_rows(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": i,
+            "mood": str(i % 5 + 1),
+            "notes": "Slept well" if i % 2 else None,
+            "created_at": now - timedelta(hours=i, microseconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def build_app(journal: List[dict], moods: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model/journal", response_model=List[JournalEntry])
+    async def model_journal():
+        return [JournalEntry(**row) for row in journal]
+
+    @app.get("/fast/journal", response_model=List[JournalEntry])
+    async def fast_journal():
+        return fast_json.json_response(journal)
+
+    @app.get("/model/mood", response_model=List[MoodLog])
+    async def model_mood():
+        return [
+            MoodLog(id=row["id"], mood=row["mood"], notes=row["notes"], created_at=row["created_at"].isoformat())
+            for row in moods
+        ]
+
+    @app.get("/fast/mood", response_model=List[MoodLog])
+    async def fast_mood():
+        return fast_json.json_response(moods, utc_z=False)
+
+    return app
+
+
+async def time_route(client: httpx.AsyncClient, path: str, repeat: int) -> List[float]:
+    await client.get(path)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+
+async def run(row_counts: List[int], repeat: int) -> List[dict]:
+    results = []
+    for count in row_counts:
+        app = build_app(journal_rows(count), mood_rows(count))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for kind in ("journal", "mood"):
+                model_body = (await client.get(f"/model/{kind}")).json()
+                fast_body = (await client.get(f"/fast/{kind}")).json()
+                if model_body != fast_body:
+                    raise SystemExit(f"{kind}: fast path output differs from the model path")
+
+                model = summarize(await time_route(client, f"/model/{kind}", repeat))
+                fast = summarize(await time_route(client, f"/fast/{kind}", repeat))
+                results.append({
+                    "list": kind,
+                    "rows": count,
+                    "model": model,
+                    "fast": fast,
+                    "speedup": round(model["mean_ms"] / fast["mean_ms"], 2),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if fast_json.orjson is not None else 'json (orjson not installed)'}")
+    for result in asyncio.run(run(args.rows, args.repeat)):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Local stand-ins for the services the backend calls out to.
+
+One HTTP server on a background thread plays both external parties:
+
+- Firebase Auth: ``/jwks.json`` serves the public half of an RSA key
+  generated at startup, and ``token()`` signs RS256 ID tokens with it, so
+  requests go through the real auth middleware and JWKS client.
+- OpenAI: ``/v1/chat/completions`` streams a canned reply as server-sent
+  chunks, ``token_delay`` seconds apart, ending with a usage chunk, so the
+  chat route runs its real streaming loop. Point the client at it with
+  ``OPENAI_BASE_URL=standins.openai_base_url``.
+
+``SharedCacheStandIn`` is a small Redis-protocol server holding keys in a
+dict, with the commands the shared cache tier uses, so runs can exercise
+``CACHE_URL`` without a Redis install.
+
+``DatabaseStandIn`` covers what still needs Postgres once the repositories
+are in memory, so ``--backend memory`` runs without a database: it serves a
+fixed catalog of ``ACTIVITIES``, runs queued jobs (recorded events) as
+soon as they are enqueued, and finishes account deletions at once. Those
+only announce ``ACCOUNT_DELETED``; the in-memory data stays. There is one
+process, so notifications are not sent. Migrations,
+maintenance and the similarity rebuild are switched off, so
+recommendations come in catalog order. Enter it before importing the app.
+
+Usage:
+
+    with StandIns(token_delay=0.01) as standins:
+        os.environ["OPENAI_BASE_URL"] = standins.openai_base_url
+        headers = {"Authorization": f"Bearer {standins.token('user-1')}"}
+
+    with SharedCacheStandIn() as shared_cache:
+        os.environ["CACHE_URL"] = shared_cache.url
+
+    with DatabaseStandIn():
+        from main import create_app
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+AUDIENCE = "bench-project"
+REPLY = (
+    "Thank you for sharing that with me. It sounds like today has been a lot. "
+    "Would you like to talk about what has been weighing on you the most?"
+)
+
+
+class StandIns:
+    def __init__(self, token_delay: float = 0.0, reply: str = REPLY):
+        self.token_delay = token_delay
+        self.reply_tokens = [word + " " for word in reply.split()]
+        self.kid = uuid.uuid4().hex
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(RSAAlgorithm.to_jwk(self._key.public_key()))
+        jwk.update({"kid": self.kid, "alg": "RS256", "use": "sig"})
+        self.jwks = json.dumps({"keys": [jwk]}).encode()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def __enter__(self) -> "StandIns":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def jwks_url(self) -> str:
+        return f"{self.base_url}/jwks.json"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    def token(self, sub: str, ttl: int = 3600) -> str:
+        """A signed ID token for ``sub``, as Firebase would issue it"""
+        now = int(time.time())
+        claims = {"sub": sub, "aud": AUDIENCE, "iat": now, "exp": now + ttl}
+        return jwt.encode(claims, self._key, algorithm="RS256", headers={"kid": self.kid})
+
+
+def _chunk(model: str, delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> bytes:
+    body = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        body["usage"] = usage
+    return b"data: " + json.dumps(body).encode() + b"\n\n"
+
+
+def _handler(standins: StandIns):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/jwks.json":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(standins.jwks)))
+            self.end_headers()
+            self.wfile.write(standins.jwks)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", "0"))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/v1/chat/completions" or not request.get("stream"):
+                self.send_error(404)
+                return
+
+            model = request.get("model", "bench")
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(_chunk(model, {"role": "assistant", "content": ""}))
+            for token in standins.reply_tokens:
+                if standins.token_delay:
+                    time.sleep(standins.token_delay)
+                self.wfile.write(_chunk(model, {"content": token}))
+                self.wfile.flush()
+            self.wfile.write(_chunk(model, {}, finish_reason="stop"))
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(standins.reply_tokens),
+                "total_tokens": prompt_tokens + len(standins.reply_tokens),
+            }
+            self.wfile.write(_chunk(model, {}, usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+class SharedCacheStandIn:
+    """Redis-protocol server for GET, MGET, SET (PX, NX), DEL and PING"""
+
+    def __init__(self):
+        # key -> (value, expires at in time.monotonic(), or None)
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.lock = threading.Lock()
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+
+    def __enter__(self) -> "SharedCacheStandIn":
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _resp_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"redis://{host}:{port}/0"
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        with self.lock:
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name in (b"CLIENT", b"SELECT"):
+                return b"+OK\r\n"
+            if name == b"GET":
+                return _bulk(self._get(args[0]))
+            if name == b"MGET":
+                return b"*%d\r\n" % len(args) + b"".join(_bulk(self._get(key)) for key in args)
+            if name == b"SET":
+                key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+                if b"NX" in options and self._get(key) is not None:
+                    return b"$-1\r\n"
+                expires_at = None
+                if b"PX" in options:
+                    expires_at = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+                self.data[key] = (value, expires_at)
+                return b"+OK\r\n"
+            if name == b"DEL":
+                deleted = sum(self.data.pop(key, None) is not None for key in args)
+                return b":%d\r\n" % deleted
+        return b"-ERR unknown command '%s'\r\n" % name
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _resp_handler(standin: SharedCacheStandIn):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                # Clients send every command as an array of bulk strings
+                command = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    command.append(self.rfile.read(length + 2)[:-2])
+                self.wfile.write(standin.execute(command))
+                self.wfile.flush()
+
+    return Handler
+
+
+def _activity(id: int, title: str, category: str, minutes: int, level: str, moods: List[str]) -> dict:
+    return {
+        "id": id,
+        "title": title,
+        "description": f"{title}, a {minutes} minute {category.lower()} exercise.",
+        "category": category,
+        "duration_minutes": minutes,
+        "difficulty_level": level,
+        "instructions": ["Find a quiet place", "Follow the steps at your own pace", "Notice how you feel"],
+        "benefits": ["Calm", "Focus"],
+        "mood_tags": moods,
+        "icon_name": None,
+    }
+
+
+# selfcare_activities rows for runs without a database, spread over
+# categories, durations and the moods the scenarios ask for
+ACTIVITIES = [
+    _activity(1, "Box Breathing", "Breathing", 4, "beginner", ["anxious", "stressed"]),
+    _activity(2, "4-7-8 Breathing", "Breathing", 5, "beginner", ["anxious", "tired"]),
+    _activity(3, "Alternate Nostril Breathing", "Breathing", 10, "intermediate", ["stressed", "calm"]),
+    _activity(4, "Body Scan", "Mindfulness", 15, "beginner", ["anxious", "tired", "sad"]),
+    _activity(5, "Five Senses Grounding", "Mindfulness", 5, "beginner", ["anxious", "overwhelmed"]),
+    _activity(6, "Loving-Kindness Meditation", "Mindfulness", 20, "intermediate", ["sad", "lonely"]),
+    _activity(7, "Gentle Stretching", "Movement", 10, "beginner", ["tired", "stressed"]),
+    _activity(8, "Walk Outside", "Movement", 20, "beginner", ["sad", "happy"]),
+    _activity(9, "Yoga Flow", "Movement", 30, "advanced", ["calm", "happy"]),
+    _activity(10, "Gratitude List", "Journaling", 5, "beginner", ["sad", "happy"]),
+    _activity(11, "Worry Dump", "Journaling", 10, "beginner", ["anxious", "overwhelmed"]),
+    _activity(12, "Letter to Yourself", "Journaling", 25, "intermediate", ["lonely", "sad"]),
+]
+
+
+class DatabaseStandIn:
+    """Catalog, job queue and deletion jobs without Postgres, for the in-memory repositories"""
+
+    def __init__(self, activities: List[dict] = ACTIVITIES):
+        self.activities = activities
+        # user_id -> the user's latest account deletion
+        self.deletions: Dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self._running: Set[asyncio.Task] = set()
+        self._replaced: List[Tuple[Any, str, Any]] = []
+
+    def __enter__(self) -> "DatabaseStandIn":
+        # Read when the modules are imported, so set before importing them
+        os.environ["MIGRATE_ON_STARTUP"] = "0"
+        os.environ["MAINTENANCE_INTERVAL_SECONDS"] = "0"
+        os.environ["SIMILARITY_REFRESH_SECONDS"] = "0"
+        from app.libs import catalog, deletion, jobs, notifications
+
+        catalog.use_catalog(catalog.build_catalog(1, self.activities))
+        self._replace(jobs, enqueue=self.enqueue_job, start=lambda: None, stop=self.drain_jobs)
+        self._replace(
+            deletion,
+            enqueue_account=self.enqueue_account,
+            latest_job=self.latest_job,
+            start=lambda: None,
+            stop=self.drain_jobs,
+        )
+        self._replace(notifications, start=lambda: None, stop=self.drain_jobs, notify=self.skip_notify)
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in reversed(self._replaced):
+            setattr(module, name, original)
+        self._replaced.clear()
+
+    def _replace(self, module, **attributes):
+        for name, value in attributes.items():
+            self._replaced.append((module, name, getattr(module, name)))
+            setattr(module, name, value)
+
+    async def skip_notify(self, channel: str, payload: str, conn=None):
+        """No other process to tell"""
+
+    async def enqueue_job(self, job_type: str, payload: Optional[dict] = None, *, conn=None, delay: float = 0.0):
+        """Run the job's handler right away instead of queueing a row"""
+        from app.libs import jobs
+
+        job = jobs.Job(id=next(self._ids), type=job_type, payload=payload or {}, attempts=1)
+        task = asyncio.create_task(jobs._types[job_type].run(job))
+        self._running.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"job failed: {task.exception()!r}", file=sys.stderr)
+
+    async def drain_jobs(self):
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def enqueue_account(self, user_id: str) -> dict:
+        """A finished account deletion, announced like a real one"""
+        from app.libs.events import ACCOUNT_DELETED, Event, emit
+
+        now = datetime.now(timezone.utc)
+        job = {"id": next(self._ids), "kind": "account", "status": "done", "progress": {}, "created_at": now, "finished_at": now}
+        self.deletions[user_id] = job
+        await emit(Event(type=ACCOUNT_DELETED, user_id=user_id))
+        return job
+
+    async def latest_job(self, user_id: str, kind: str) -> Optional[dict]:
+        return self.deletions.get(user_id) if kind == "account" else None
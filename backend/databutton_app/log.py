@@ -0,0 +1,125 @@
+"""Structured JSON logging off the event loop.
+
+Log calls only put the record on a bounded queue; a background thread formats
+each record as one JSON object per line and writes it to stdout. When the
+queue is full, records are dropped and counted rather than blocking a
+request.
+
+Every record carries the id of the request it was logged from. Keyword
+``extra`` fields become top-level JSON keys. High-frequency events can be
+sampled by passing ``sample`` (a 0-1 rate) in ``extra``; kept records report
+the rate so counts can be scaled back up.
+
+Usage:
+
+    from databutton_app.log import get_logger
+
+    logger = get_logger(__name__)
+    logger.info("Catalog loaded", extra={"version": 3, "activities": 120})
+    logger.info("User authenticated", extra={"user_id": user.sub, "sample": 0.01})
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import traceback
+from datetime import datetime, timezone
+from typing import Optional
+
+from databutton_app import metrics
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+records_dropped = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a record with ``extra={"sample": rate}`` with that probability"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample", None)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Runs on the caller's thread: capture the context and leave all
+        # formatting to the listener thread
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Route the root logger through the queue to a JSON stdout writer; idempotent"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter())
+
+    handler = _QueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # Uvicorn's own loggers go through the same queue and format
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers[:] = []
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
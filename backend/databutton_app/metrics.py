@@ -0,0 +1,252 @@
+"""Process-wide metrics in the Prometheus text exposition format.
+
+Metrics are plain Python objects updated in place from the event loop, so
+recording is an attribute increment with no locks. Labelled children are
+created once per distinct label combination and reused, so the steady-state
+cost of a recording is one dict lookup on the label tuple.
+
+Values computed at scrape time, such as pool sizes, come from collectors:
+functions returning ``(name, type, help, samples)`` where ``samples`` is a
+list of ``(labels, value)`` pairs.
+
+Usage:
+
+    from databutton_app import metrics
+
+    cache_hits = metrics.counter("auth_token_cache_hits_total", "Tokens served from the cache")
+    cache_hits.inc()
+
+    latency = metrics.histogram("llm_time_to_first_token_seconds", "...", ["model"])
+    latency.labels("gpt-4o-mini").observe(0.42)
+"""
+
+import logging
+import math
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; counts are per bucket, not cumulative
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The child for one label combination, created on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for values, child in list(self._children.items()):
+            yield from self._render_child(values, child)
+
+    def _render_child(self, values, child) -> Iterable[str]:
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+    def dec(self, amount: float = 1):
+        self._default.value -= amount
+
+    def set(self, value: float):
+        self._default.value = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def totals(self) -> Tuple[int, float]:
+        """Observation count and sum across all label combinations"""
+        children = list(self._children.values())
+        return sum(c.count for c in children), sum(c.sum for c in children)
+
+    def _render_child(self, values, child) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Modules can be re-imported (e.g. by the API loader); keep one instance
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} is already registered differently")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning("Metrics collector failed", extra={"collector": getattr(collector, "__name__", repr(collector)), "error": str(e)})
+                continue
+            for name, type_, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def register_collector(collector: Collector):
+    REGISTRY.register_collector(collector)
+
+
+def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Serve all metrics; requires METRICS_TOKEN as a bearer token when it is set"""
+    token: Optional[str] = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
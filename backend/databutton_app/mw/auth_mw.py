@@ -1,4 +1,6 @@
 import functools
+import time
+from collections import OrderedDict
 from http import HTTPStatus
 from typing import Annotated, Callable
 import jwt
@@ -8,6 +10,14 @@ from jwt import PyJWKClient
 from pydantic import BaseModel
 from starlette.requests import Request
 
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+# Successful authentications happen on most requests; log a sample of them
+AUTH_LOG_SAMPLE_RATE = 0.01
+
 
 class AuthConfig(BaseModel):
     jwks_url: str
@@ -46,9 +56,19 @@ def get_audit_log(request: HTTPConnection) -> Callable[[str], None] | None:
 AuditLogDep = Annotated[Callable[[str], None] | None, Depends(get_audit_log)]
 
 
+# Scope key under which in-process sub-requests (see the batch API) carry the
+# user already authenticated by their parent request. ASGI scopes are built by
+# the server, so clients cannot set it.
+AUTHORIZED_USER_SCOPE_KEY = "databutton.authorized_user"
+
+
 def get_authorized_user(
     request: HTTPConnection,
 ) -> User:
+    user = request.scope.get(AUTHORIZED_USER_SCOPE_KEY)
+    if isinstance(user, User):
+        return user
+
     auth_config = get_auth_config(request)
 
     try:
@@ -61,9 +81,9 @@ def get_authorized_user(
 
         if user is not None:
             return user
-        print("Request authentication returned no user")
+        logger.info("Request authentication returned no user")
     except Exception as e:
-        print(f"Request authentication failed: {e}")
+        logger.warning("Request authentication failed", extra={"error": str(e)})
 
     if isinstance(request, WebSocket):
         raise WebSocketException(
@@ -111,7 +131,7 @@ def authorize_websocket(
             break
 
     if not token:
-        print(f"Missing bearer {prefix}.<token> in protocols")
+        logger.info(f"Missing bearer {prefix}.<token> in protocols")
         return None
 
     return authorize_token(token, auth_config)
@@ -123,21 +143,55 @@ def authorize_request(
 ) -> User | None:
     auth_header = request.headers.get(auth_config.header)
     if not auth_header:
-        print(f"Missing header '{auth_config.header}'")
+        logger.info("Missing auth header", extra={"header": auth_config.header})
         return None
 
     token = auth_header.startswith("Bearer ") and auth_header[7:]
     if not token:
-        print(f"Missing bearer token in '{auth_config.header}'")
+        logger.info("Missing bearer token", extra={"header": auth_config.header})
         return None
 
     return authorize_token(token, auth_config)
 
 
+# Verified tokens, so a client's repeated calls skip signature verification.
+# Entries are dropped when the token expires, or earlier if the cache is full.
+TOKEN_CACHE_MAX_ENTRIES = 10_000
+_token_cache: "OrderedDict[str, tuple[User, float]]" = OrderedDict()
+
+token_cache_hits = metrics.counter(
+    "auth_token_cache_hits_total", "Bearer tokens authorized from the verified-token cache"
+)
+token_cache_misses = metrics.counter(
+    "auth_token_cache_misses_total", "Bearer tokens that needed signature verification"
+)
+
+
 def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    cached = _token_cache.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            token_cache_hits.inc()
+            return cached[0]
+        _token_cache.pop(token, None)
+    token_cache_misses.inc()
+
+    user, expires_at = verify_token(token, auth_config)
+    if user is not None and expires_at is not None:
+        _token_cache[token] = (user, expires_at)
+        while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+    return user
+
+
+def verify_token(
+    token: str,
+    auth_config: AuthConfig,
+) -> tuple[User | None, float | None]:
+    """Verify the token's signature and claims, returning the user and expiry"""
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -146,7 +200,7 @@ def authorize_token(
         try:
             key, alg = get_signing_key(jwks_url, token)
         except Exception as e:
-            print(f"Failed to get signing key {e}")
+            logger.warning("Failed to get signing key", extra={"error": str(e)})
             continue
 
         try:
@@ -157,13 +211,13 @@ def authorize_token(
                 audience=audience,
             )
         except jwt.PyJWTError as e:
-            print(f"Failed to decode and validate token {e}")
+            logger.info("Failed to decode and validate token", extra={"error": str(e)})
             continue
 
     try:
         user = User.model_validate(payload)
-        print(f"User {user.sub} authenticated")
-        return user
+        logger.info("User authenticated", extra={"user_id": user.sub, "sample": AUTH_LOG_SAMPLE_RATE})
+        return user, payload.get("exp")
     except Exception as e:
-        print(f"Failed to parse token payload {e}")
-        return None
+        logger.info("Failed to parse token payload", extra={"error": str(e)})
+        return None, None
@@ -0,0 +1,263 @@
+"""ASGI middleware compressing JSON and text responses.
+
+Picks Brotli, zstd or gzip from the request's Accept-Encoding (Brotli and
+zstd only when their packages are installed) and compresses complete
+responses of at least ``minimum_size`` bytes. Responses are only ever
+buffered when the app sends them in one piece: a streaming response's first
+chunk arrives with ``more_body`` set and the whole stream is passed through
+untouched. Routes tagged ``"stream"`` and paths in ``exclude_paths`` are
+never compressed.
+
+Compression ratio and CPU time per encoding are kept in ``compression_stats``,
+exported on /metrics and logged every ``REPORT_EVERY`` compressed responses.
+
+Usage:
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+"""
+
+import gzip
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from databutton_app import metrics
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+# Quality 4-5 is where Brotli beats gzip's ratio at a similar CPU cost;
+# higher levels are meant for static assets compressed ahead of time
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# Route tag marking endpoints whose responses must never be buffered
+STREAM_TAG = "stream"
+REPORT_EVERY = 1000
+
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors: Dict[str, Callable[[bytes], bytes]] = {}
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+    if zstandard is not None:
+        zstd = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        compressors["zstd"] = zstd.compress
+    compressors["gzip"] = lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return compressors
+
+
+@dataclass
+class EncodingStats:
+    responses: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """Uncompressed over compressed size"""
+        return self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+
+
+@dataclass
+class CompressionStats:
+    encodings: Dict[str, EncodingStats] = field(default_factory=dict)
+    # Eligible responses sent uncompressed, by reason
+    skipped: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, seconds: float):
+        stats = self.encodings.setdefault(encoding, EncodingStats())
+        stats.responses += 1
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+        stats.seconds += seconds
+
+    def skip(self, reason: str):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def summary(self) -> str:
+        parts = [
+            f"{name}: {s.responses} responses, {s.bytes_in} -> {s.bytes_out} bytes "
+            f"(ratio {s.ratio:.2f}, {s.seconds * 1000:.1f} ms CPU)"
+            for name, s in self.encodings.items()
+        ]
+        skipped = ", ".join(f"{reason}={count}" for reason, count in self.skipped.items())
+        return "; ".join(parts) + (f"; skipped {skipped}" if skipped else "")
+
+
+compression_stats = CompressionStats()
+
+
+def compression_metrics():
+    encodings = list(compression_stats.encodings.items())
+    return [
+        ("http_compression_responses_total", "counter", "Responses compressed, by encoding",
+         [({"encoding": name}, s.responses) for name, s in encodings]),
+        ("http_compression_bytes_in_total", "counter", "Bytes before compression, by encoding",
+         [({"encoding": name}, s.bytes_in) for name, s in encodings]),
+        ("http_compression_bytes_out_total", "counter", "Bytes after compression, by encoding",
+         [({"encoding": name}, s.bytes_out) for name, s in encodings]),
+        ("http_compression_seconds_total", "counter", "Time spent compressing, by encoding",
+         [({"encoding": name}, s.seconds) for name, s in encodings]),
+        ("http_compression_skipped_total", "counter", "Eligible responses sent uncompressed, by reason",
+         [({"reason": reason}, count) for reason, count in compression_stats.skipped.items()]),
+    ]
+
+
+metrics.register_collector(compression_metrics)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """The first available coding the client accepts, in server preference order"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    for coding in available:
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        exclude_paths: Iterable[str] = (),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.exclude_paths = frozenset(exclude_paths)
+        self.compressors = _compressors()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"), self.compressors)
+        responder = _CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Holds back the response start until the first body chunk shows whether
+    the response is complete and worth compressing"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, send: Send, encoding: Optional[str]):
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if self.passthrough:
+            await self.downstream(message)
+            return
+
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.downstream(message)
+            return
+
+        start, self.start = self.start, None
+        self.passthrough = True
+        body = message.get("body", b"")
+        headers = MutableHeaders(raw=list(start["headers"]))
+
+        skip = self.skip_reason(start, headers, message, body)
+        if skip is not None:
+            if skip not in ("status", "content_type", "encoded"):
+                headers.add_vary_header("Accept-Encoding")
+                compression_stats.skip(skip)
+            start["headers"] = headers.raw
+            await self.downstream(start)
+            await self.downstream(message)
+            return
+
+        started = time.perf_counter()
+        compressed = self.middleware.compressors[self.encoding](body)
+        elapsed = time.perf_counter() - started
+        compression_stats.record(self.encoding, len(body), len(compressed), elapsed)
+        if sum(s.responses for s in compression_stats.encodings.values()) % REPORT_EVERY == 0:
+            logger.info("Response compression", extra={"summary": compression_stats.summary()})
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        # The compressed bytes differ from the uncompressed ones, so a strong
+        # validator may only be reused as a weak one
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        start["headers"] = headers.raw
+        await self.downstream(start)
+        await self.downstream({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    def skip_reason(self, start: Message, headers: MutableHeaders, message: Message, body: bytes) -> Optional[str]:
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return "status"
+        if "content-encoding" in headers:
+            return "encoded"
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return "content_type"
+        if message.get("more_body", False):
+            return "streaming"
+        route = self.scope.get("route")
+        if STREAM_TAG in (getattr(route, "tags", None) or ()):
+            return "stream_route"
+        if "no-transform" in headers.get("cache-control", ""):
+            return "no_transform"
+        if self.encoding is None:
+            return "not_accepted"
+        if len(body) < self.middleware.minimum_size:
+            return "too_small"
+        return None
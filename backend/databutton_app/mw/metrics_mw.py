@@ -0,0 +1,68 @@
+"""ASGI middleware recording request latency and in-flight requests.
+
+Latency is labelled by method, route template (``/routes/journal/{entry_id}``
+rather than the concrete path, to keep label cardinality bounded) and status
+code, and measured until the last body chunk is sent, so streamed responses
+count their full duration.
+
+Usage:
+
+    app.add_middleware(MetricsMiddleware)
+"""
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from databutton_app import metrics
+
+# Label for requests that matched no route, e.g. 404s from scanners
+UNMATCHED_ROUTE = "unmatched"
+
+request_latency = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ["method", "route", "status"],
+)
+requests_in_flight = metrics.gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+)
+
+
+def route_template(scope: Scope) -> str:
+    """The matched route's path template, including router prefixes"""
+    # Newer FastAPI versions keep included routes unprefixed and record the
+    # effective, prefixed route separately
+    effective = (scope.get("fastapi") or {}).get("effective_route_context")
+    route = effective if effective is not None else scope.get("route")
+    return getattr(route, "path_format", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            request_latency.labels(
+                scope["method"], route_template(scope), str(status)
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,47 @@
+"""ASGI middleware assigning each request an id for log correlation.
+
+The id is taken from the incoming ``X-Request-ID`` header when it looks sane,
+otherwise generated, made available to log records through
+``databutton_app.log.request_id_var`` and echoed in the response. Requests
+dispatched in-process by another request (see the batch API) keep their
+parent's id.
+
+Usage:
+
+    app.add_middleware(RequestIdMiddleware)
+"""
+
+import re
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from databutton_app.log import request_id_var
+
+HEADER = "X-Request-ID"
+_VALID_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestIdMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or request_id_var.get() is not None:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get(HEADER)
+        request_id = incoming if incoming and _VALID_ID.match(incoming) else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(HEADER, request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
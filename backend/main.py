@@ -1,12 +1,26 @@
 import os
 import pathlib
 import json
+from contextlib import asynccontextmanager
 import dotenv
 from fastapi import FastAPI, APIRouter, Depends
 
 dotenv.load_dotenv()
 
+from databutton_app.log import configure_logging, get_logger, shutdown_logging
+
+configure_logging()
+logger = get_logger(__name__)
+
 from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user
+from databutton_app.mw.compression_mw import CompressionMiddleware
+from databutton_app.mw.metrics_mw import MetricsMiddleware
+from databutton_app.mw.request_id_mw import RequestIdMiddleware
+from databutton_app.metrics import metrics_endpoint
+from app.libs import cache, deletion, jobs, notifications, recommendations, retention
+from app.libs.database import close_pool
+from app.libs.query_trace import QueryTraceMiddleware
+from migrations import MIGRATE_ON_STARTUP, migrate_database
 
 
 def get_router_config() -> dict:
@@ -41,7 +55,7 @@ def import_api_routers() -> APIRouter:
     api_module_prefix = "app.apis."
 
     for name in api_names:
-        print(f"Importing API: {name}")
+        logger.info("Importing API", extra={"api": name})
         try:
             api_module = __import__(api_module_prefix + name, fromlist=[name])
             api_router = getattr(api_module, "router", None)
@@ -55,10 +69,10 @@ def import_api_routers() -> APIRouter:
                     ),
                 )
         except Exception as e:
-            print(e)
+            logger.error("Failed to import API", extra={"api": name, "error": repr(e)})
             continue
 
-    print(routes.routes)
+    logger.debug("Registered API routes", extra={"routes": len(routes.routes)})
 
     return routes
 
@@ -74,23 +88,59 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        # Local development only; deployments migrate before starting workers.
+        # Before the first request opens the pool, so new connections prepare
+        # their statements against the migrated schema
+        await migrate_database()
+    notifications.start()
+    retention.start()
+    deletion.start()
+    jobs.start()
+    recommendations.start()
+    yield
+    # Drains running jobs while the pool is still open
+    await jobs.stop()
+    await recommendations.stop()
+    await deletion.stop()
+    await retention.stop()
+    await notifications.stop()
+    await cache.close()
+    await close_pool()
+    shutdown_logging()
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(import_api_routers())
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
+        # Streamed chat replies must reach the client token by token
+        exclude_paths={"/routes/send-message"},
+    )
+    app.add_middleware(QueryTraceMiddleware)
+    # Outermost, so it times compression and tracing too
+    app.add_middleware(MetricsMiddleware)
+    # Added last so every log line of a request, including the above, has its id
+    app.add_middleware(RequestIdMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
 
     for route in app.routes:
         if hasattr(route, "methods"):
             for method in route.methods:
-                print(f"{method} {route.path}")
+                logger.debug("Route", extra={"method": method, "path": route.path})
 
     firebase_config = get_firebase_config()
 
     if firebase_config is None:
-        print("No firebase config found")
+        logger.info("No firebase config found")
         app.state.auth_config = None
     else:
-        print("Firebase config found")
+        logger.info("Firebase config found")
         auth_config = {
             "jwks_url": "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
             "audience": firebase_config["projectId"],
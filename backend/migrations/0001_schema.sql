@@ -0,0 +1,123 @@
+-- Tables the routers and libs read and write. Everything is IF NOT EXISTS so
+-- databases created before migrations existed are adopted as they are.
+
+CREATE TABLE IF NOT EXISTS mood_entries (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    mood TEXT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS mood_logs (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    mood TEXT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS journal_entries (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    mood_emoji TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    message_text TEXT NOT NULL,
+    message_type TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS selfcare_activities (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    duration_minutes INTEGER NOT NULL,
+    difficulty_level TEXT NOT NULL,
+    instructions JSONB NOT NULL DEFAULT '[]',
+    benefits TEXT[] NOT NULL DEFAULT '{}',
+    mood_tags TEXT[] NOT NULL DEFAULT '{}',
+    icon_name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS user_activity_completions (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    activity_id INTEGER NOT NULL REFERENCES selfcare_activities (id),
+    rating INTEGER,
+    notes TEXT,
+    completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Idempotency keys for completions: a retried request with the same key is
+-- recorded once
+ALTER TABLE user_activity_completions ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS user_activity_completions_idempotency_key
+    ON user_activity_completions (user_id, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS user_activity_progress (
+    id SERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    activity_id INTEGER NOT NULL REFERENCES selfcare_activities (id),
+    total_completions INTEGER NOT NULL DEFAULT 0,
+    last_completed_at TIMESTAMPTZ,
+    is_favorite BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (user_id, activity_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_achievements (
+    user_id TEXT NOT NULL,
+    achievement_id TEXT NOT NULL,
+    unlocked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, achievement_id)
+);
+
+-- Materialized counters, see app.libs.user_stats
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    completions INTEGER NOT NULL DEFAULT 0,
+    activities_tried INTEGER NOT NULL DEFAULT 0,
+    journal_entries INTEGER NOT NULL DEFAULT 0,
+    favorites INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Day bitmaps for streaks, see app.libs.streaks
+CREATE TABLE IF NOT EXISTS user_activity_days (
+    user_id TEXT PRIMARY KEY,
+    timezone TEXT NOT NULL DEFAULT 'UTC',
+    days BYTEA NOT NULL DEFAULT ''::bytea,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Catalog version, bumped and announced on every change to the activities,
+-- see app.libs.catalog
+CREATE TABLE IF NOT EXISTS selfcare_catalog_meta (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1
+);
+INSERT INTO selfcare_catalog_meta (id, version) VALUES (TRUE, 1) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_selfcare_catalog_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE selfcare_catalog_meta SET version = version + 1 RETURNING version INTO new_version;
+    PERFORM pg_notify('selfcare_catalog', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER selfcare_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON selfcare_activities
+FOR EACH STATEMENT EXECUTE FUNCTION bump_selfcare_catalog_version();
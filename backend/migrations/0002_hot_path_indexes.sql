@@ -0,0 +1,28 @@
+-- migrate: no-transaction
+-- Indexes behind the per-user reads on the request path. Built CONCURRENTLY so
+-- writes to existing tables are not blocked while they build; each statement
+-- runs on its own.
+
+-- moods.history, moods.latest
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mood_entries_user_created
+    ON mood_entries (user_id, created_at DESC);
+
+-- Written by the tracker and read back per user, like mood_entries
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mood_logs_user_created
+    ON mood_logs (user_id, created_at DESC);
+
+-- journal.list orders by last edit; get/update/delete go through the primary key
+CREATE INDEX CONCURRENTLY IF NOT EXISTS journal_entries_user_updated
+    ON journal_entries (user_id, updated_at DESC);
+
+-- chat.history, chat.clear
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_messages_user_created
+    ON chat_messages (user_id, created_at);
+
+-- activities.window_stats, activities.recent_completions, streak backfill
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_activity_completions_user_completed
+    ON user_activity_completions (user_id, completed_at DESC);
+
+-- activities.history averages ratings per activity from the index alone
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_activity_completions_user_activity
+    ON user_activity_completions (user_id, activity_id) INCLUDE (rating);
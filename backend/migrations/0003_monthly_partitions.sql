@@ -0,0 +1,118 @@
+-- Monthly range partitions for the tables that only grow: chat_messages and
+-- mood_entries by created_at, user_activity_completions by completed_at.
+-- Old months are detached and archived or dropped by app.libs.retention
+-- instead of deleting rows. Existing rows are copied into the new tables, so
+-- this holds their locks for the length of the copy.
+
+-- Creates the partition holding the month of `month` (UTC), moving any rows
+-- for that month out of the default partition first. Returns its name.
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, month DATE) RETURNS TEXT AS $$
+DECLARE
+    lower_bound TIMESTAMPTZ := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    upper_bound TIMESTAMPTZ := (date_trunc('month', month::timestamp) + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    partition TEXT := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+    key TEXT;
+    misplaced BOOLEAN;
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN partition;
+    END IF;
+
+    SELECT a.attname INTO key
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = parent::regclass;
+
+    IF to_regclass(parent || '_default') IS NOT NULL THEN
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+            parent || '_default', key, lower_bound, key, upper_bound) INTO misplaced;
+    END IF;
+
+    IF misplaced THEN
+        -- Attaching over rows still in the default partition would fail
+        EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition, parent);
+        EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+            parent || '_default', key, lower_bound, key, upper_bound, partition);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            parent, partition, lower_bound, upper_bound);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            partition, parent, lower_bound, upper_bound);
+    END IF;
+    RETURN partition;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuilds a table as a partitioned one with the same columns and defaults,
+-- partitions for every month it has rows in plus the next three, and a
+-- default partition so an insert never fails for want of a partition.
+-- Constraints and indexes are added back by the caller.
+CREATE FUNCTION partition_by_month(parent TEXT, key TEXT) RETURNS VOID AS $$
+DECLARE
+    old TEXT := parent || '_unpartitioned';
+    first_month DATE;
+    month DATE;
+BEGIN
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, old);
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (%I)', parent, old, key);
+
+    EXECUTE format('SELECT date_trunc(''month'', MIN(%I) AT TIME ZONE ''UTC'')::date FROM %I', key, old) INTO first_month;
+    FOR month IN
+        SELECT generate_series(
+            COALESCE(first_month, date_trunc('month', NOW() AT TIME ZONE 'UTC')::date),
+            date_trunc('month', NOW() AT TIME ZONE 'UTC')::date + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        PERFORM create_monthly_partition(parent, month);
+    END LOOP;
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', parent || '_default', parent);
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, old);
+    -- The id sequence belongs to the old table and would be dropped with it
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', pg_get_serial_sequence(old, 'id'), parent);
+    EXECUTE format('DROP TABLE %I', old);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT partition_by_month('chat_messages', 'created_at');
+ALTER TABLE chat_messages ADD PRIMARY KEY (id, created_at);
+CREATE INDEX chat_messages_user_created ON chat_messages (user_id, created_at);
+
+SELECT partition_by_month('mood_entries', 'created_at');
+ALTER TABLE mood_entries ADD PRIMARY KEY (id, created_at);
+CREATE INDEX mood_entries_user_created ON mood_entries (user_id, created_at DESC);
+
+-- A unique index on a partitioned table has to include the partition key,
+-- which would let a retry at a later time through; idempotency keys move to
+-- a table of their own
+CREATE TABLE user_activity_completion_keys (
+    user_id TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, idempotency_key)
+);
+CREATE INDEX user_activity_completion_keys_created ON user_activity_completion_keys (created_at);
+INSERT INTO user_activity_completion_keys (user_id, idempotency_key, created_at)
+SELECT user_id, idempotency_key, MIN(completed_at)
+FROM user_activity_completions
+WHERE idempotency_key IS NOT NULL
+GROUP BY user_id, idempotency_key;
+
+SELECT partition_by_month('user_activity_completions', 'completed_at');
+ALTER TABLE user_activity_completions ADD PRIMARY KEY (id, completed_at);
+ALTER TABLE user_activity_completions ADD FOREIGN KEY (activity_id) REFERENCES selfcare_activities (id);
+CREATE INDEX user_activity_completions_user_completed ON user_activity_completions (user_id, completed_at DESC);
+CREATE INDEX user_activity_completions_user_activity ON user_activity_completions (user_id, activity_id) INCLUDE (rating);
+
+DROP FUNCTION partition_by_month(TEXT, TEXT);
+
+-- Cleared chat histories: reads hide messages up to cleared_at at once, and
+-- the rows are deleted in batches in the background up to purged_through
+CREATE TABLE chat_history_clears (
+    user_id TEXT PRIMARY KEY,
+    cleared_at TIMESTAMPTZ NOT NULL,
+    purged_through TIMESTAMPTZ
+);
+
+CREATE SCHEMA IF NOT EXISTS archive;
@@ -0,0 +1,30 @@
+-- Background deletion of a user's data, see app.libs.deletion. A job is
+-- claimed by one worker at a time; the heartbeat lets another worker take
+-- over a job whose worker died, and progress counts rows deleted per table.
+CREATE TABLE deletion_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('account', 'chat_history')),
+    -- chat_history: messages created up to this time
+    through TIMESTAMPTZ,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    progress JSONB NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX deletion_jobs_open ON deletion_jobs (created_at) WHERE status IN ('pending', 'running');
+CREATE INDEX deletion_jobs_user_created ON deletion_jobs (user_id, created_at DESC);
+
+-- Purges are tracked by their jobs now; clears that were never purged
+-- become jobs
+INSERT INTO deletion_jobs (user_id, kind, through)
+SELECT user_id, 'chat_history', cleared_at
+FROM chat_history_clears
+WHERE purged_through IS DISTINCT FROM cleared_at;
+
+ALTER TABLE chat_history_clears DROP COLUMN purged_through;
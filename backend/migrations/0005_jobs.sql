@@ -0,0 +1,17 @@
+-- Outbox of deferred work, see app.libs.jobs. A pending job runs once
+-- run_at has passed; a claimed job is 'running' with run_at pushed out by
+-- its lease, so a job whose process died becomes claimable again when the
+-- lease runs out. Finished jobs are deleted; failed ones stay for
+-- inspection.
+CREATE TABLE jobs (
+    id BIGSERIAL PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'failed')),
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX jobs_due ON jobs (type, run_at) WHERE status IN ('pending', 'running');
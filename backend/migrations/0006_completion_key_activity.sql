@@ -0,0 +1,9 @@
+-- A replayed idempotency key is only a replay when it names the same
+-- activity; the key remembers which one it was first used for, so reuse for
+-- another activity can be rejected instead of reported as already recorded.
+-- Keys from before this migration take the activity of their completion.
+ALTER TABLE user_activity_completion_keys ADD COLUMN activity_id INTEGER;
+UPDATE user_activity_completion_keys k
+SET activity_id = c.activity_id
+FROM user_activity_completions c
+WHERE c.user_id = k.user_id AND c.idempotency_key = k.idempotency_key;
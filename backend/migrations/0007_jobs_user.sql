@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Account deletion clears a user's queued jobs first (see app.libs.deletion),
+-- finding them by the user_id in their payload. Built CONCURRENTLY so the
+-- job runners are not blocked while it builds.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS jobs_user
+    ON jobs ((payload ->> 'user_id'));
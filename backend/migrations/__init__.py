@@ -0,0 +1,150 @@
+"""Versioned schema migrations for the app database.
+
+Each ``NNNN_name.sql`` file in this directory is one migration, applied once
+in version order and recorded in ``schema_migrations``. A migration runs in a
+transaction unless its first line is ``-- migrate: no-transaction``; those
+run statement by statement, which ``CREATE INDEX CONCURRENTLY`` needs. An
+advisory lock keeps several processes starting at once from racing.
+
+Run ``python -m migrations`` as a deploy step, once, before starting the
+app workers. Some migrations rewrite large tables under locks, so workers do
+not migrate on boot; ``MIGRATE_ON_STARTUP=1`` makes the app apply pending
+migrations from its lifespan, for local development only.
+
+Usage:
+
+    python -m migrations                  # apply pending migrations
+    python -m migrations --check          # then EXPLAIN every registered statement
+
+    from migrations import migrate_database
+
+    applied = await migrate_database()
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import asyncpg
+
+from app.libs.database import database_url
+from databutton_app.log import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "0") == "1"
+# pg_advisory_lock key shared by every process that migrates this database
+ADVISORY_LOCK_KEY = 0x6D696772
+
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+FILENAME_PATTERN = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+RECORD_MIGRATION = "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)"
+
+INVALID_INDEXES_QUERY = """
+    SELECT c.relname
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE NOT i.indisvalid AND n.nspname = current_schema()
+"""
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode()).hexdigest()
+
+    def statements(self) -> List[str]:
+        """Split on statement-ending semicolons, for no-transaction migrations"""
+        # Comments are dropped first so a semicolon inside one cannot split
+        body = "\n".join(line for line in self.sql.splitlines() if not line.lstrip().startswith("--"))
+        return [part.strip() for part in re.split(r";\s*$", body, flags=re.MULTILINE) if part.strip()]
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """All migrations in the directory, in version order"""
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = FILENAME_PATTERN.match(path.name)
+        if match is None:
+            raise ValueError(f"Migration file {path.name} does not match NNNN_name.sql")
+        migrations.append(Migration(version=int(match.group(1)), name=match.group(2), sql=path.read_text()))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+async def _apply(conn: asyncpg.Connection, migration: Migration):
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute(RECORD_MIGRATION, migration.version, migration.name, migration.checksum)
+        return
+
+    for statement in migration.statements():
+        await conn.execute(statement)
+    # A failed concurrent build leaves an invalid index that IF NOT EXISTS
+    # would then skip forever; stop before recording the migration as done
+    invalid = [row["relname"] for row in await conn.fetch(INVALID_INDEXES_QUERY)]
+    if invalid:
+        raise RuntimeError(f"Migration {migration.version} left invalid indexes {invalid}; drop them and migrate again")
+    await conn.execute(RECORD_MIGRATION, migration.version, migration.name, migration.checksum)
+
+
+async def migrate(conn: asyncpg.Connection, migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    """Apply pending migrations on the connection; returns the ones applied"""
+    migrations = discover() if migrations is None else migrations
+    await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_KEY)
+    try:
+        await conn.execute(HISTORY_SCHEMA)
+        applied = {row["version"]: row["checksum"] for row in await conn.fetch("SELECT version, checksum FROM schema_migrations")}
+        done = []
+        for migration in migrations:
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    logger.warning(
+                        "Applied migration was edited afterwards",
+                        extra={"version": migration.version, "migration": migration.name},
+                    )
+                continue
+            logger.info("Applying migration", extra={"version": migration.version, "migration": migration.name})
+            await _apply(conn, migration)
+            done.append(migration)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_KEY)
+
+
+async def migrate_database(url: Optional[str] = None) -> List[Migration]:
+    """Apply pending migrations over a dedicated connection, outside the pool"""
+    # Its own connection, so the pool's connections open on the migrated
+    # schema and prepare every registered statement
+    conn = await asyncpg.connect(url or database_url())
+    try:
+        return await migrate(conn)
+    finally:
+        await conn.close()
@@ -0,0 +1,45 @@
+"""Apply pending migrations, optionally followed by the EXPLAIN check.
+
+    python -m migrations [--database-url URL] [--check]
+
+Exits non-zero when ``--check`` finds a registered statement that scans a
+per-user table sequentially.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+import asyncpg
+
+from app.libs import statements
+from app.libs.database import database_url
+from migrations import migrate
+from migrations.check import check_statements
+
+
+async def main(url: str, check: bool) -> int:
+    conn = await asyncpg.connect(url)
+    try:
+        applied = await migrate(conn)
+        print(f"applied {len(applied)} migration(s)" + "".join(f"\n  {m.version:04d} {m.name}" for m in applied))
+        if not check:
+            return 0
+
+        findings = await check_statements(conn)
+        for finding in findings:
+            print(f"SEQ SCAN {finding.statement}: {', '.join(finding.tables)}")
+            print(json.dumps(finding.plan, indent=2))
+        print(f"checked {len(statements.registered())} statements, {len(findings)} with sequential scans of per-user tables")
+        return 1 if findings else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Defaults to the DATABASE_URL_DEV secret")
+    parser.add_argument("--check", action="store_true", help="EXPLAIN every registered statement after migrating")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.database_url or database_url(), args.check)))
@@ -0,0 +1,107 @@
+"""EXPLAIN every registered statement and flag sequential scans of per-user tables.
+
+Each statement is planned as a generic plan, the way a prepared statement is
+planned for any user, with sequential scans disabled. The planner then only
+falls back to a sequential scan when no index can serve the query, so a
+``Seq Scan`` on a table with a ``user_id`` column, or on any other table
+account deletion clears per user, means the index pack is missing something
+the statement needs. Nothing is executed.
+
+Usage:
+
+    python -m migrations --check
+
+    from migrations.check import check_statements
+
+    findings = await check_statements(conn)
+"""
+
+import importlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Set
+
+import asyncpg
+
+from app.libs import deletion, statements
+
+# Every module whose import registers statements
+STATEMENT_MODULES = (
+    "app.libs.deletion",
+    "app.libs.jobs",
+    "app.libs.recommendations",
+    "app.libs.repositories.postgres",
+    "app.libs.streaks",
+    "app.libs.user_stats",
+)
+
+# Statement name -> why it may scan a per-user table on purpose
+ALLOWED_SEQ_SCANS: Dict[str, str] = {
+    "recommendations.interactions": "Background rebuild of the similarity model, which aggregates every user's completions",
+}
+
+PER_USER_TABLES_QUERY = """
+    SELECT table_name
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND column_name = 'user_id'
+"""
+
+PARAMETER_PATTERN = re.compile(r"\$(\d+)")
+
+
+@dataclass
+class Finding:
+    statement: str
+    tables: List[str]
+    plan: dict
+
+
+def _seq_scans(node: dict) -> Set[str]:
+    tables = set()
+    if node.get("Node Type") == "Seq Scan":
+        tables.add(node["Relation Name"])
+    for child in node.get("Plans", []):
+        tables |= _seq_scans(child)
+    return tables
+
+
+async def explain(conn: asyncpg.Connection, sql: str) -> dict:
+    """The generic plan of a statement, with sequential scans disabled"""
+    parameters = max((int(n) for n in PARAMETER_PATTERN.findall(sql)), default=0)
+    prepared = False
+    tx = conn.transaction()
+    await tx.start()
+    try:
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        await conn.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        await conn.execute(f"PREPARE explain_check AS {sql}")
+        prepared = True
+        arguments = f"({', '.join(['NULL'] * parameters)})" if parameters else ""
+        # EXPLAIN without ANALYZE plans data-modifying statements without running them
+        plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON) EXECUTE explain_check{arguments}")
+    finally:
+        await tx.rollback()
+        # Prepared statements outlive the transaction
+        if prepared:
+            await conn.execute("DEALLOCATE explain_check")
+    return json.loads(plan)[0]["Plan"]
+
+
+async def check_statements(conn: asyncpg.Connection) -> List[Finding]:
+    """Sequential scans of per-user tables across all registered statements"""
+    for module in STATEMENT_MODULES:
+        importlib.import_module(module)
+    per_user = {row["table_name"] for row in await conn.fetch(PER_USER_TABLES_QUERY)}
+    # Tables like jobs that hold a user's rows without a user_id column
+    per_user.update(target.table for target in deletion.ACCOUNT_TARGETS)
+
+    findings = []
+    for statement in statements.registered():
+        if statement.name in ALLOWED_SEQ_SCANS:
+            continue
+        plan = await explain(conn, statement.sql)
+        scanned = sorted(_seq_scans(plan) & per_user)
+        if scanned:
+            findings.append(Finding(statement=statement.name, tables=scanned, plan=plan))
+    return findings
@@ -2,4 +2,5 @@
 
 source .venv/bin/activate
 
-uvicorn main:app --reload 
+# Local development only; deployments run `python -m migrations` first
+MIGRATE_ON_STARTUP=1 uvicorn main:app --reload 
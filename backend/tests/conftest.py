@@ -0,0 +1,52 @@
+"""Fixtures for tests that run on the in-memory repositories, without Postgres."""
+
+from typing import List
+
+import pytest
+
+from app.libs import catalog, jobs
+from app.libs.repositories import memory_repositories, set_repositories
+
+
+def activity_row(id: int, category: str = "Breathing", moods: List[str] = ("anxious",)) -> dict:
+    """A ``selfcare_activities`` row as ``build_catalog`` reads it"""
+    return {
+        "id": id,
+        "title": f"Activity {id}",
+        "description": "",
+        "category": category,
+        "duration_minutes": 5,
+        "difficulty_level": "beginner",
+        "instructions": [],
+        "benefits": [],
+        "mood_tags": list(moods),
+        "icon_name": None,
+    }
+
+
+@pytest.fixture
+def repos():
+    repositories = memory_repositories()
+    set_repositories(repositories)
+    yield repositories
+    set_repositories(None)
+
+
+@pytest.fixture
+def queued_jobs(monkeypatch) -> List[tuple]:
+    """Jobs enqueued during the test, as (type, payload), instead of queueing rows"""
+    queued = []
+
+    async def enqueue(job_type, payload=None, *, conn=None, delay=0.0):
+        queued.append((job_type, payload))
+
+    monkeypatch.setattr(jobs, "enqueue", enqueue)
+    return queued
+
+
+@pytest.fixture
+def pinned_catalog(monkeypatch) -> catalog.Catalog:
+    pinned = catalog.build_catalog(1, [activity_row(id) for id in (1, 2, 3)])
+    monkeypatch.setattr(catalog, "_catalog", pinned)
+    monkeypatch.setattr(catalog, "_pinned", True)
+    return pinned
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.apis.selfcare import ActivityCompletion, complete_activity
+from app.auth import User
+from app.libs import achievements  # noqa: F401  registers the durable subscribers
+from app.libs.events import ACTIVITY_COMPLETED, DELIVER_JOB, FAVORITE_TOGGLED
+
+
+def recorded_events(queued_jobs):
+    return [payload["type"] for job_type, payload in queued_jobs if job_type == DELIVER_JOB]
+
+
+def test_completion_replay_is_not_recorded_twice(repos, queued_jobs):
+    first = asyncio.run(repos.activities.complete("u1", 1, idempotency_key="k1"))
+    replay = asyncio.run(repos.activities.complete("u1", 1, idempotency_key="k1"))
+
+    assert first.recorded and not first.conflict
+    assert not replay.recorded and not replay.conflict
+    assert replay.progress["total_completions"] == 1
+    assert asyncio.run(repos.stats.get("u1"))["completions"] == 1
+    assert recorded_events(queued_jobs) == [ACTIVITY_COMPLETED]
+
+
+def test_completion_key_reused_for_another_activity_conflicts(repos, queued_jobs):
+    asyncio.run(repos.activities.complete("u1", 1, idempotency_key="k1"))
+    reused = asyncio.run(repos.activities.complete("u1", 2, idempotency_key="k1"))
+
+    assert not reused.recorded and reused.conflict
+    assert asyncio.run(repos.stats.get("u1"))["completions"] == 1
+
+
+def test_completion_keys_are_per_user(repos, queued_jobs):
+    asyncio.run(repos.activities.complete("u1", 1, idempotency_key="k1"))
+    other = asyncio.run(repos.activities.complete("u2", 2, idempotency_key="k1"))
+
+    assert other.recorded and not other.conflict
+
+
+def test_completions_without_key_all_count(repos, queued_jobs):
+    for _ in range(3):
+        assert asyncio.run(repos.activities.complete("u1", 1)).recorded
+
+    assert asyncio.run(repos.stats.get("u1"))["completions"] == 3
+
+
+def test_complete_route_answers_409_for_reused_key(repos, queued_jobs, pinned_catalog):
+    user = User(sub="u1")
+    asyncio.run(complete_activity(1, ActivityCompletion(activity_id=1), user, idempotency_key="k1"))
+
+    replay = asyncio.run(complete_activity(1, ActivityCompletion(activity_id=1), user, idempotency_key="k1"))
+    assert replay["message"] == "Activity completion already recorded"
+    assert replay["user_progress"]["total_completions"] == 1
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(complete_activity(2, ActivityCompletion(activity_id=2), user, idempotency_key="k1"))
+    assert error.value.status_code == 409
+
+
+def test_toggle_favorite_moves_counter(repos, queued_jobs):
+    assert asyncio.run(repos.activities.toggle_favorite("u1", 1)) is True
+    assert asyncio.run(repos.stats.get("u1"))["favorites"] == 1
+
+    assert asyncio.run(repos.activities.toggle_favorite("u1", 1)) is False
+    assert asyncio.run(repos.stats.get("u1"))["favorites"] == 0
+    assert recorded_events(queued_jobs) == [FAVORITE_TOGGLED, FAVORITE_TOGGLED]
+
+
+def test_set_favorites_reports_only_flipped(repos, queued_jobs):
+    asyncio.run(repos.activities.toggle_favorite("u1", 1))
+
+    flipped = asyncio.run(repos.activities.set_favorites("u1", [3, 1, 2, 2], True))
+    assert flipped == [2, 3]
+    assert asyncio.run(repos.stats.get("u1"))["favorites"] == 3
+
+    assert asyncio.run(repos.activities.set_favorites("u1", [1, 2, 3], True)) == []
+    assert asyncio.run(repos.activities.set_favorites("u1", [1, 4], False)) == [1]
+    assert asyncio.run(repos.stats.get("u1"))["favorites"] == 2
+
+
+def test_set_favorites_records_one_event_per_batch(repos, queued_jobs):
+    asyncio.run(repos.activities.set_favorites("u1", [1, 2, 3], True))
+    asyncio.run(repos.activities.set_favorites("u1", [1, 2, 3], True))
+
+    payloads = [payload for job_type, payload in queued_jobs if job_type == DELIVER_JOB]
+    assert len(payloads) == 1
+    assert payloads[0]["payload"] == {"activity_ids": [1, 2, 3], "is_favorite": True}
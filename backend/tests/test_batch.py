@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, Request
+
+from app.apis.batch import router as batch_router
+from app.auth import AuthorizedUser, User
+from databutton_app.mw.auth_mw import AUTHORIZED_USER_SCOPE_KEY
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(batch_router, prefix="/routes")
+
+    @app.get("/routes/whoami")
+    async def whoami(user: AuthorizedUser, request: Request):
+        return {"sub": user.sub, "authorization": request.headers.get("authorization")}
+
+    return app
+
+
+def call(app: FastAPI, user: User, body: dict):
+    """POST /routes/batch as the auth middleware would hand it on: with the user in the scope"""
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "server": ("test", 80),
+        "client": ("test", 1234),
+        "root_path": "",
+        "path": "/routes/batch",
+        "raw_path": b"/routes/batch",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        AUTHORIZED_USER_SCOPE_KEY: user,
+    }
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, json.loads(body)
+
+
+def test_sub_requests_run_as_the_batch_user():
+    status, body = call(create_app(), User(sub="batch-user"), {"requests": [
+        {"id": "plain", "path": "/routes/whoami"},
+        # A sub-request cannot switch users with its own credentials
+        {"id": "spoofed", "path": "/routes/whoami", "headers": {"Authorization": "Bearer someone-else"}},
+    ]})
+
+    assert status == 200
+    responses = {r["id"]: r for r in body["responses"]}
+    for response in responses.values():
+        assert response["status"] == 200
+        assert response["body"] == {"sub": "batch-user", "authorization": None}
+
+
+def test_batches_do_not_nest():
+    status, _ = call(create_app(), User(sub="batch-user"), {"requests": [{"path": "/routes/batch"}]})
+
+    assert status == 400
+
+
+def test_sub_request_failures_stay_in_their_response():
+    status, body = call(create_app(), User(sub="batch-user"), {"requests": [
+        {"id": "missing", "path": "/routes/nowhere"},
+        {"id": "ok", "path": "/routes/whoami"},
+    ]})
+
+    assert status == 200
+    assert [r["status"] for r in body["responses"]] == [404, 200]
@@ -0,0 +1,31 @@
+import pytest
+
+from app.libs.catalog import build_catalog, normalize_mood
+from tests.conftest import activity_row
+
+
+@pytest.mark.parametrize("tag, canonical", [
+    ("anxious", "anxious"),
+    ("  Anxiety ", "anxious"),
+    ("WORRIED", "anxious"),
+    ("Over-whelmed", "over whelmed"),
+    ("overwhelmed", "stressed"),
+    ("3", "neutral"),
+    ("5", "happy"),
+    ("calm", "calm"),
+    ("deeply_calm", "deeply calm"),
+])
+def test_normalize_mood(tag, canonical):
+    assert normalize_mood(tag) == canonical
+
+
+def test_for_mood_matches_synonyms_and_normalized_tags():
+    catalog = build_catalog(1, [
+        activity_row(1, moods=["Anxiety"]),
+        activity_row(2, moods=["stressed", "worried"]),
+        activity_row(3, moods=["happy"]),
+    ])
+
+    assert [a.id for a in catalog.for_mood("anxious")] == [a.id for a in catalog.for_mood(" Nervous ")]
+    assert {a.id for a in catalog.for_mood("anxious")} == {1, 2}
+    assert {a.id for a in catalog.for_mood("4")} == {3}
@@ -0,0 +1,33 @@
+import pytest
+
+from databutton_app.mw.compression_mw import negotiate, parse_accept_encoding
+
+AVAILABLE = ("br", "zstd", "gzip")
+
+
+@pytest.mark.parametrize("header, coding", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZip", "gzip"),
+    # Server preference decides between accepted codings, not the q-values
+    ("gzip, br", "br"),
+    ("gzip;q=1.0, br;q=0.1", "br"),
+    ("gzip;q=0.5, br;q=0", "gzip"),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("br;q=0, *", "zstd"),
+    ("gzip;q=oops", None),
+])
+def test_negotiate(header, coding):
+    assert negotiate(header, AVAILABLE) == coding
+
+
+def test_negotiate_only_offers_available_codings():
+    assert negotiate("br, zstd", ("gzip",)) is None
+    assert negotiate("br, gzip", ("gzip",)) == "gzip"
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding(" gzip ; q=0.8 ,br,, deflate;level=1;q=0") == {"gzip": 0.8, "br": 1.0, "deflate": 0.0}
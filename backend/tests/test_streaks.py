@@ -0,0 +1,72 @@
+from datetime import date, datetime, timezone
+
+from app.libs.streaks import DayBitmap, day_index
+
+
+def bitmap(*days: date, tz: str = "UTC") -> DayBitmap:
+    bits = 0
+    for day in days:
+        bits |= 1 << day_index(day)
+    return DayBitmap(bits=bits, timezone=tz)
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+# 2025-03-10 is a Monday
+SATURDAY, SUNDAY, MONDAY, TUESDAY = (date(2025, 3, d) for d in (8, 9, 10, 11))
+
+
+def test_current_streak_runs_across_week_boundary():
+    days = bitmap(SATURDAY, SUNDAY, MONDAY)
+
+    assert days.current_streak(utc(2025, 3, 10, 12)) == 3
+    # The week starts on Monday, so the weekend belongs to the week before
+    assert days.days_this_week(utc(2025, 3, 10, 12)) == 1
+    assert days.days_this_week(utc(2025, 3, 9, 12)) == 2
+
+
+def test_current_streak_counts_from_yesterday_while_today_is_open():
+    days = bitmap(SATURDAY, SUNDAY)
+
+    assert days.current_streak(utc(2025, 3, 10, 12)) == 2
+    assert days.current_streak(utc(2025, 3, 11, 12)) == 0
+
+
+def test_today_is_the_users_local_day():
+    # 12:00 UTC on Sunday is already 01:00 on Monday in Auckland
+    now = utc(2025, 3, 9, 12)
+
+    assert bitmap(MONDAY, tz="Pacific/Auckland").current_streak(now) == 1
+    assert bitmap(MONDAY, tz="Pacific/Auckland").days_this_week(now) == 1
+    assert bitmap(MONDAY, tz="UTC").current_streak(now) == 0
+
+
+def test_week_ends_on_the_users_local_sunday():
+    # 05:00 UTC on Monday is still 22:00 on Sunday in Los Angeles
+    now = utc(2025, 3, 10, 5)
+    days = bitmap(date(2025, 3, 3), SATURDAY, SUNDAY, tz="America/Los_Angeles")
+
+    assert days.days_this_week(now) == 3
+    assert days.current_streak(now) == 2
+    assert bitmap(SUNDAY, tz="UTC").days_this_week(now) == 0
+
+
+def test_longest_streak_finds_the_longest_run():
+    days = bitmap(
+        date(2025, 1, 1), date(2025, 1, 2),
+        *(date(2025, 2, d) for d in range(24, 29)), date(2025, 3, 1), date(2025, 3, 2),
+        TUESDAY,
+    )
+
+    assert days.longest_streak() == 7
+    assert DayBitmap().longest_streak() == 0
+
+
+def test_streaks_count_the_first_day_of_the_bitmap():
+    days = bitmap(date(2020, 1, 1), date(2020, 1, 2))
+
+    assert days.current_streak(utc(2020, 1, 2, 12)) == 2
+    assert days.longest_streak() == 2
+    assert not days.has_day(date(2019, 12, 31))
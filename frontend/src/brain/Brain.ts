@@ -1,5 +1,8 @@
 import {
   ActivityCompletion,
+  BatchData,
+  BatchError,
+  BatchRequest,
   ChatMessageRequest,
   CheckHealthData,
   ClearChatHistoryData,
@@ -19,6 +22,7 @@ import {
   GetActivityError,
   GetActivityParams,
   GetChatHistoryData,
+  GetDashboardData,
   GetJournalEntriesData,
   GetJournalEntryData,
   GetJournalEntryError,
@@ -253,6 +257,38 @@ export class Brain<SecurityDataType = unknown> extends HttpClient<SecurityDataTy
       ...params,
     });
 
+  /**
+   * @description Get progress, achievements and mood history in one call
+   *
+   * @tags dbtn/module:dashboard, dbtn/hasAuth
+   * @name get_dashboard
+   * @summary Get Dashboard
+   * @request GET:/routes/dashboard
+   */
+  get_dashboard = (params: RequestParams = {}) =>
+    this.request<GetDashboardData, any>({
+      path: `/routes/dashboard`,
+      method: "GET",
+      ...params,
+    });
+
+  /**
+   * @description Run several API calls in one round trip
+   *
+   * @tags dbtn/module:batch, dbtn/hasAuth
+   * @name batch
+   * @summary Batch
+   * @request POST:/routes/batch
+   */
+  batch = (data: BatchRequest, params: RequestParams = {}) =>
+    this.request<BatchData, BatchError>({
+      path: `/routes/batch`,
+      method: "POST",
+      body: data,
+      type: ContentType.Json,
+      ...params,
+    });
+
   /**
    * No description
    *
@@ -1,5 +1,7 @@
 import {
   ActivityCompletion,
+  BatchData,
+  BatchRequest,
   ChatMessageRequest,
   CheckHealthData,
   ClearChatHistoryData,
@@ -10,6 +12,7 @@ import {
   GetActivitiesData,
   GetActivityData,
   GetChatHistoryData,
+  GetDashboardData,
   GetJournalEntriesData,
   GetJournalEntryData,
   GetMoodHistoryData,
@@ -235,6 +238,36 @@ export namespace Brain {
     export type ResponseBody = GetUserProgressData;
   }
 
+  /**
+   * @description Get progress, achievements and mood history in one call
+   * @tags dbtn/module:dashboard, dbtn/hasAuth
+   * @name get_dashboard
+   * @summary Get Dashboard
+   * @request GET:/routes/dashboard
+   */
+  export namespace get_dashboard {
+    export type RequestParams = {};
+    export type RequestQuery = {};
+    export type RequestBody = never;
+    export type RequestHeaders = {};
+    export type ResponseBody = GetDashboardData;
+  }
+
+  /**
+   * @description Run several API calls in one round trip
+   * @tags dbtn/module:batch, dbtn/hasAuth
+   * @name batch
+   * @summary Batch
+   * @request POST:/routes/batch
+   */
+  export namespace batch {
+    export type RequestParams = {};
+    export type RequestQuery = {};
+    export type RequestBody = BatchRequest;
+    export type RequestHeaders = {};
+    export type ResponseBody = BatchData;
+  }
+
   /**
    * No description
    * @tags dbtn/module:journal, dbtn/hasAuth
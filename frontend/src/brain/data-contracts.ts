@@ -58,6 +58,25 @@ export interface ActivityCompletion {
   rating?: number | null;
   /** Notes */
   notes?: string | null;
+  /** Timezone */
+  timezone?: string | null;
+}
+
+/** BatchRequest */
+export interface BatchRequest {
+  /** Requests */
+  requests: SubRequest[];
+  /**
+   * Sequential
+   * @default false
+   */
+  sequential?: boolean;
+}
+
+/** BatchResponse */
+export interface BatchResponse {
+  /** Responses */
+  responses: SubResponse[];
 }
 
 /** ChatHistoryResponse */
@@ -181,6 +200,35 @@ export interface SelfCareActivity {
   user_progress?: Record<string, any> | null;
 }
 
+/** SubRequest */
+export interface SubRequest {
+  /** Id */
+  id?: string | null;
+  /**
+   * Method
+   * @default "GET"
+   */
+  method?: "GET" | "POST" | "PUT" | "PATCH" | "DELETE";
+  /** Path */
+  path: string;
+  /** Body */
+  body?: any | null;
+  /** Headers */
+  headers?: Record<string, string>;
+}
+
+/** SubResponse */
+export interface SubResponse {
+  /** Id */
+  id?: string | null;
+  /** Status */
+  status: number;
+  /** Headers */
+  headers: Record<string, string>;
+  /** Body */
+  body?: any | null;
+}
+
 /** ValidationError */
 export interface ValidationError {
   /** Location */
@@ -296,6 +344,12 @@ export type GetMoodRecommendationsError = HTTPValidationError;
 
 export type GetUserProgressData = any;
 
+export type GetDashboardData = any;
+
+export type BatchData = BatchResponse;
+
+export type BatchError = HTTPValidationError;
+
 /** Response Get Journal Entries */
 export type GetJournalEntriesData = JournalEntry[];
 
@@ -117,19 +117,12 @@ const Progress = () => {
   const loadProgressData = async () => {
     try {
       setLoading(true);
-      const [progressResponse, achievementsResponse, moodResponse] = await Promise.all([
-        brain.get_user_progress(),
-        brain.get_achievements(),
-        brain.get_mood_history()
-      ]);
+      const response = await brain.get_dashboard();
+      const data = await response.json();
       
-      const progressData = await progressResponse.json();
-      const achievementsData = await achievementsResponse.json();
-      const moodData = await moodResponse.json();
-      
-      setStats(progressData);
-      setAchievements(achievementsData);
-      setMoodHistory(Array.isArray(moodData) ? moodData : []);
+      setStats(data.progress);
+      setAchievements(data.achievements);
+      setMoodHistory(Array.isArray(data.mood_history) ? data.mood_history : []);
     } catch (error) {
       console.error('Failed to load progress data:', error);
       toast.error('Failed to load progress data');
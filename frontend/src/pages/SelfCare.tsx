@@ -58,9 +58,22 @@ function SelfCareInternal() {
 
   const toggleFavorite = async (activityId: number) => {
     try {
-      await brain.toggle_favorite({ activityId });
-      // Refresh activities to get updated favorite status
-      fetchActivities();
+      // Toggle and refresh the list in one round trip; the batch runs in order
+      const response = await brain.batch({
+        sequential: true,
+        requests: [
+          { method: 'POST', path: `/routes/activities/${activityId}/favorite` },
+          { method: 'GET', path: '/routes/activities' },
+        ],
+      });
+      const { responses } = await response.json();
+      const [toggled, refreshed] = responses;
+      if (toggled.status !== 200) {
+        throw new Error(toggled.body?.detail || 'Failed to update favorite');
+      }
+      if (refreshed.status === 200) {
+        setActivities(refreshed.body.activities || []);
+      }
       toast.success('Favorite updated!');
     } catch (error) {
       console.error('Error toggling favorite:', error);
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useSearchParams, useNavigate } from 'react-router-dom';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
@@ -30,6 +30,8 @@ const SelfCareActivity = () => {
   const [isTimerRunning, setIsTimerRunning] = useState(false);
   const [timeRemaining, setTimeRemaining] = useState(0);
   const [isCompleted, setIsCompleted] = useState(false);
+  // Reused when a failed completion is retried so it is only recorded once
+  const completionKeyRef = useRef<string | null>(null);
   const [rating, setRating] = useState(0);
   const [notes, setNotes] = useState('');
   const [showCompletion, setShowCompletion] = useState(false);
@@ -102,15 +104,25 @@ const SelfCareActivity = () => {
   const completeActivity = async () => {
     if (!activity) return;
     
+    completionKeyRef.current ??= crypto.randomUUID();
+    
     try {
-      await brain.complete_activity(
+      const response = await brain.complete_activity(
         { activityId: activity.id },
         { 
           activity_id: activity.id,
           rating: rating > 0 ? rating : undefined,
-          notes: notes.trim() || undefined
-        }
+          notes: notes.trim() || undefined,
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
+        },
+        { headers: { 'Idempotency-Key': completionKeyRef.current } }
       );
+      const data = await response.json();
+      completionKeyRef.current = null;
+      setActivity({
+        ...activity,
+        user_progress: data.user_progress ?? activity.user_progress
+      });
       setIsCompleted(true);
       toast.success('Activity completed and logged! 🌟');
     } catch (error) {